@@ -0,0 +1,108 @@
+"""Per-operation latency of utils.db_utils before and after connection pooling.
+
+"before" reproduces the original connect/execute/commit/close pattern with
+OFFSET row addressing, "after" uses the pooled WAL connection manager and
+row-id addressing. Run from the repository
+root with ``python -m benchmarks.bench_db [--rows N]``.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from utils import db_utils
+from utils.portfolio import Lot
+
+def _stock(i):
+    return Lot(f'SYM{i % 500}', 10, 100.0, 101.0, datetime.now().isoformat())
+
+def _legacy_save(lot):
+    conn = sqlite3.connect(db_utils.get_db_path())
+    conn.execute(
+        'INSERT INTO stocks (symbol, quantity, purchase_price, current_price, date_added) '
+        'VALUES (?, ?, ?, ?, ?)',
+        (lot.symbol, lot.quantity, lot.purchase_price, lot.current_price, lot.date_added))
+    conn.commit()
+    conn.close()
+
+def _legacy_load():
+    conn = sqlite3.connect(db_utils.get_db_path())
+    rows = conn.execute(
+        'SELECT symbol, quantity, purchase_price, current_price, date_added FROM stocks').fetchall()
+    conn.close()
+    return [{'symbol': r[0], 'quantity': r[1], 'purchase_price': r[2],
+             'current_price': r[3], 'date_added': r[4]} for r in rows]
+
+def _legacy_update(price, index):
+    conn = sqlite3.connect(db_utils.get_db_path())
+    stock_id = conn.execute('SELECT id FROM stocks LIMIT 1 OFFSET ?', (index,)).fetchone()[0]
+    conn.execute('UPDATE stocks SET current_price = ? WHERE id = ?', (price, stock_id))
+    conn.commit()
+    conn.close()
+
+def _legacy_remove(index):
+    conn = sqlite3.connect(db_utils.get_db_path())
+    stock_id = conn.execute('SELECT id FROM stocks LIMIT 1 OFFSET ?', (index,)).fetchone()[0]
+    conn.execute('DELETE FROM stocks WHERE id = ?', (stock_id,))
+    conn.commit()
+    conn.close()
+
+def _time_per_op(func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+def run_variant(name, rows, ops):
+    """Time each operation against a fresh database and return µs/op figures."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            db_utils.init_db()
+            if name == 'before':
+                # The original schema used the default rollback journal
+                db_utils.close_connections()
+                conn = sqlite3.connect(db_utils.get_db_path())
+                conn.execute('PRAGMA journal_mode=DELETE')
+                conn.close()
+                save, load, update, remove = (_legacy_save, _legacy_load,
+                                              _legacy_update, _legacy_remove)
+            else:
+                save = db_utils.save_stock
+                load = db_utils.load_stocks
+                update = db_utils.update_stock
+                remove = db_utils.remove_stock
+
+            results = {'save_stock': _time_per_op(lambda i: save(_stock(i)), rows)}
+            results['load_stocks'] = _time_per_op(lambda i: load(), max(1, ops // 10))
+            if name == 'before':
+                results['update_stock'] = _time_per_op(lambda i: update(102.0, i % rows), ops)
+                results['remove_stock'] = _time_per_op(lambda i: remove(0), min(ops, rows))
+            else:
+                lots = list(load())
+                ids = [lot.id for lot in lots]
+                results['update_stock'] = _time_per_op(
+                    lambda i: update(lots[i % rows].replace(current_price=102.0)), ops)
+                results['remove_stock'] = _time_per_op(lambda i: remove(ids[i]), min(ops, rows))
+        finally:
+            db_utils.close_connections()
+            os.chdir(cwd)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000, help='rows inserted before timing reads')
+    parser.add_argument('--ops', type=int, default=500, help='update/remove calls to time')
+    args = parser.parse_args(argv)
+
+    before = run_variant('before', args.rows, args.ops)
+    after = run_variant('after', args.rows, args.ops)
+    print(f"{'operation':<14}{'before µs':>12}{'after µs':>12}{'speedup':>10}")
+    for op in before:
+        print(f"{op:<14}{before[op]:>12.1f}{after[op]:>12.1f}{before[op] / after[op]:>9.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Startup time: importing the app and showing the first window.
+
+Each run starts a fresh interpreter against a temporary database, so
+module caches from earlier runs do not hide import costs. It also reports
+which heavy network/parsing modules were loaded before the first paint;
+that list should stay empty. Run from the repository root with
+``python -m benchmarks.bench_startup [--runs N]``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+HEAVY_MODULES = ('yfinance', 'pandas', 'requests')
+
+_PROBE = '''
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+os.chdir({workdir!r})
+from PySide6.QtWidgets import QApplication
+import stock_portfolio_app
+imported = time.perf_counter()
+app = QApplication([])
+window = stock_portfolio_app.StockPortfolioApp()
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+print(json.dumps({{
+    'import_s': imported - start,
+    'first_window_s': shown - start,
+    'heavy_modules': [m for m in {heavy!r} if m in sys.modules],
+}}))
+'''
+
+def run_once(workdir):
+    """Start a fresh interpreter, show the main window and return its timings."""
+    root = str(Path(__file__).resolve().parent.parent)
+    code = _PROBE.format(root=root, workdir=workdir, heavy=HEAVY_MODULES)
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        runs = [run_once(workdir) for _ in range(args.runs)]
+
+    summary = {
+        'runs': args.runs,
+        'import_s': statistics.median(r['import_s'] for r in runs),
+        'first_window_s': statistics.median(r['first_window_s'] for r in runs),
+        'heavy_modules': sorted({m for r in runs for m in r['heavy_modules']}),
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"import (median):       {summary['import_s'] * 1000:.0f} ms")
+        print(f"first window (median): {summary['first_window_s'] * 1000:.0f} ms")
+        print(f"heavy modules loaded:  {', '.join(summary['heavy_modules']) or 'none'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Benchmark suite over synthetic portfolios of several sizes.
+
+For each size it times:
+
+* load_stocks, and per-call save_stock / update_stock / remove_stock
+* a full refresh against a local FakeQuoteProvider with simulated latency
+* rendering the portfolio table offscreen and streaming price updates into it
+* StockSelectorDialog.filter_stocks per keystroke over a universe of that size
+
+Results are written as JSON so runs can be compared over time. Run from the
+repository root with ``python -m benchmarks.suite [--sizes 1000 10000 100000]
+[--output results.json]``.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.synthetic import generate_portfolio, generate_universe
+from utils import db_utils
+from utils.quote_cache import QuoteCache
+from utils.quote_provider import FakeQuoteProvider
+from utils.refresh_engine import RefreshEngine
+from utils.resilience import ok_prices
+
+SEARCH_QUERY = 'global hold'
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+def _per_call(func, args_list):
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return {'mean_ms': _ms(statistics.mean(timings)), 'max_ms': _ms(max(timings)), 'calls': len(timings)}
+
+def bench_db(portfolio, ops):
+    db_utils.save_stocks_many(portfolio)
+    results = {}
+
+    start = time.perf_counter()
+    stocks = db_utils.load_stocks()
+    results['load_stocks_ms'] = _ms(time.perf_counter() - start)
+
+    lots = stocks[:ops]
+    results['save_stock'] = _per_call(db_utils.save_stock, [(portfolio[i].replace(),) for i in range(ops)])
+    results['update_stock'] = _per_call(
+        db_utils.update_stock, [(lot.replace(current_price=1.0),) for lot in lots])
+    results['remove_stock'] = _per_call(db_utils.remove_stock, [(lot.id,) for lot in lots])
+    return results
+
+def bench_refresh(portfolio, latency, concurrency, rps, batch_size):
+    provider = FakeQuoteProvider(latency=latency)
+    engine = RefreshEngine(cache=QuoteCache(provider=provider), max_concurrent=concurrency,
+                           requests_per_second=rps, batch_size=batch_size)
+    symbols = [lot.symbol for lot in portfolio]
+
+    start = time.perf_counter()
+    prices = ok_prices(engine.refresh(symbols))
+    fetched = time.perf_counter()
+    db_utils.update_prices_many(prices)
+    written = time.perf_counter()
+    return {
+        'symbols': len(prices),
+        'requests': provider.calls,
+        'fetch_ms': _ms(fetched - start),
+        'write_ms': _ms(written - fetched),
+        'total_ms': _ms(written - start),
+    }
+
+def bench_table(app, portfolio, updates):
+    from PySide6.QtWidgets import QTableView
+    from models.portfolio_table_model import PortfolioTableModel
+
+    view = QTableView()
+    view.resize(1000, 800)
+    view.show()
+    start = time.perf_counter()
+    model = PortfolioTableModel(portfolio)
+    view.setModel(model)
+    app.processEvents()
+    results = {'initial_render_ms': _ms(time.perf_counter() - start)}
+
+    symbols = portfolio.symbols()[:updates]
+    timings = []
+    for i, symbol in enumerate(symbols):
+        start = time.perf_counter()
+        model.update_prices({symbol: 100.0 + i})
+        app.processEvents()
+        timings.append(time.perf_counter() - start)
+    results['price_update'] = {'mean_ms': _ms(statistics.mean(timings)),
+                               'max_ms': _ms(max(timings)), 'calls': len(timings)}
+    view.close()
+    return results
+
+def bench_filter(app, universe):
+    from utils.symbol_universe import SP500_UNIVERSE, save_universe
+    from dialogs.stock_selector_dialog import StockSelectorDialog
+
+    save_universe(SP500_UNIVERSE, universe)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        dialog = StockSelectorDialog()
+        opened = time.perf_counter()
+        timings = []
+        for end in range(1, len(SEARCH_QUERY) + 1):
+            start_key = time.perf_counter()
+            dialog.filter_stocks(SEARCH_QUERY[:end])
+            app.processEvents()
+            timings.append(time.perf_counter() - start_key)
+        dialog.close()
+    return {
+        'open_ms': _ms(opened - start),
+        'keystroke': {'mean_ms': _ms(statistics.mean(timings)), 'max_ms': _ms(max(timings)),
+                      'calls': len(timings)},
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(sizes, ops=200, latency=0.05, concurrency=8, rps=0, batch_size=50, ui=True):
+    app = None
+    if ui:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PySide6.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication([])
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'fake_latency_s': latency,
+            'concurrency': concurrency,
+            'requests_per_second': rps,
+            'batch_size': batch_size,
+        },
+        'results': {},
+    }
+    for size in sizes:
+        portfolio = generate_portfolio(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_utils.set_db_path(Path(tmp) / 'bench.db')
+            try:
+                db_utils.init_db()
+                results = {'db': bench_db(portfolio, min(ops, size))}
+                results['refresh'] = bench_refresh(portfolio, latency, concurrency, rps, batch_size)
+                if app is not None:
+                    results['table'] = bench_table(app, portfolio, min(ops, size))
+                    results['filter'] = bench_filter(app, generate_universe(size))
+            finally:
+                db_utils.close_connections()
+                db_utils.set_db_path(None)
+        report['results'][str(size)] = results
+        print(f"{size} rows done", file=sys.stderr)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--ops', type=int, default=200, help='calls timed per single-row operation')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake provider latency per request (s)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rps', type=float, default=0, help='request rate limit (0 = unlimited)')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--no-ui', dest='ui', action='store_false', help='skip the Qt benchmarks')
+    parser.add_argument('-o', '--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.sizes, ops=args.ops, latency=args.latency, concurrency=args.concurrency,
+                       rps=args.rps, batch_size=args.batch_size, ui=args.ui)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Deterministic synthetic portfolios and symbol universes for benchmarks."""
+import random
+import string
+from datetime import datetime, timedelta
+
+from utils.portfolio import Lot, Portfolio
+
+_WORDS = ['Global', 'American', 'United', 'First', 'Pacific', 'Digital', 'Energy', 'Health',
+          'Financial', 'Systems', 'Technologies', 'Industries', 'Holdings', 'Capital',
+          'Resources', 'Networks', 'Medical', 'Motors', 'Foods', 'Pharmaceuticals']
+_SUFFIXES = ['Inc.', 'Corp.', 'Corporation', 'Group', 'plc', 'Co.', 'Ltd.']
+
+def generate_symbols(count, seed=0):
+    """Return count distinct ticker-like symbols (1-5 upper-case letters)."""
+    rng = random.Random(seed)
+    symbols = set()
+    while len(symbols) < count:
+        symbols.add(''.join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 5))))
+    return sorted(symbols)
+
+def generate_universe(count, seed=0):
+    """Return [(symbol, company name), ...] with count entries."""
+    rng = random.Random(seed)
+    return [(symbol, f"{' '.join(rng.sample(_WORDS, 2))} {rng.choice(_SUFFIXES)}")
+            for symbol in generate_symbols(count, seed)]
+
+def generate_portfolio(count, symbol_count=None, seed=0):
+    """Return a Portfolio of count unsaved Lots over symbol_count symbols (default count // 10)."""
+    rng = random.Random(seed)
+    symbols = generate_symbols(symbol_count or max(1, count // 10), seed)
+    start = datetime(2020, 1, 1)
+    portfolio = Portfolio()
+    for i in range(count):
+        purchase_price = round(rng.uniform(5, 500), 2)
+        portfolio.append(Lot(
+            symbol=rng.choice(symbols),
+            quantity=rng.randint(1, 1000),
+            purchase_price=purchase_price,
+            current_price=round(purchase_price * rng.uniform(0.5, 2.0), 2),
+            date_added=(start + timedelta(minutes=i)).isoformat(),
+        ))
+    return portfolio
@@ -0,0 +1,289 @@
+"""Headless command-line interface for scheduled refreshes and reporting.
+
+Examples::
+
+    portfolio --db /srv/portfolio.db refresh --concurrency 8
+    portfolio --db /srv/portfolio.db report --format json > holdings.jsonl
+    portfolio --db /srv/portfolio.db import broker-positions.csv
+    portfolio --db /srv/portfolio.db report -o holdings.parquet
+    portfolio --metrics refresh.prom refresh
+    portfolio record buy AAPL --quantity 10 --price 187.5 --fees 1
+    portfolio positions --format json
+    portfolio backfill --years 10
+    portfolio history --start 2024-01-01 --base EUR
+    portfolio universe import nasdaq-listed.txt --name nasdaq
+
+This module never imports PySide6, so it runs on servers without a display.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from utils.db_utils import (set_db_path, init_db, load_stocks, load_symbols,
+                            load_symbols_without_currency, update_prices_many, close_connections)
+from utils import instrumentation
+from utils.analytics import PortfolioAnalytics
+from utils.fx import get_base_currency, get_fx_rates, resolve_currencies
+from utils.ohlc_store import DEFAULT_HISTORY_DAYS, backfill, load_closes
+from utils.ledger import POSITION_FIELDS, record_transaction, load_positions
+from utils.price_history import append_prices
+from utils.refresh_engine import RefreshEngine
+from utils.resilience import CIRCUIT_OPEN, NOT_FOUND, UNAVAILABLE, failures_by_status, ok_prices
+from utils.statement_io import export_holdings, import_statement, report_rows, write_csv
+from utils.symbol_universe import import_universe_csv, list_universes
+
+def refresh_prices(symbols, concurrency=4, requests_per_second=4.0, batch_size=50):
+    """Fetch fresh prices for symbols and store them.
+
+    Returns {symbol: PriceResult} for every symbol that was fetched.
+    Symbols whose currency is not stored yet have it looked up too.
+    """
+    engine = RefreshEngine(max_concurrent=concurrency, requests_per_second=requests_per_second,
+                           batch_size=batch_size)
+    results = engine.refresh(symbols)
+    prices = ok_prices(results)
+    if prices:
+        update_prices_many(prices)
+        append_prices(prices)
+    unresolved = set(load_symbols_without_currency()) & set(prices)
+    if unresolved:
+        resolve_currencies(sorted(unresolved))
+    return results
+
+# How each failure status is reported by `refresh`
+FAILURE_LABELS = {
+    NOT_FOUND: "No price data for",
+    UNAVAILABLE: "Fetch failed for",
+    CIRCUIT_OPEN: "Not fetched (provider failing) for",
+}
+
+def report_failures(results):
+    """Print the symbols without a price, grouped by why, to stderr."""
+    for status, symbols in failures_by_status(results).items():
+        label = FAILURE_LABELS.get(status, status)
+        errors = {results[s].error for s in symbols if status != NOT_FOUND} - {None}
+        detail = f" ({'; '.join(sorted(errors))})" if errors else ""
+        print(f"{label}: {', '.join(symbols)}{detail}", file=sys.stderr)
+
+def cmd_refresh(args):
+    symbols = load_symbols()
+    start = time.perf_counter()
+    results = refresh_prices(symbols, concurrency=args.concurrency,
+                             requests_per_second=args.rps, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    prices = ok_prices(results)
+    print(f"Refreshed {len(prices)} of {len(symbols)} symbols in {elapsed:.1f}s", file=sys.stderr)
+    report_failures(results)
+    return 0 if len(prices) == len(symbols) else 1
+
+def cmd_report(args):
+    if args.output and args.format != 'json':
+        # CSV or Parquet, by default from the file extension
+        try:
+            count = export_holdings(args.output, format=args.format)
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+        print(f"Wrote {count} lots to {args.output}", file=sys.stderr)
+        return 0
+    if args.format == 'parquet':
+        print("Error: --format parquet needs --output", file=sys.stderr)
+        return 2
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format != 'json':
+            write_csv(out)
+        else:
+            # JSON Lines, so consumers can stream large portfolios too
+            for row in report_rows():
+                out.write(json.dumps(row) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+def cmd_import(args):
+    try:
+        count, symbols = import_statement(args.file)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(f"Imported {count} lots ({len(symbols)} symbols) from {args.file}", file=sys.stderr)
+    if args.refresh and symbols:
+        # One deduplicated refresh for the imported symbols, not one per row
+        results = refresh_prices(symbols)
+        print(f"Refreshed {len(ok_prices(results))} of {len(symbols)} symbols", file=sys.stderr)
+        report_failures(results)
+    return 0
+
+def cmd_record(args):
+    txn = {'symbol': args.symbol, 'kind': args.kind, 'quantity': args.quantity,
+           'price': args.price, 'amount': args.amount, 'ratio': args.ratio, 'fees': args.fees}
+    if args.date:
+        txn['date'] = args.date
+    try:
+        position = record_transaction(txn)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(f"{position['symbol']}: {position['quantity']:g} shares, "
+          f"average cost {position['average_cost']:.2f}, "
+          f"realized P&L {position['realized_pnl']:.2f} (FIFO {position['fifo_realized_pnl']:.2f})",
+          file=sys.stderr)
+    return 0
+
+def cmd_positions(args):
+    fields = list(POSITION_FIELDS[:-1]) + ['average_cost']
+    positions = load_positions(include_closed=args.all)
+    if args.format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(positions)
+    else:
+        for position in positions:
+            sys.stdout.write(json.dumps({field: position[field] for field in fields}) + '\n')
+    return 0
+
+def cmd_backfill(args):
+    symbols = load_symbols()
+    if args.start:
+        start = date.fromisoformat(args.start)
+    else:
+        start = date.today() - timedelta(days=int(args.years * 365))
+    started = time.perf_counter()
+    stored = backfill(symbols, start=start)
+    elapsed = time.perf_counter() - started
+    print(f"Updated history for {len(stored)} of {len(symbols)} symbols in {elapsed:.1f}s",
+          file=sys.stderr)
+    return 0
+
+def cmd_history(args):
+    analytics = PortfolioAnalytics(load_stocks())
+    base = (args.base or get_base_currency()).upper()
+    analytics.set_rates(get_fx_rates().get_rates(analytics.currencies, base), base)
+    if analytics.unconverted:
+        print(f"Not included, no exchange rate: {', '.join(map(str, analytics.unconverted))}",
+              file=sys.stderr)
+    closes = load_closes(analytics.symbols, args.start, args.end, include_recent=True)
+    missing = sorted(set(analytics.symbols) - set(closes))
+    if missing:
+        print(f"No history for: {', '.join(missing)} (run backfill)", file=sys.stderr)
+    dates, values = analytics.value_history(closes)
+    if args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['date', f'value_{base.lower()}'])
+        writer.writerows((str(day), round(float(value), 2)) for day, value in zip(dates, values))
+    else:
+        for day, value in zip(dates, values):
+            sys.stdout.write(json.dumps({'date': str(day), 'value': round(float(value), 2),
+                                         'currency': base}) + '\n')
+    return 0
+
+def cmd_universe_import(args):
+    name = args.name or Path(args.file).stem.lower()
+    try:
+        count = import_universe_csv(name, args.file, symbol_column=args.symbol_column,
+                                    name_column=args.name_column)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(f"Imported {count} symbols into universe '{name}'", file=sys.stderr)
+    return 0
+
+def cmd_universe_list(args):
+    for name, source, refreshed_at, count in list_universes():
+        refreshed = datetime.fromtimestamp(refreshed_at).strftime('%Y-%m-%d %H:%M')
+        print(f"{name}\t{count} symbols\trefreshed {refreshed}\t{source or ''}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='portfolio', description='Stock portfolio manager (headless)')
+    parser.add_argument('--db', help='path to the portfolio database (default: $PORTFOLIO_DB or portfolio.db)')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='collect timings and write them to FILE when done '
+                             '(JSON if it ends in .json, else Prometheus text)')
+    parser.add_argument('--log-level', help='logging level (default: $PORTFOLIO_LOG_LEVEL or WARNING)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    refresh = commands.add_parser('refresh', help='fetch current prices for every holding')
+    refresh.add_argument('--concurrency', type=int, default=4, help='maximum concurrent requests')
+    refresh.add_argument('--rps', type=float, default=4.0, help='maximum requests started per second')
+    refresh.add_argument('--batch-size', type=int, default=50, help='symbols per request')
+    refresh.set_defaults(func=cmd_refresh)
+
+    report = commands.add_parser('report', help='stream holdings as CSV, JSON Lines or Parquet')
+    report.add_argument('--format', choices=['csv', 'json', 'parquet'],
+                        help='default: parquet for a .parquet or .pq --output, else csv; '
+                             'parquet needs pyarrow and --output')
+    report.add_argument('-o', '--output', help='write to a file instead of stdout')
+    report.set_defaults(func=cmd_report)
+
+    imp = commands.add_parser('import', help='import holdings from a broker positions CSV')
+    imp.add_argument('file')
+    imp.add_argument('--no-refresh', dest='refresh', action='store_false',
+                     help='do not fetch prices after importing')
+    imp.set_defaults(func=cmd_import)
+
+    record = commands.add_parser('record', help='record a transaction in the ledger')
+    record.add_argument('kind', choices=['buy', 'sell', 'dividend', 'split'])
+    record.add_argument('symbol')
+    record.add_argument('--quantity', type=float, default=0.0, help='shares bought or sold')
+    record.add_argument('--price', type=float, default=0.0, help='price per share')
+    record.add_argument('--amount', type=float, default=0.0, help='total dividend received')
+    record.add_argument('--ratio', type=float, default=1.0, help='new shares per old share for a split')
+    record.add_argument('--fees', type=float, default=0.0)
+    record.add_argument('--date', help='ISO date (default: now)')
+    record.set_defaults(func=cmd_record)
+
+    positions = commands.add_parser('positions', help='list positions maintained from the ledger')
+    positions.add_argument('--format', choices=['csv', 'json'], default='csv')
+    positions.add_argument('--all', action='store_true', help='include closed positions')
+    positions.set_defaults(func=cmd_positions)
+
+    history = commands.add_parser('backfill', help='download missing daily history for every holding')
+    history.add_argument('--years', type=float, default=DEFAULT_HISTORY_DAYS / 365,
+                         help='how far back to fetch (default: %(default)g)')
+    history.add_argument('--start', help='ISO start date (overrides --years)')
+    history.set_defaults(func=cmd_backfill)
+
+    value = commands.add_parser('history', help="value today's holdings at each stored daily close")
+    value.add_argument('--start', help='ISO start date (default: all stored history)')
+    value.add_argument('--end', help='ISO end date (default: the latest close)')
+    value.add_argument('--base', help='currency to value in (default: $PORTFOLIO_BASE_CURRENCY or USD)')
+    value.add_argument('--format', choices=['csv', 'json'], default='csv')
+    value.set_defaults(func=cmd_history)
+
+    universe = commands.add_parser('universe', help='manage the symbol lists offered by the stock selector')
+    universe_commands = universe.add_subparsers(dest='universe_command', required=True)
+    universe_import = universe_commands.add_parser(
+        'import', help='import a listing file (CSV, or pipe/tab separated) as a universe')
+    universe_import.add_argument('file')
+    universe_import.add_argument('--name', help='universe name (default: the file name without extension)')
+    universe_import.add_argument('--symbol-column', default='Symbol')
+    universe_import.add_argument('--name-column', help='company name column (default: detected)')
+    universe_import.set_defaults(func=cmd_universe_import)
+    universe_list = universe_commands.add_parser('list', help='list the cached universes')
+    universe_list.set_defaults(func=cmd_universe_list)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    instrumentation.configure_logging(args.log_level)
+    if args.metrics:
+        instrumentation.enable()
+    if args.db:
+        set_db_path(args.db)
+    init_db()
+    try:
+        return args.func(args)
+    finally:
+        close_connections()
+        if args.metrics:
+            instrumentation.export_metrics(args.metrics)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,25 @@
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout,
                              QLabel, QPushButton, QLineEdit, QMessageBox)
-from PySide6.QtCore import QTimer, Qt
+from PySide6.QtCore import Qt
 from datetime import datetime
-import yfinance as yf
+import logging
+import time
+from utils.portfolio import Lot
+from utils.quote_cache import get_quote_cache
+from dialogs.quote_lookup import QuoteLookup, failure_message
 from dialogs.stock_selector_dialog import StockSelectorDialog
 
+logger = logging.getLogger(__name__)
+
 class AddStockDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Add Stock")
+        self.price_fetched_at = None
+        self.price_currency = None
+        self.quote_lookup = QuoteLookup(self)
+        self.quote_lookup.quote_ready.connect(self._on_quote_ready)
+        self.quote_lookup.quote_failed.connect(self._on_quote_failed)
         self.setup_ui()
     
     def setup_ui(self):
@@ -47,72 +58,82 @@ class AddStockDialog(QDialog):
         layout.addWidget(self.status_label)
         
         button_layout = QHBoxLayout()
-        ok_button = QPushButton("OK")
+        self.ok_button = QPushButton("OK")
+        self.ok_button.setEnabled(False)  # Enabled once a current price is known
         cancel_button = QPushButton("Cancel")
-        button_layout.addWidget(ok_button)
+        button_layout.addWidget(self.ok_button)
         button_layout.addWidget(cancel_button)
         layout.addLayout(button_layout)
         
-        ok_button.clicked.connect(self.accept)
+        self.current_price_input.textChanged.connect(
+            lambda text: self.ok_button.setEnabled(bool(text)))
+        self.ok_button.clicked.connect(self.accept)
         cancel_button.clicked.connect(self.reject)
 
     def select_stock(self):
         dialog = StockSelectorDialog(self)
         if dialog.exec():
             selected_symbol = dialog.get_selected_symbol()
-            print(f"Symbol selected from dialog: {selected_symbol}")  # Debug print
+            logger.debug("Symbol selected from dialog: %s", selected_symbol)
             if selected_symbol:
                 self.symbol_input.setText(selected_symbol)
-                print(f"Setting symbol input to: {selected_symbol}")  # Debug print
-                QTimer.singleShot(100, self.fetch_current_price)  # Fetch price immediately after selection
+                self.fetch_current_price()
 
     def fetch_current_price(self):
         symbol = self.symbol_input.text().strip().upper()
-        print(f"Fetching price for symbol: {symbol}")  # Debug print
+        logger.debug("Fetching price for symbol: %s", symbol)
         if not symbol:
+            self.quote_lookup.cancel()
             self.current_price_input.clear()
             return
         
-        try:
-            stock = yf.Ticker(symbol)
-            info = stock.info
-            print(f"Got info for {symbol}: {info.keys()}")  # Debug print
-            
-            # Try different possible price keys
-            price = None
-            for price_key in ['currentPrice', 'regularMarketPrice', 'price', 'previousClose']:
-                if price_key in info and info[price_key] is not None:
-                    price = info[price_key]
-                    break
-            
-            if price is None:
-                self.current_price_input.clear()
-                self.status_label.setText(f"Could not fetch price for {symbol}")
-                self.status_label.setStyleSheet("QLabel { color: red; }")
-                return
-                
-            self.current_price_input.setText(str(price))
-            
-            # Update status label with success message
-            company_name = info.get('longName', symbol)
-            currency = info.get('currency', 'USD')
-            market_state = info.get('marketState', 'Unknown')
-            
-            self.status_label.setText(f"Current price: {currency} {price:.2f} ({market_state})")
-            self.status_label.setStyleSheet("QLabel { color: green; }")
-            
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Error fetching price: {error_msg}")  # Debug print
+        # Show the last known price straight away while a fresh one loads
+        self.price_fetched_at = None
+        self.price_currency = None
+        cache = get_quote_cache()
+        cached = cache.peek(symbol)
+        if cached is not None:
+            self.current_price_input.setText(str(cached))
+            self.price_fetched_at = cache.fetched_at(symbol)
+            self.status_label.setText(f"Cached price: {cached:.2f} (fetching latest...)")
+        else:
             self.current_price_input.clear()
-            self.status_label.setText(f"Error: {error_msg}")
-            self.status_label.setStyleSheet("QLabel { color: red; }")
+            self.status_label.setText(f"Fetching price for {symbol}...")
+        self.status_label.setStyleSheet("QLabel { color: gray; }")
+        self.quote_lookup.request(symbol)
+    
+    def _on_quote_ready(self, quote):
+        logger.debug("Got quote for %s: %s", quote['symbol'], quote)
+        price = quote['price']
+        self.current_price_input.setText(str(price))
+        self.price_fetched_at = quote.get('fetched_at') or time.time()
+        
+        # Update status label with success message
+        currency = self.price_currency = quote['currency']
+        market_state = quote['market_state']
+        
+        self.status_label.setText(f"Current price: {currency} {price:.2f} ({market_state})")
+        self.status_label.setStyleSheet("QLabel { color: green; }")
+    
+    def _on_quote_failed(self, result):
+        logger.warning("No price for %s (%s): %s", result.symbol, result.status, result.error)
+        self.current_price_input.clear()
+        self.status_label.setText(failure_message(result))
+        self.status_label.setStyleSheet("QLabel { color: red; }")
+    
+    def done(self, result):
+        # Drop any lookup still in flight so it never touches a closed dialog
+        self.quote_lookup.cancel()
+        super().done(result)
     
     def get_stock_data(self):
-        return {
-            'symbol': self.symbol_input.text().upper(),
-            'quantity': int(self.quantity_input.text()),
-            'purchase_price': float(self.price_input.text()),
-            'current_price': float(self.current_price_input.text()),
-            'date_added': datetime.now().isoformat()
-        } 
\ No newline at end of file
+        """Return the entered holding as a new, unsaved Lot."""
+        return Lot(
+            symbol=self.symbol_input.text().upper(),
+            quantity=int(self.quantity_input.text()),
+            purchase_price=float(self.price_input.text()),
+            current_price=float(self.current_price_input.text()),
+            date_added=datetime.now().isoformat(),
+            price_updated_at=self.price_fetched_at,
+            currency=self.price_currency
+        )
\ No newline at end of file
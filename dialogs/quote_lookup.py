@@ -0,0 +1,91 @@
+from PySide6.QtCore import QObject, Signal
+from utils.quote_cache import get_quote_cache
+from utils.quote_provider import normalize_symbol
+from utils.resilience import CIRCUIT_OPEN, NOT_FOUND, UNAVAILABLE, PriceResult, failed_results
+
+def failure_message(result):
+    """Return the text a dialog shows for a failed lookup's PriceResult."""
+    if result.status == NOT_FOUND:
+        return (f"No price data available for symbol '{result.symbol}'. "
+                "Please verify the symbol is correct.")
+    if result.status == CIRCUIT_OPEN:
+        return f"The price service is not responding. {result.error}"
+    return f"Failed to fetch price: {result.error}"
+
+class QuoteLookup(QObject):
+    """Fetches one quote at a time off the GUI thread for a dialog.
+
+    request() submits the lookup to the quote cache's shared pool. Every
+    request gets a new generation number, and only the result of the
+    latest one is delivered (on the GUI thread) through quote_ready, with a
+    quote that has a price, or quote_failed, with a PriceResult whose status
+    says why there is none (see utils.resilience). Results of superseded or cancelled requests are dropped,
+    so a slow answer for an old symbol or a closed dialog is never shown.
+    """
+    quote_ready = Signal(dict)
+    quote_failed = Signal(object)
+    _finished = Signal(int, object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+        self.pending = False
+        self._future = None
+        self._finished.connect(self._deliver)
+
+    def request(self, symbol):
+        """Start looking up symbol, superseding any lookup in progress."""
+        symbol = normalize_symbol(symbol)
+        self.cancel()
+        self.pending = True
+        generation = self.generation
+
+        def done(future):
+            if future.cancelled() or generation != self.generation:
+                return
+            try:
+                quote = future.result()
+            except Exception as e:
+                if "regularMarketPrice" in str(e):
+                    # Older yfinance raised KeyError for unknown symbols
+                    failure = PriceResult(symbol, status=NOT_FOUND, error=str(e))
+                else:
+                    failure = failed_results([symbol], e)[symbol]
+                self._emit_finished(generation, None, failure)
+            else:
+                if quote['price'] is None and quote.get('not_found'):
+                    self._emit_finished(generation, None, PriceResult(quote['symbol'], status=NOT_FOUND))
+                elif quote['price'] is None:
+                    failure = PriceResult(quote['symbol'], status=UNAVAILABLE,
+                                          error="no price data returned")
+                    self._emit_finished(generation, None, failure)
+                else:
+                    self._emit_finished(generation, quote, None)
+
+        self._future = get_quote_cache().get_quote_async(symbol)
+        self._future.add_done_callback(done)
+
+    def _emit_finished(self, generation, quote, failure):
+        try:
+            self._finished.emit(generation, quote, failure)
+        except RuntimeError:
+            # The lookup object was deleted with its dialog
+            pass
+
+    def cancel(self):
+        """Discard the result of any lookup in progress."""
+        self.generation += 1
+        self.pending = False
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    def _deliver(self, generation, quote, failure):
+        if generation != self.generation:
+            return
+        self.pending = False
+        self._future = None
+        if failure is not None:
+            self.quote_failed.emit(failure)
+        else:
+            self.quote_ready.emit(quote)
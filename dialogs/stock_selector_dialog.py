@@ -2,10 +2,17 @@ from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout,
                              QLabel, QPushButton, QLineEdit, QComboBox,
                              QProgressBar)
 from PySide6.QtCore import QTimer, Qt, Signal, QObject
+import logging
 import threading
-import yfinance as yf
-import pandas as pd
-import requests
+from models.symbol_list_model import SymbolListModel
+from utils.symbol_search import SymbolSearchIndex
+from utils.symbol_metadata import fetch_metadata
+from utils.symbol_universe import (SP500_UNIVERSE, SP500_URL, load_universe, save_universe,
+                                   is_stale, download_sp500)
+
+logger = logging.getLogger(__name__)
+
+KEEP_CACHED_STATUS = "Could not update the stock list; showing the cached list"
 
 class StockLoader(QObject):
     progress_updated = Signal(int, str)
@@ -14,25 +21,29 @@ class StockLoader(QObject):
     def __init__(self):
         super().__init__()
         
-    def load_stocks(self):
+    def load_stocks(self, have_cached=False):
+        """Download the S&P 500 list and emit it through loading_finished.
+
+        When the download fails, the backup list is emitted only if
+        have_cached is False; otherwise the cached list already shown is
+        better than it, so only the status is updated.
+        """
+        downloaded = False
         try:
             self.progress_updated.emit(0, "Downloading S&P 500 list...")
             
             try:
                 # Try to get the S&P 500 list from Wikipedia
-                url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
-                tables = pd.read_html(url)
-                df = tables[0]
-                
-                # Clean up symbols and get the list
-                df['Symbol'] = df['Symbol'].str.replace('.', '-')
-                stocks = [(symbol.strip(), security.strip()) 
-                         for symbol, security in zip(df['Symbol'], df['Security'])]
+                stocks = download_sp500()
+                downloaded = True
                 
                 self.progress_updated.emit(10, f"Found {len(stocks)} S&P 500 stocks")
                 
             except Exception as e:
-                print(f"Error downloading S&P 500 list: {str(e)}")
+                logger.warning("Error downloading S&P 500 list: %s", e)
+                if have_cached:
+                    self.progress_updated.emit(100, KEEP_CACHED_STATUS)
+                    return
                 self.progress_updated.emit(5, "Using backup stock list...")
                 # Use the predefined list as backup
                 stocks = [
@@ -78,29 +89,35 @@ class StockLoader(QObject):
                     ("INTU", "Intuit Inc.")
                 ]
             
-            total_stocks = len(stocks)
             self.progress_updated.emit(10, "Verifying stock information...")
             
-            # Try to get company names from yfinance for any missing ones
-            for i, (symbol, name) in enumerate(stocks):
-                progress = int(10 + (i / total_stocks * 90))
-                self.progress_updated.emit(progress, f"Loading info for {symbol}...")
+            # Look up company names for entries that lack one. Cached metadata
+            # is used first; the rest is fetched in parallel with progress
+            # reported per batch.
+            unnamed = [symbol for symbol, name in stocks if name == symbol]
+            if unnamed:
+                def report(done, total):
+                    self.progress_updated.emit(int(10 + done / total * 90),
+                                               f"Loaded info for {done} of {total} stocks...")
                 
-                if name == symbol:
-                    try:
-                        stock = yf.Ticker(symbol)
-                        new_name = stock.info.get('longName')
-                        if new_name:
-                            stocks[i] = (symbol, new_name)
-                    except Exception as e:
-                        print(f"Error fetching info for {symbol}: {str(e)}")
+                metadata = fetch_metadata(unnamed, on_progress=report)
+                stocks = [(symbol, metadata.get(symbol, {}).get('name') or name)
+                          for symbol, name in stocks]
+            
+            # Only a real download refreshes the cache; the backup list does not
+            if downloaded:
+                save_universe(SP500_UNIVERSE, stocks, source=SP500_URL)
+                stocks = load_universe()
             
             stocks.sort(key=lambda x: x[0])
             self.progress_updated.emit(100, "Stock loading complete!")
             self.loading_finished.emit(stocks)
             
-        except Exception as e:
-            print(f"Error loading stocks: {str(e)}")
+        except Exception:
+            logger.exception("Error loading stocks")
+            if have_cached:
+                self.progress_updated.emit(100, KEEP_CACHED_STATUS)
+                return
             self.progress_updated.emit(100, "Error loading stocks. Using fallback list.")
             self.loading_finished.emit([
                 ("AAPL", "Apple Inc."),
@@ -115,6 +132,7 @@ class StockSelectorDialog(QDialog):
         self.setMinimumSize(400, 150)
         self.selected_symbol = None
         self.sp500_stocks = []
+        self.search_index = SymbolSearchIndex([])
         
         # Create stock loader
         self.loader = StockLoader()
@@ -122,7 +140,6 @@ class StockSelectorDialog(QDialog):
         self.loader.loading_finished.connect(self._on_loading_finished)
         
         self.setup_ui()
-        print("StockSelectorDialog initialized")
         
         # Start loading stocks immediately
         self.load_sp500_stocks()
@@ -134,14 +151,21 @@ class StockSelectorDialog(QDialog):
         search_label = QLabel("Search:")
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Search stocks...")
-        self.search_input.textChanged.connect(self.filter_stocks)
+        self.search_input.textChanged.connect(self._schedule_filter)
         self.search_input.setEnabled(False)  # Initially disabled
         layout.addWidget(search_label)
         layout.addWidget(self.search_input)
         
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
+        self.filter_timer.timeout.connect(self._apply_filter)
+        
         # Add combobox for stock selection
         self.stock_combo = QComboBox()
         self.stock_combo.setEditable(False)
+        self.symbol_model = SymbolListModel(self)
+        self.stock_combo.setModel(self.symbol_model)
         self.stock_combo.setPlaceholderText("Loading stocks...")
         self.stock_combo.setEnabled(False)  # Initially disabled
         self.stock_combo.currentIndexChanged.connect(self.on_selection_changed)
@@ -174,82 +198,88 @@ class StockSelectorDialog(QDialog):
         
         self.ok_button.clicked.connect(self.accept)
         cancel_button.clicked.connect(self.reject)
-        print("UI setup complete")  # Debug print
 
     def on_selection_changed(self, index):
         self.ok_button.setEnabled(index >= 0)
         if index >= 0:
             self.selected_symbol = self.stock_combo.itemData(index)
-            print(f"Selected symbol: {self.selected_symbol}")  # Debug print
+            logger.debug("Selected symbol: %s", self.selected_symbol)
 
     def _update_progress_ui(self, value, status):
-        print(f"Setting progress bar value: {value}")
         self.progress_bar.setValue(value)
         if status:
             self.status_label.setText(status)
 
     def load_sp500_stocks(self):
-        print("Starting stock loading process")
+        # Show the locally cached universe straight away
+        cached = load_universe()
+        if cached:
+            self._on_loading_finished(cached)
+            if not is_stale(SP500_UNIVERSE):
+                return
+            self.status_label.setText(f"Loaded {len(cached)} stocks (updating list in background...)")
         
         def start_loading():
-            thread = threading.Thread(target=self.loader.load_stocks)
+            thread = threading.Thread(target=self.loader.load_stocks, args=(bool(cached),))
             thread.daemon = True
             thread.start()
-            print("Loading thread started")
+            logger.debug("Stock loading thread started")
         
         # Start loading immediately
         start_loading()
 
     def _on_loading_finished(self, stocks):
-        print("Loading finished")
+        logger.debug("Loaded %d stocks", len(stocks))
         self.sp500_stocks = stocks
+        self.search_index = SymbolSearchIndex(stocks)
+        self.symbol_model.set_stocks(stocks)
         self._update_ui_after_load()
 
     def _update_ui_after_load(self):
         """Update UI components after stocks are loaded"""
-        print("Updating UI after load")  # Debug print
         if len(self.sp500_stocks) > 0:
-            self.update_combo_box()
+            if self.search_input.text():
+                self.filter_stocks(self.search_input.text())
+            else:
+                self.update_combo_box()
             self.stock_combo.setEnabled(True)
             self.select_label.setEnabled(True)
             self.search_input.setEnabled(True)
             self.stock_combo.setPlaceholderText("Select a stock")
             self.progress_bar.hide()
             self.status_label.setText(f"Loaded {len(self.sp500_stocks)} stocks")
-            print(f"Stock selection enabled with {len(self.sp500_stocks)} stocks")
         else:
             self.stock_combo.setPlaceholderText("No stocks available")
             self.status_label.setText("Failed to load stocks")
-            print("No stocks were loaded")
+            logger.warning("No stocks were loaded")
 
+    def _schedule_filter(self, search_text):
+        # Debounce: only filter once typing pauses
+        self.filter_timer.start()
+    
+    def _apply_filter(self):
+        self.filter_stocks(self.search_input.text())
+    
     def filter_stocks(self, search_text):
         if not search_text:
             self.update_combo_box()
             return
         
-        filtered_stocks = [
-            (symbol, name) for symbol, name in self.sp500_stocks
-            if search_text.lower() in symbol.lower() or search_text.lower() in name.lower()
-        ]
-        
-        self.stock_combo.clear()
-        for symbol, name in filtered_stocks:
-            self.stock_combo.addItem(f"{symbol} - {name}", symbol)
+        matches = self.search_index.search(search_text)
+        self.symbol_model.set_visible(matches)
         
-        # Automatically select the first matching item if available
-        if filtered_stocks:
+        # Automatically select the first (best ranked) match if available
+        if matches:
             self.stock_combo.setCurrentIndex(0)
             # Update the selected symbol
-            self.selected_symbol = filtered_stocks[0][0]
-            print(f"Auto-selected symbol: {self.selected_symbol}")
+            self.selected_symbol = self.sp500_stocks[matches[0]][0]
+            logger.debug("Auto-selected symbol: %s", self.selected_symbol)
         else:
             self.selected_symbol = None
             self.ok_button.setEnabled(False)
 
     def update_combo_box(self):
-        self.stock_combo.clear()
-        for symbol, name in self.sp500_stocks:
-            self.stock_combo.addItem(f"{symbol} - {name}", symbol)
+        self.symbol_model.set_visible(range(len(self.sp500_stocks)))
 
     def get_selected_symbol(self):
         return self.selected_symbol 
\ No newline at end of file
@@ -1,12 +1,21 @@
+import time
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout,
                              QLabel, QPushButton, QLineEdit, QMessageBox)
-import yfinance as yf
+from PySide6.QtCore import Qt
+from utils.quote_cache import get_quote_cache
+from dialogs.quote_lookup import QuoteLookup, failure_message
 
 class UpdateStockDialog(QDialog):
-    def __init__(self, stock_data, parent=None):
+    def __init__(self, lot, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Update Stock")
-        self.stock_data = stock_data
+        self.lot = lot
+        self.fetched_currency = None
+        # When the price in the field was fetched; None while it is the lot's own
+        self.price_fetched_at = None
+        self.quote_lookup = QuoteLookup(self)
+        self.quote_lookup.quote_ready.connect(self._on_quote_ready)
+        self.quote_lookup.quote_failed.connect(self._on_quote_failed)
         self.setup_ui()
     
     def setup_ui(self):
@@ -14,7 +23,8 @@ class UpdateStockDialog(QDialog):
         
         # Create input fields
         self.current_price_input = QLineEdit()
-        self.current_price_input.setText(str(self.stock_data['current_price']))
+        self.current_price_input.setText(str(self.lot.current_price))
+        self.current_price_input.textEdited.connect(self._on_price_edited)
         layout.addWidget(QLabel("Current Price:"))
         layout.addWidget(self.current_price_input)
         
@@ -23,6 +33,12 @@ class UpdateStockDialog(QDialog):
         self.fetch_price_button.clicked.connect(self.fetch_current_price)
         layout.addWidget(self.fetch_price_button)
         
+        # Shows lookup progress and the fetched quote's details
+        self.status_label = QLabel("")
+        self.status_label.setAlignment(Qt.AlignCenter)
+        self.status_label.setStyleSheet("QLabel { color: gray; }")
+        layout.addWidget(self.status_label)
+        
         # Add buttons
         button_layout = QHBoxLayout()
         ok_button = QPushButton("OK")
@@ -35,40 +51,64 @@ class UpdateStockDialog(QDialog):
         cancel_button.clicked.connect(self.reject)
     
     def fetch_current_price(self):
-        try:
-            symbol = self.stock_data['symbol']
-            stock = yf.Ticker(symbol)
-            info = stock.info
-            
-            # Try different possible price keys
-            price = None
-            for price_key in ['currentPrice', 'regularMarketPrice', 'price', 'previousClose']:
-                if price_key in info and info[price_key] is not None:
-                    price = info[price_key]
-                    break
-            
-            if price is None:
-                QMessageBox.warning(self, "Error", f"No price data available for symbol '{symbol}'. Please verify the symbol is correct.")
-                return
-                
-            self.current_price_input.setText(str(price))
-            
-            # Show additional info in a message box
-            company_name = info.get('longName', symbol)
-            currency = info.get('currency', 'USD')
-            market_state = info.get('marketState', 'Unknown')
-            
-            info_msg = (f"Successfully fetched price for {company_name}\n"
-                       f"Current Price: {currency} {price:.2f}\n"
-                       f"Market State: {market_state}")
-            QMessageBox.information(self, "Price Information", info_msg)
-            
-        except Exception as e:
-            error_msg = str(e)
-            if "regularMarketPrice" in error_msg:
-                error_msg = f"Invalid symbol '{symbol}'. Please check the symbol and try again."
-            QMessageBox.warning(self, "Error", f"Failed to fetch price: {error_msg}")
+        symbol = self.lot.symbol
+        
+        # Show the last known price straight away while a fresh one loads
+        cache = get_quote_cache()
+        cached = cache.peek(symbol)
+        if cached is not None:
+            self.current_price_input.setText(str(cached))
+            self.price_fetched_at = cache.fetched_at(symbol)
+            self.status_label.setText(f"Cached price: {cached:.2f} (fetching latest...)")
+        else:
+            self.status_label.setText(f"Fetching price for {symbol}...")
+        self.status_label.setStyleSheet("QLabel { color: gray; }")
+        self.fetch_price_button.setEnabled(False)
+        self.fetch_price_button.setText("Fetching...")
+        self.quote_lookup.request(symbol)
+    
+    def _lookup_finished(self):
+        self.fetch_price_button.setEnabled(True)
+        self.fetch_price_button.setText("Fetch Current Price")
+    
+    def _on_quote_ready(self, quote):
+        self._lookup_finished()
+        price = quote['price']
+        self.current_price_input.setText(str(price))
+        self.price_fetched_at = quote.get('fetched_at') or time.time()
+        
+        # Show additional info below the price
+        company_name = quote['name']
+        currency = self.fetched_currency = quote['currency']
+        market_state = quote['market_state']
+        
+        self.status_label.setText(f"{company_name}: {currency} {price:.2f} ({market_state})")
+        self.status_label.setStyleSheet("QLabel { color: green; }")
+    
+    def _on_price_edited(self, text):
+        # A price typed in by hand is as fresh as it gets
+        self.price_fetched_at = time.time()
+    
+    def _on_quote_failed(self, result):
+        self._lookup_finished()
+        self.status_label.clear()
+        QMessageBox.warning(self, "Error", failure_message(result))
+    
+    def done(self, result):
+        # Drop any lookup still in flight so it never touches a closed dialog
+        self.quote_lookup.cancel()
+        super().done(result)
     
     def get_stock_data(self):
-        self.stock_data['current_price'] = float(self.current_price_input.text())
-        return self.stock_data 
\ No newline at end of file
+        """Return a copy of the lot with the entered current price.
+
+        The price keeps its fetch time: that of the fetched or cached quote,
+        now if it was typed in, and the lot's own if it was left alone. A lot
+        whose currency was unknown takes the currency of the fetched quote.
+        """
+        price_updated_at = self.price_fetched_at
+        if price_updated_at is None:
+            price_updated_at = self.lot.price_updated_at
+        return self.lot.replace(current_price=float(self.current_price_input.text()),
+                                price_updated_at=price_updated_at,
+                                currency=self.lot.currency or self.fetched_currency) 
\ No newline at end of file
@@ -1,12 +1,26 @@
+import os
 import sys
 from PySide6.QtWidgets import QApplication
 from stock_portfolio_app import StockPortfolioApp
+from utils import instrumentation
+from utils.db_utils import close_connections
 
 if __name__ == '__main__':
+    instrumentation.configure_logging()
+    
+    # PORTFOLIO_METRICS_FILE turns on instrumentation and writes the
+    # collected metrics there (.json or Prometheus text) on exit
+    metrics_file = os.environ.get('PORTFOLIO_METRICS_FILE')
+    if metrics_file:
+        instrumentation.enable()
+    
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
+    app.aboutToQuit.connect(close_connections)
+    if metrics_file:
+        app.aboutToQuit.connect(lambda: instrumentation.export_metrics(metrics_file))
     
     window = StockPortfolioApp()
     window.show()
     
-    sys.exit(app.exec()) 
\ No newline at end of file
+    sys.exit(app.exec())
@@ -0,0 +1,4 @@
+from .portfolio_table_model import PortfolioTableModel
+from .symbol_list_model import SymbolListModel
+
+__all__ = ['PortfolioTableModel', 'SymbolListModel']
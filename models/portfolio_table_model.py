@@ -0,0 +1,201 @@
+import time
+from datetime import datetime
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt
+from utils.analytics import PortfolioAnalytics
+from utils.instrumentation import timed
+from utils.portfolio import Portfolio
+
+HEADERS = ["Symbol", "Quantity", "Purchase Price", "Current Price", "Total Value", "Change %",
+           "Updated"]
+
+# Columns whose value depends on the current price, through its age
+PRICE_COLUMNS = (3, 6)
+AGE_COLUMN = 6
+
+CURRENCY_SIGNS = {'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥'}
+
+def format_money(amount, currency=None, grouping=False):
+    """Return amount with its currency sign, e.g. '$12.50', or '12.50 CHF'.
+
+    An unknown currency (None) is shown in dollars, as prices always were.
+    """
+    text = f"{amount:,.2f}" if grouping else f"{amount:.2f}"
+    sign = CURRENCY_SIGNS.get(currency or 'USD')
+    if sign is not None:
+        return f"-{sign}{text[1:]}" if amount < 0 else f"{sign}{text}"
+    return f"{text} {currency}"
+
+def format_age(seconds):
+    """Return a short relative age such as 'just now', '5m ago' or '3d ago'."""
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m ago"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)}h ago"
+    return f"{int(seconds // 86400)}d ago"
+
+class PortfolioTableModel(QAbstractTableModel):
+    """Table model over a Portfolio of Lots.
+
+    Cell text is formatted on demand in data(), so only visible cells cost
+    anything. Values and changes are read from a PortfolioAnalytics kept in
+    step with the portfolio. The Updated column shows how old each price
+    is. Price updates emit dataChanged for the affected cells only, and
+    adding or removing a stock emits row insert/remove signals instead of
+    resetting the whole table. Prices and lot values are shown in each
+    lot's own currency; the analytics totals are in the base currency.
+    """
+
+    def __init__(self, portfolio=None, parent=None):
+        super().__init__(parent)
+        self.portfolio = portfolio if portfolio is not None else Portfolio()
+        self.analytics = PortfolioAnalytics(self.portfolio)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.portfolio)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        lot = self.portfolio[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return lot.symbol
+            if column == 1:
+                return str(lot.quantity)
+            if column == 2:
+                return format_money(lot.purchase_price, lot.currency)
+            if column == 3:
+                return format_money(lot.current_price, lot.currency)
+            if column == 4:
+                return format_money(self.analytics.values[index.row()], lot.currency)
+            if column == 5:
+                return f"{self.analytics.change_pct[index.row()]:.2f}%"
+            if column == AGE_COLUMN:
+                updated = lot.price_updated_at
+                return format_age(time.time() - updated) if updated else "never"
+        elif role == Qt.ForegroundRole and column == 5:
+            return Qt.green if self.analytics.change_pct[index.row()] >= 0 else Qt.red
+        elif role == Qt.ToolTipRole and column == AGE_COLUMN:
+            updated = lot.price_updated_at
+            if updated:
+                return datetime.fromtimestamp(updated).strftime("%Y-%m-%d %H:%M:%S")
+        return None
+
+    def stock_at(self, row):
+        return self.portfolio[row]
+
+    @timed('ui_table_update_seconds')
+    def set_portfolio(self, portfolio):
+        """Replace the whole portfolio (e.g. after reloading from the database)."""
+        self.beginResetModel()
+        self.portfolio = portfolio
+        self.analytics.load(self.portfolio)
+        self.endResetModel()
+
+    @timed('ui_table_update_seconds')
+    def append_stock(self, lot):
+        row = len(self.portfolio)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.portfolio.append(lot)
+        self.analytics.append_lot(lot)
+        self.endInsertRows()
+
+    @timed('ui_table_update_seconds')
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        lot = self.portfolio.pop(row)
+        self.analytics.remove_lot(row)
+        self.endRemoveRows()
+        return lot
+
+    def replace_stock(self, row, lot):
+        """Replace the lot at row (e.g. with an edited copy) and refresh its cells."""
+        self.portfolio[row] = lot
+        self.stock_changed(row)
+
+    @timed('ui_table_update_seconds')
+    def stock_changed(self, row):
+        """Revalue row and notify views that every cell in it may have changed."""
+        self.analytics.replace_lot(row, self.portfolio[row])
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(HEADERS) - 1))
+
+    @timed('ui_table_update_seconds')
+    def update_prices(self, prices, fetched_at=None):
+        """Apply symbol -> price updates to every lot holding each symbol.
+
+        The prices are stamped as fetched at fetched_at (default now).
+        dataChanged is emitted once per run of adjacent affected rows, and
+        only covers the price-dependent columns.
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        changed = []
+        for symbol, price in prices.items():
+            for row in self.portfolio.rows_for(symbol):
+                lot = self.portfolio[row]
+                lot.current_price = price
+                lot.price_updated_at = fetched_at
+                changed.append(row)
+        if not changed:
+            return
+        self.analytics.update_prices(prices)
+        self._emit_rows_changed(changed, *PRICE_COLUMNS)
+
+    @timed('ui_table_update_seconds')
+    def set_currencies(self, currencies):
+        """Set the currency of every lot of each symbol from a symbol -> currency dict."""
+        changed = []
+        for symbol, currency in currencies.items():
+            for row in self.portfolio.rows_for(symbol):
+                self.portfolio[row].currency = currency
+                changed.append(row)
+        if not changed:
+            return
+        self.analytics.set_currencies(currencies)
+        self._emit_rows_changed(changed, 2, 4)
+
+    def set_fx_rates(self, rates, base_currency):
+        """Revalue the totals in base_currency (see PortfolioAnalytics.set_rates)."""
+        # Cells show each lot's own currency, so no cell changes
+        self.analytics.set_rates(rates, base_currency)
+
+    def mark_fetched(self, symbols, fetched_at=None):
+        """Stamp the prices of symbols as confirmed at fetched_at without changing them."""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        changed = []
+        for symbol in symbols:
+            for row in self.portfolio.rows_for(symbol):
+                self.portfolio[row].price_updated_at = fetched_at
+                changed.append(row)
+        if changed:
+            self._emit_rows_changed(changed, AGE_COLUMN, AGE_COLUMN)
+
+    def refresh_ages(self):
+        """Have views re-read the age column (ages change as time passes)."""
+        if self.portfolio:
+            self.dataChanged.emit(self.index(0, AGE_COLUMN),
+                                  self.index(len(self.portfolio) - 1, AGE_COLUMN), [Qt.DisplayRole])
+
+    def _emit_rows_changed(self, rows, first_column, last_column):
+        rows = sorted(rows)
+        first = last = rows[0]
+        for row in rows[1:]:
+            if row != last + 1:
+                self._emit_changed(first, last, first_column, last_column)
+                first = row
+            last = row
+        self._emit_changed(first, last, first_column, last_column)
+
+    def _emit_changed(self, first, last, first_column, last_column):
+        self.dataChanged.emit(self.index(first, first_column), self.index(last, last_column),
+                              [Qt.DisplayRole, Qt.ForegroundRole])
@@ -0,0 +1,39 @@
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+class SymbolListModel(QAbstractListModel):
+    """List model showing a filtered view over (symbol, name) pairs.
+
+    The full list is set once; filtering only swaps the list of visible
+    indices, so no items are created or destroyed per keystroke. Qt.UserRole
+    returns the symbol.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.stocks = []
+        self.visible = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.visible)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        symbol, name = self.stocks[self.visible[index.row()]]
+        if role == Qt.DisplayRole:
+            return f"{symbol} - {name}"
+        if role == Qt.UserRole:
+            return symbol
+        return None
+
+    def set_stocks(self, stocks):
+        self.beginResetModel()
+        self.stocks = list(stocks)
+        self.visible = list(range(len(self.stocks)))
+        self.endResetModel()
+
+    def set_visible(self, indices):
+        """Show only the given indices into stocks, in the given order."""
+        self.beginResetModel()
+        self.visible = list(indices)
+        self.endResetModel()
@@ -1,12 +1,141 @@
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout,
-                             QHBoxLayout, QLabel, QPushButton, QTableWidget,
-                             QTableWidgetItem, QHeaderView)
-from PySide6.QtCore import Qt
+                             QHBoxLayout, QLabel, QPushButton, QTableView,
+                             QHeaderView, QAbstractItemView, QCheckBox, QFileDialog,
+                             QMessageBox, QComboBox)
+from PySide6.QtCore import Qt, Signal, QObject, QTimer
+import logging
 import threading
-from dialogs.add_stock_dialog import AddStockDialog
-from dialogs.update_stock_dialog import UpdateStockDialog
-from utils.stock_utils import get_current_price
-from utils.db_utils import init_db, save_stock, load_stocks, update_stock, remove_stock
+from models.portfolio_table_model import PortfolioTableModel, format_money
+from utils.db_utils import (init_db, save_stock, load_stocks, update_stock, remove_stock,
+                            update_prices_many)
+from utils.refresh_engine import RefreshEngine
+from utils.resilience import CIRCUIT_OPEN, NOT_FOUND, UNAVAILABLE, failures_by_status, ok_prices
+from utils.quote_cache import get_quote_cache
+from utils.price_history import append_prices, compact_history
+from utils.refresh_scheduler import AdaptiveRefreshPolicy
+from utils.fx import get_base_currency, get_fx_rates, resolve_currencies
+from utils.instrumentation import span
+from utils.portfolio import Portfolio
+from utils.statement_io import import_statement
+
+logger = logging.getLogger(__name__)
+
+# Offered as base currencies, besides $PORTFOLIO_BASE_CURRENCY
+BASE_CURRENCIES = ['USD', 'EUR', 'GBP', 'JPY', 'CHF', 'CAD', 'AUD']
+
+class PriceRefresher(QObject):
+    """Runs a RefreshEngine off the GUI thread and reports back through signals.
+
+    A fetched price is emitted unless every lot of the symbol already
+    holds it; known_prices maps each symbol to the set of prices its lots
+    hold. Every fetched
+    price is written to the database with its fetch time, in one
+    transaction from the worker thread once the refresh completes, so
+    unchanged quotes count as fresh too. refresh_finished carries the
+    requested symbols and {symbol: PriceResult} for every symbol fetched,
+    failed ones included.
+    
+    After refresh_finished, each refresh also looks up the currency of the
+    unresolved symbols (currencies_resolved) and then fetches the exchange
+    rates of every currency held in one batch (rates_fetched, with the base
+    currency).
+    """
+    price_fetched = Signal(str, float)
+    market_state_fetched = Signal(str)
+    currencies_resolved = Signal(dict)
+    rates_fetched = Signal(str, dict)
+    refresh_finished = Signal(list, dict)
+    
+    def __init__(self, engine=None):
+        super().__init__()
+        self.engine = engine if engine is not None else RefreshEngine()
+        self.busy = False
+    
+    def _update_currencies(self, unresolved, currencies, base):
+        currencies = set(currencies)
+        if unresolved:
+            try:
+                resolved = resolve_currencies(unresolved)
+            except Exception:
+                logger.exception("Error looking up currencies")
+                resolved = {}
+            if resolved:
+                currencies.update(resolved.values())
+                self.currencies_resolved.emit(resolved)
+        if base is not None:
+            self.rates_fetched.emit(base, get_fx_rates().get_rates(currencies, base))
+    
+    def refresh_rates(self, currencies, base, unresolved=()):
+        """Resolve currencies and fetch exchange rates without refreshing prices."""
+        unresolved = list(unresolved)
+        currencies = list(currencies)
+        thread = threading.Thread(target=self._update_currencies,
+                                  args=(unresolved, currencies, base))
+        thread.daemon = True
+        thread.start()
+    
+    def refresh(self, symbols, known_prices=None, check_market_state=False,
+                unresolved=(), currencies=(), base=None):
+        self.busy = True
+        symbols = list(symbols)
+        known_prices = dict(known_prices or {})
+        unresolved = list(unresolved)
+        currencies = list(currencies)
+        
+        def run():
+            results = {}
+            
+            def on_result(result):
+                if result.ok and known_prices.get(result.symbol) != {result.price}:
+                    self.price_fetched.emit(result.symbol, result.price)
+            
+            if check_market_state and symbols:
+                try:
+                    quote = get_quote_cache().get_quote(symbols[0])
+                    self.market_state_fetched.emit(quote['market_state'])
+                except Exception as e:
+                    logger.warning("Error fetching market state: %s", e)
+            try:
+                results = self.engine.refresh(symbols, on_result=on_result)
+                prices = ok_prices(results)
+                if prices:
+                    update_prices_many(prices)
+            except Exception:
+                logger.exception("Error refreshing prices")
+            # Prices are done; the metadata and FX lookups can be slow and
+            # must not keep the refresh busy
+            self.refresh_finished.emit(symbols, results)
+            self._update_currencies(unresolved, currencies, base)
+        
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+class StatementImporter(QObject):
+    """Streams a broker CSV into the database on a worker thread."""
+    import_finished = Signal(int, list)
+    import_failed = Signal(str)
+    
+    def start(self, path):
+        def run():
+            try:
+                count, symbols = import_statement(path)
+            except Exception as e:
+                logger.warning("Error importing %s: %s", path, e)
+                self.import_failed.emit(str(e))
+                return
+            self.import_finished.emit(count, symbols)
+        
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+class PortfolioTableView(QTableView):
+    """Table view that records how long each repaint takes (ui_table_paint_seconds)."""
+    
+    def paintEvent(self, event):
+        with span('ui_table_paint_seconds'):
+            super().paintEvent(event)
 
 class StockPortfolioApp(QMainWindow):
     def __init__(self):
@@ -17,9 +146,21 @@ class StockPortfolioApp(QMainWindow):
         # Initialize database
         init_db()
         
-        # Initialize portfolio data
-        self.portfolio = []
+        # Keep a local history of every fetched quote; rolling old ticks into
+        # daily bars is deferred until after the first paint
+        get_quote_cache().add_fetch_listener(append_prices)
+        QTimer.singleShot(0, compact_history)
+        
+        # Initialize portfolio data. Stored prices are shown as they are and
+        # primed into the quote cache with their real fetch times, so only
+        # stale ones are ever fetched again.
+        self.portfolio = Portfolio()
         self.load_portfolio()
+        cache = get_quote_cache()
+        known_prices = self._known_prices()
+        for symbol, fetched_at in self._fetched_at().items():
+            if fetched_at is not None:
+                cache.put(symbol, known_prices[symbol], fetched_at=fetched_at)
         
         # Create central widget and layout
         central_widget = QWidget()
@@ -32,97 +173,292 @@ class StockPortfolioApp(QMainWindow):
         header.setAlignment(Qt.AlignCenter)
         layout.addWidget(header)
         
+        # Portfolio totals, kept current from the table model's analytics
+        self.summary_label = QLabel()
+        self.summary_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.summary_label)
+        
         # Create buttons
         button_layout = QHBoxLayout()
         self.add_stock_button = QPushButton("Add Stock")
         self.remove_stock_button = QPushButton("Remove Stock")
         self.update_stock_button = QPushButton("Update Stock")
         self.refresh_all_button = QPushButton("Refresh All Prices")
+        self.import_button = QPushButton("Import CSV...")
+        self.auto_refresh_checkbox = QCheckBox("Auto-refresh")
+        self.auto_refresh_checkbox.setChecked(True)
+        self.base_currency = get_base_currency()
+        self.base_currency_box = QComboBox()
+        self.base_currency_box.addItems(sorted(set(BASE_CURRENCIES) | {self.base_currency}))
+        self.base_currency_box.setCurrentText(self.base_currency)
+        self.base_currency_box.setToolTip("Currency the portfolio totals are shown in")
         
         button_layout.addWidget(self.add_stock_button)
         button_layout.addWidget(self.remove_stock_button)
         button_layout.addWidget(self.update_stock_button)
         button_layout.addWidget(self.refresh_all_button)
+        button_layout.addWidget(self.import_button)
+        button_layout.addWidget(self.auto_refresh_checkbox)
+        button_layout.addWidget(self.base_currency_box)
         layout.addLayout(button_layout)
         
-        # Create table
-        self.stock_table = QTableWidget()
-        self.stock_table.setColumnCount(6)
-        self.stock_table.setHorizontalHeaderLabels([
-            "Symbol", "Quantity", "Purchase Price", "Current Price", "Total Value", "Change %"
-        ])
+        # Create table backed by a model over the portfolio
+        self.table_model = PortfolioTableModel(self.portfolio, self)
+        self.table_model.set_fx_rates({}, self.base_currency)
+        self.stock_table = PortfolioTableView()
+        self.stock_table.setModel(self.table_model)
+        self.stock_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.stock_table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.stock_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # Fixed row heights keep scrolling cheap with very large portfolios
+        self.stock_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         layout.addWidget(self.stock_table)
         
+        for model_signal in (self.table_model.dataChanged, self.table_model.rowsInserted,
+                             self.table_model.rowsRemoved, self.table_model.modelReset):
+            model_signal.connect(self.update_summary)
+        self.update_summary()
+        
         # Connect signals
         self.add_stock_button.clicked.connect(self.add_stock)
         self.remove_stock_button.clicked.connect(self.remove_stock)
         self.update_stock_button.clicked.connect(self.update_stock)
         self.refresh_all_button.clicked.connect(self.refresh_all_prices)
+        self.import_button.clicked.connect(self.import_statement)
+        
+        self.statement_importer = StatementImporter()
+        self.statement_importer.import_finished.connect(self._on_import_finished)
+        self.statement_importer.import_failed.connect(self._on_import_failed)
+        
+        # Prices are fetched in the background and delivered via signals
+        self.price_refresher = PriceRefresher()
+        self.price_refresher.price_fetched.connect(self._on_price_fetched)
+        self.price_refresher.refresh_finished.connect(self._on_refresh_finished)
+        self.price_refresher.currencies_resolved.connect(self._on_currencies_resolved)
+        self.price_refresher.rates_fetched.connect(self._on_rates_fetched)
+        self.base_currency_box.currentTextChanged.connect(self._on_base_currency_changed)
+        
+        # Automatic refresh: a single-shot timer armed for when the next
+        # symbol is due, so nothing runs while there is nothing to poll
+        self.refresh_policy = AdaptiveRefreshPolicy()
+        self.refresh_policy.seed(self._known_prices(), fetched_at=self._fetched_at())
+        self.price_refresher.market_state_fetched.connect(self.refresh_policy.set_market_state)
+        self.auto_refresh_timer = QTimer(self)
+        self.auto_refresh_timer.setSingleShot(True)
+        self.auto_refresh_timer.timeout.connect(self._auto_refresh)
+        self.auto_refresh_checkbox.toggled.connect(self._schedule_auto_refresh)
+        self._schedule_auto_refresh()
+        
+        # Stale-while-revalidate: once the window is up, fetch only the
+        # symbols whose stored price is stale, oldest first
+        QTimer.singleShot(0, self._revalidate_stale)
         
-        # Update table
-        self.update_table()
+        # Keep the Updated column's relative ages current
+        self.age_timer = QTimer(self)
+        self.age_timer.timeout.connect(self.table_model.refresh_ages)
+        self.age_timer.start(30000)
+    
+    def _symbols(self):
+        return self.portfolio.symbols()
+    
+    def _known_prices(self):
+        return {lot.symbol.strip().upper(): lot.current_price for lot in self.portfolio}
+    
+    def _lot_prices(self):
+        """Return {symbol: set of the current prices its lots hold}."""
+        prices = {}
+        for lot in self.portfolio:
+            prices.setdefault(lot.symbol.strip().upper(), set()).add(lot.current_price)
+        return prices
+    
+    def _fetched_at(self):
+        """Return {symbol: newest price_updated_at of its lots, or None}."""
+        fetched_at = {}
+        for lot in self.portfolio:
+            symbol = lot.symbol.strip().upper()
+            updated = lot.price_updated_at
+            previous = fetched_at.get(symbol)
+            fetched_at[symbol] = updated if previous is None else max(previous, updated or 0)
+        return fetched_at
+    
+    def _refresh(self, symbols, check_market_state=False):
+        """Refresh prices of symbols, plus currencies and exchange rates."""
+        unresolved = set(self.table_model.analytics.symbols_in(None))
+        self.price_refresher.refresh(symbols, known_prices=self._lot_prices(),
+                                     check_market_state=check_market_state,
+                                     unresolved=[s for s in symbols if s in unresolved],
+                                     currencies=self.table_model.analytics.currencies,
+                                     base=self.base_currency)
+    
+    def _refresh_rates(self, resolve=False):
+        analytics = self.table_model.analytics
+        self.price_refresher.refresh_rates(analytics.currencies, self.base_currency,
+                                           analytics.symbols_in(None) if resolve else ())
+    
+    def _revalidate_stale(self):
+        if self.price_refresher.busy:
+            return
+        stale = self.refresh_policy.due_symbols(self._symbols())
+        if stale:
+            self.auto_refresh_timer.stop()
+            self._refresh(stale, check_market_state=True)
+        else:
+            # Prices are fresh, but rates are not kept between runs
+            self._refresh_rates(resolve=True)
     
     def refresh_all_prices(self):
+        if not self.portfolio or self.price_refresher.busy:
+            return
+        self.auto_refresh_timer.stop()
         self.refresh_all_button.setEnabled(False)
         self.refresh_all_button.setText("Refreshing...")
-        
-        def update_prices():
-            for i, stock in enumerate(self.portfolio):
-                price = get_current_price(stock['symbol'])
-                if price is not None:
-                    stock['current_price'] = price
-                    update_stock(stock, i)
-            
-            # Update UI in the main thread
-            self.update_table()
-            self.refresh_all_button.setEnabled(True)
-            self.refresh_all_button.setText("Refresh All Prices")
-        
-        # Run the update in a separate thread
-        thread = threading.Thread(target=update_prices)
-        thread.start()
+        self._refresh(self._symbols())
+    
+    def _schedule_auto_refresh(self, *args):
+        self.auto_refresh_timer.stop()
+        if not self.auto_refresh_checkbox.isChecked() or not self.portfolio:
+            return
+        delay = self.refresh_policy.next_delay(self._symbols())
+        self.auto_refresh_timer.start(max(1000, int(delay * 1000)))
+    
+    def _auto_refresh(self):
+        if self.price_refresher.busy:
+            self._schedule_auto_refresh()
+            return
+        due = self.refresh_policy.due_symbols(self._symbols())
+        if not due:
+            self._schedule_auto_refresh()
+            return
+        self._refresh(due, check_market_state=True)
+    
+    def _on_price_fetched(self, symbol, price):
+        self.table_model.update_prices({symbol: price})
+    
+    def _on_currencies_resolved(self, currencies):
+        self.table_model.set_currencies(currencies)
+    
+    def _on_rates_fetched(self, base, rates):
+        # Rates for a base currency that was since changed are dropped
+        if base != self.base_currency:
+            return
+        self.table_model.set_fx_rates(rates, base)
+        self.update_summary()
+    
+    def _on_base_currency_changed(self, base):
+        self.base_currency = base
+        self._refresh_rates()
+    
+    def _on_refresh_finished(self, symbols, results):
+        self.price_refresher.busy = False
+        self._show_refresh_failures(results)
+        prices = ok_prices(results)
+        self.refresh_policy.record(symbols, prices)
+        self.table_model.mark_fetched(prices)
+        self.refresh_all_button.setEnabled(True)
+        self.refresh_all_button.setText("Refresh All Prices")
+        self._schedule_auto_refresh()
+    
+    def _show_refresh_failures(self, results):
+        failures = failures_by_status(results)
+        if not failures:
+            self.statusBar().clearMessage()
+            return
+        parts = []
+        if NOT_FOUND in failures:
+            parts.append(f"no price data for {', '.join(failures[NOT_FOUND])}")
+        if UNAVAILABLE in failures:
+            parts.append(f"fetch failed for {len(failures[UNAVAILABLE])} symbols")
+        if CIRCUIT_OPEN in failures:
+            error = results[failures[CIRCUIT_OPEN][0]].error
+            parts.append(f"{len(failures[CIRCUIT_OPEN])} symbols not fetched: {error}")
+        self.statusBar().showMessage("Refresh: " + "; ".join(parts))
+    
+    def update_summary(self, *args):
+        analytics = self.table_model.analytics
+        totals = analytics.totals()
+        currency = totals['currency']
+        color = "green" if totals['unrealized_pnl'] >= 0 else "red"
+        text = (
+            f"Total Value: {format_money(totals['total_value'], currency, grouping=True)}    "
+            f"Cost: {format_money(totals['total_cost'], currency, grouping=True)}    "
+            f"<span style='color: {color};'>P&amp;L: "
+            f"{format_money(totals['unrealized_pnl'], currency, grouping=True)} "
+            f"({totals['change_pct']:.2f}%)</span>"
+        )
+        if totals['unconverted']:
+            # No exchange rate yet: shown on their own instead of added in
+            excluded = ', '.join(format_money(t['total_value'], c, grouping=True)
+                                 for c, t in sorted(totals['unconverted'].items()))
+            text += f"    (not included, no exchange rate: {excluded})"
+        self.summary_label.setText(text)
     
     def load_portfolio(self):
         self.portfolio = load_stocks()
     
-    def update_table(self):
-        self.stock_table.setRowCount(len(self.portfolio))
-        for row, stock in enumerate(self.portfolio):
-            self.stock_table.setItem(row, 0, QTableWidgetItem(stock['symbol']))
-            self.stock_table.setItem(row, 1, QTableWidgetItem(str(stock['quantity'])))
-            self.stock_table.setItem(row, 2, QTableWidgetItem(f"${stock['purchase_price']:.2f}"))
-            self.stock_table.setItem(row, 3, QTableWidgetItem(f"${stock['current_price']:.2f}"))
-            total_value = stock['quantity'] * stock['current_price']
-            self.stock_table.setItem(row, 4, QTableWidgetItem(f"${total_value:.2f}"))
-            
-            # Calculate and display price change percentage
-            price_change = ((stock['current_price'] - stock['purchase_price']) / stock['purchase_price']) * 100
-            change_item = QTableWidgetItem(f"{price_change:.2f}%")
-            change_item.setForeground(Qt.green if price_change >= 0 else Qt.red)
-            self.stock_table.setItem(row, 5, change_item)
-    
     def add_stock(self):
+        # Dialogs are imported on first use to keep startup light
+        from dialogs.add_stock_dialog import AddStockDialog
+        
         dialog = AddStockDialog(self)
         if dialog.exec():
-            stock_data = dialog.get_stock_data()
-            save_stock(stock_data)
-            self.portfolio.append(stock_data)
-            self.update_table()
+            lot = dialog.get_stock_data()
+            save_stock(lot)
+            new_currency = lot.currency not in self.table_model.analytics.currencies
+            self.table_model.append_stock(lot)
+            if new_currency:
+                self._refresh_rates()
+            self.refresh_policy.seed({lot.symbol: lot.current_price},
+                                     fetched_at={lot.symbol: lot.price_updated_at})
+            self._schedule_auto_refresh()
+    
+    def import_statement(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import Holdings", "",
+                                              "CSV files (*.csv *.txt);;All files (*)")
+        if not path:
+            return
+        self.import_button.setEnabled(False)
+        self.import_button.setText("Importing...")
+        self.statement_importer.start(path)
+    
+    def _on_import_finished(self, count, symbols):
+        self.import_button.setEnabled(True)
+        self.import_button.setText("Import CSV...")
+        self.load_portfolio()
+        self.table_model.set_portfolio(self.portfolio)
+        # Imported symbols get one batched refresh; if one is already
+        # running they stay unpolled, so the next automatic cycle takes them
+        if symbols and not self.price_refresher.busy:
+            self.auto_refresh_timer.stop()
+            self._refresh(symbols)
+        else:
+            self._schedule_auto_refresh()
+        QMessageBox.information(self, "Import Complete",
+                                f"Imported {count} lots ({len(symbols)} symbols).")
+    
+    def _on_import_failed(self, message):
+        self.import_button.setEnabled(True)
+        self.import_button.setText("Import CSV...")
+        QMessageBox.warning(self, "Import Failed", message)
+    
+    def _current_row(self):
+        return self.stock_table.currentIndex().row()
     
     def remove_stock(self):
-        current_row = self.stock_table.currentRow()
+        current_row = self._current_row()
         if current_row >= 0:
-            if remove_stock(current_row):
-                self.portfolio.pop(current_row)
-                self.update_table()
+            if remove_stock(self.portfolio[current_row].id):
+                self.table_model.remove_row(current_row)
     
     def update_stock(self):
-        current_row = self.stock_table.currentRow()
+        current_row = self._current_row()
         if current_row >= 0:
+            from dialogs.update_stock_dialog import UpdateStockDialog
+            
             dialog = UpdateStockDialog(self.portfolio[current_row], self)
             if dialog.exec():
-                updated_stock = dialog.get_stock_data()
-                if update_stock(updated_stock, current_row):
-                    self.portfolio[current_row] = updated_stock
-                    self.update_table() 
\ No newline at end of file
+                updated_lot = dialog.get_stock_data()
+                if update_stock(updated_lot):
+                    new_currency = updated_lot.currency not in self.table_model.analytics.currencies
+                    self.table_model.replace_stock(current_row, updated_lot)
+                    if new_currency:
+                        self._refresh_rates()
@@ -0,0 +1,21 @@
+import pytest
+
+from utils import db_utils, quote_cache
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Point the database at a fresh, migrated file for the test."""
+    db_utils.set_db_path(tmp_path / 'portfolio.db')
+    db_utils.init_db()
+    yield tmp_path / 'portfolio.db'
+    db_utils.close_connections()
+    db_utils.set_db_path(None)
+
+
+@pytest.fixture
+def global_cache():
+    """Restore the process-wide quote cache a test replaces."""
+    previous = quote_cache._cache
+    yield
+    quote_cache.set_quote_cache(previous)
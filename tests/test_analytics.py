@@ -0,0 +1,124 @@
+"""Incremental PortfolioAnalytics updates agree with a full reload."""
+import random
+
+import numpy as np
+import pytest
+
+from utils.analytics import PortfolioAnalytics
+from utils.portfolio import Lot
+
+RATES = {'EUR': 1.1, 'GBp': 0.0125}
+
+
+def random_lot(rng, currencies):
+    """Return a random lot, in the currency currencies holds for its symbol."""
+    symbol = rng.choice(['AAPL', 'MSFT', 'SAP', 'VOD.L', 'BMW.DE', 'TSLA'])
+    if symbol not in currencies:
+        currency = {'SAP': 'EUR', 'BMW.DE': 'EUR', 'VOD.L': 'GBp'}.get(symbol, 'USD')
+        currencies[symbol] = rng.choice([currency, None]) if symbol == 'TSLA' else currency
+    return Lot(symbol, rng.randint(1, 50), rng.uniform(10, 500), rng.uniform(10, 500),
+               currency=currencies[symbol])
+
+
+def assert_same(analytics, lots):
+    expected = PortfolioAnalytics()
+    expected.set_rates(analytics.rates, analytics.base_currency)
+    expected.load(lots)
+    for name in ('quantities', 'current_prices', 'costs', 'values', 'pnl', 'change_pct', 'weights'):
+        np.testing.assert_allclose(getattr(analytics, name), getattr(expected, name))
+    assert analytics.total_value == pytest.approx(expected.total_value)
+    assert analytics.total_cost == pytest.approx(expected.total_cost)
+    assert sorted(analytics.unconverted) == sorted(expected.unconverted)
+    assert analytics.unconverted_totals().keys() == expected.unconverted_totals().keys()
+    for currency, totals in expected.unconverted_totals().items():
+        assert analytics.unconverted_totals()[currency] == pytest.approx(totals)
+    for symbol, code in analytics._codes_by_symbol.items():
+        np.testing.assert_array_equal(analytics._rows_for(code),
+                                      [row for row, lot in enumerate(lots) if lot.symbol == symbol])
+    summary = {row['symbol']: row for row in analytics.symbol_summary()}
+    for row in expected.symbol_summary():
+        for key in ('quantity', 'value', 'cost'):
+            np.testing.assert_allclose(summary[row['symbol']][key], row[key])
+
+
+@pytest.mark.parametrize('rates', [RATES, {'EUR': 1.1}])
+def test_random_edits_match_a_full_reload(rates):
+    rng = random.Random(3)
+    # Every lot of a symbol is in the same currency
+    currencies = {}
+    lots = [random_lot(rng, currencies) for _ in range(20)]
+    analytics = PortfolioAnalytics()
+    analytics.set_rates(rates, 'USD')
+    analytics.load(lots)
+
+    for _ in range(500):
+        action = rng.random()
+        if action < 0.2 or not lots:
+            lot = random_lot(rng, currencies)
+            lots.append(lot)
+            analytics.append_lot(lot)
+        elif action < 0.35:
+            row = rng.randrange(len(lots) + 1)
+            lot = random_lot(rng, currencies)
+            lots.insert(row, lot)
+            analytics.insert_lot(row, lot)
+        elif action < 0.55:
+            row = rng.randrange(len(lots))
+            lots.pop(row)
+            analytics.remove_lot(row)
+        elif action < 0.7:
+            row = rng.randrange(len(lots))
+            lots[row] = lots[row].replace(quantity=rng.randint(1, 50),
+                                          current_price=rng.uniform(10, 500))
+            analytics.replace_lot(row, lots[row])
+        elif action < 0.75:
+            # Moves the lot to another symbol
+            row = rng.randrange(len(lots))
+            lots[row] = random_lot(rng, currencies).replace(purchase_price=lots[row].purchase_price)
+            analytics.replace_lot(row, lots[row])
+        elif action < 0.8:
+            symbol = rng.choice(analytics.symbols)
+            currency = rng.choice(['USD', 'EUR', 'GBp', 'CHF'])
+            currencies[symbol] = currency
+            for lot in lots:
+                if lot.symbol == symbol:
+                    lot.currency = currency
+            analytics.set_currencies({symbol: currency})
+        else:
+            symbol = rng.choice(analytics.symbols)
+            price = rng.uniform(10, 500)
+            for lot in lots:
+                if lot.symbol == symbol:
+                    lot.current_price = price
+            analytics.update_prices({symbol: price})
+        assert_same(analytics, lots)
+
+
+def test_removing_the_last_lot_of_a_symbol_forgets_it():
+    analytics = PortfolioAnalytics([Lot('AAPL', 1, 1.0, 2.0, currency='USD'),
+                                    Lot('SAP', 1, 1.0, 2.0, currency='EUR')])
+    analytics.set_rates({'EUR': 1.1}, 'USD')
+    analytics.remove_lot(1)
+    assert analytics.symbols == ['AAPL']
+    assert analytics.currencies == ['USD']
+    assert analytics.total_value == 2.0
+
+
+def test_replacing_with_another_symbol_moves_the_lot():
+    lots = [Lot('AAPL', 1, 1.0, 2.0), Lot('MSFT', 2, 1.0, 3.0)]
+    analytics = PortfolioAnalytics(lots)
+    lots[0] = lots[0].replace(symbol='TSLA')
+    analytics.replace_lot(0, lots[0])
+    assert_same(analytics, lots)
+    assert analytics.symbols_in(None) == ['MSFT', 'TSLA']
+
+
+def test_set_currencies_revalues_the_symbol():
+    lots = [Lot('SAP', 2, 10.0, 20.0), Lot('AAPL', 1, 5.0, 5.0)]
+    analytics = PortfolioAnalytics(lots)
+    analytics.set_rates({'EUR': 1.5}, 'USD')
+    assert analytics.total_value == 45.0
+
+    analytics.set_currencies({'sap': 'EUR'})
+    assert set(analytics.currencies) == {None, 'EUR'}
+    assert analytics.total_value == 65.0
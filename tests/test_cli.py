@@ -0,0 +1,92 @@
+"""The headless CLI against a temporary database."""
+import csv
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import cli
+from utils.db_utils import save_stocks_many
+from utils.ohlc_store import save_ohlc
+from utils.portfolio import Lot
+from utils.price_history import append_prices
+from utils.symbol_universe import load_universe
+
+
+def utc(moment):
+    return datetime.fromisoformat(moment).replace(tzinfo=timezone.utc).timestamp()
+
+
+def bars(dates, closes):
+    return {'date': dates, 'open': closes, 'high': closes, 'low': closes, 'close': closes,
+            'volume': [0.0] * len(closes)}
+
+
+@pytest.fixture
+def holdings(db):
+    save_stocks_many([Lot('AAPL', 10, 150.0, 190.0, currency='USD'),
+                      Lot('VTI', 0.5, 200.0, 220.0, currency='USD')])
+    return db
+
+
+def test_report_exports_csv_to_a_file(holdings, tmp_path):
+    out = tmp_path / 'holdings.csv'
+    assert cli.main(['--db', str(holdings), 'report', '-o', str(out)]) == 0
+    with open(out, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['symbol'], row['total_value']) for row in rows] == [('AAPL', '1900.0'),
+                                                                      ('VTI', '110.0')]
+
+
+def test_report_format_follows_the_parquet_extension(holdings, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    out = tmp_path / 'holdings.parquet'
+    assert cli.main(['--db', str(holdings), 'report', '-o', str(out)]) == 0
+    assert pq.read_table(out).column('symbol').to_pylist() == ['AAPL', 'VTI']
+
+
+def test_report_streams_json_lines(holdings, capsys):
+    assert cli.main(['--db', str(holdings), 'report', '--format', 'json']) == 0
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [row['quantity'] for row in rows] == [10, 0.5]
+
+
+def test_parquet_to_stdout_is_refused(holdings):
+    assert cli.main(['--db', str(holdings), 'report', '--format', 'parquet']) == 2
+
+
+def test_universe_import_adds_a_searchable_universe(db, tmp_path, capsys):
+    listing = tmp_path / 'nasdaq-listed.txt'
+    listing.write_text("Symbol|Security Name|Market Category\n"
+                       "AAPL|Apple Inc. - Common Stock|Q\n"
+                       "msft|Microsoft Corporation - Common Stock|Q\n"
+                       "|File Creation Time: 0101202500:00|\n")
+    assert cli.main(['--db', str(db), 'universe', 'import', str(listing)]) == 0
+    assert load_universe('nasdaq-listed') == [('AAPL', 'Apple Inc. - Common Stock'),
+                                              ('MSFT', 'Microsoft Corporation - Common Stock')]
+
+    assert cli.main(['--db', str(db), 'universe', 'list']) == 0
+    name, count, _, source = capsys.readouterr().out.strip().split('\t')
+    assert (name, count, source) == ('nasdaq-listed', '2 symbols', str(listing))
+
+
+def test_universe_import_needs_the_symbol_column(db, tmp_path):
+    listing = tmp_path / 'listing.csv'
+    listing.write_text("Ticker,Name\nAAPL,Apple\n")
+    assert cli.main(['--db', str(db), 'universe', 'import', str(listing)]) == 2
+    assert cli.main(['--db', str(db), 'universe', 'import', str(listing), '--name', 'mine',
+                     '--symbol-column', 'Ticker']) == 0
+    assert load_universe('mine') == [('AAPL', 'Apple')]
+
+
+def test_history_values_the_holdings_at_each_close(holdings, capsys, monkeypatch):
+    monkeypatch.delenv('PORTFOLIO_OHLC_DIR', raising=False)
+    save_ohlc('AAPL', bars(['2024-01-02', '2024-01-03'], [100.0, 110.0]))
+    save_ohlc('VTI', bars(['2024-01-02'], [200.0]))
+    # Recorded by a refresh after the last stored bar
+    append_prices({'AAPL': 125.0, 'VTI': 210.0}, timestamp=utc('2024-01-04T15:00'))
+
+    assert cli.main(['--db', str(holdings), 'history', '--start', '2024-01-01']) == 0
+    rows = list(csv.reader(capsys.readouterr().out.splitlines()))
+    assert rows == [['date', 'value_usd'], ['2024-01-02', '1100.0'], ['2024-01-03', '1200.0'],
+                    ['2024-01-04', '1355.0']]
@@ -0,0 +1,43 @@
+"""Stock table reads and writes against a temporary database."""
+from utils.db_utils import load_stocks, save_stock, update_stock
+from utils.portfolio import Lot
+
+
+def test_unchanged_edit_keeps_a_missing_timestamp(db):
+    save_stock(Lot('AAPL', 10, 100.0, 120.0))
+
+    lot = load_stocks()[0]
+    assert lot.price_updated_at is None
+    assert update_stock(lot.replace(currency='USD'))
+    assert load_stocks()[0].price_updated_at is None
+
+
+def test_edit_keeps_the_given_timestamp(db):
+    save_stock(Lot('AAPL', 10, 100.0, 120.0, price_updated_at=1000.0))
+
+    lot = load_stocks()[0]
+    update_stock(lot.replace(current_price=130.0, price_updated_at=2000.0))
+    stored = load_stocks()[0]
+    assert stored.current_price == 130.0
+    assert stored.price_updated_at == 2000.0
+
+
+def test_changed_price_without_a_timestamp_is_stamped(db):
+    save_stock(Lot('AAPL', 10, 100.0, 120.0))
+
+    update_stock(load_stocks()[0].replace(current_price=130.0))
+    assert load_stocks()[0].price_updated_at is not None
+
+
+def test_load_stocks_round_trips_every_field(db):
+    lots = [Lot('AAPL', 10, 100.0, 120.0, '2024-01-02T03:04:05', 1700000000.0, 'USD'),
+            Lot('VTI', 0.5, 200.0, 210.0, '2024-02-03T04:05:06'),
+            Lot('AAPL', 3, 150.0, 120.0, '2024-03-04T05:06:07', 1700000001.0, 'USD')]
+    for lot in lots:
+        save_stock(lot)
+
+    portfolio = load_stocks()
+    assert list(portfolio) == lots
+    assert portfolio.rows_for('AAPL') == [0, 2]
+    # The lots of a symbol share one string
+    assert portfolio[0].symbol is portfolio[2].symbol
@@ -0,0 +1,71 @@
+"""Local closes from the price history and the OHLC store against a temporary database."""
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from utils.analytics import PortfolioAnalytics
+from utils.ohlc_store import load_closes, save_ohlc, set_store_dir
+from utils.portfolio import Lot
+from utils.price_history import append_prices, compact_history, daily_closes
+
+
+def utc(moment):
+    return datetime.fromisoformat(moment).replace(tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    set_store_dir(tmp_path / 'ohlc')
+    yield tmp_path / 'ohlc'
+    set_store_dir(None)
+
+
+def test_daily_closes_use_bars_then_the_last_tick_of_each_day(db):
+    append_prices({'AAPL': 100.0}, timestamp=utc('2024-01-02T15:00'))
+    append_prices({'AAPL': 101.0}, timestamp=utc('2024-01-02T20:00'))
+    compact_history(now=utc('2024-03-01T00:00'))
+    append_prices({'AAPL': 120.0}, timestamp=utc('2024-02-20T10:00'))
+    append_prices({'AAPL': 125.0}, timestamp=utc('2024-02-20T15:00'))
+    append_prices({'MSFT': 1.0}, timestamp=utc('2024-02-20T15:00'))
+
+    dates, closes = daily_closes('AAPL')
+    assert dates.tolist() == list(np.array(['2024-01-02', '2024-02-20'], dtype='datetime64[D]'))
+    assert closes.tolist() == [101.0, 125.0]
+    dates, closes = daily_closes('AAPL', '2024-02-20', '2024-02-20')
+    assert closes.tolist() == [125.0]
+    assert len(daily_closes('AAPL', end_day='2024-01-01')[0]) == 0
+
+
+def test_load_closes_appends_recent_closes_after_the_stored_bars(store):
+    closes = [100.0, 110.0]
+    save_ohlc('AAPL', {'date': ['2024-01-02', '2024-01-03'], 'open': closes, 'high': closes,
+                       'low': closes, 'close': closes, 'volume': [0.0, 0.0]})
+    # Already covered by a stored bar, so it is not used
+    append_prices({'AAPL': 999.0}, timestamp=utc('2024-01-03T20:00'))
+    append_prices({'AAPL': 125.0, 'NEW': 5.0}, timestamp=utc('2024-01-04T15:00'))
+
+    assert load_closes(['AAPL']).keys() == {'AAPL'}
+    assert load_closes(['AAPL'])['AAPL'][1].tolist() == [100.0, 110.0]
+    recent = load_closes(['aapl', 'NEW'], include_recent=True)
+    assert recent['AAPL'][1].tolist() == [100.0, 110.0, 125.0]
+    assert str(recent['AAPL'][0][-1]) == '2024-01-04'
+    assert recent['NEW'][1].tolist() == [5.0]
+    assert load_closes(['AAPL'], end='2024-01-03', include_recent=True)['AAPL'][1].tolist() == \
+        [100.0, 110.0]
+
+
+def test_value_history_carries_closes_forward_and_converts():
+    analytics = PortfolioAnalytics([Lot('AAPL', 10, 1.0, 1.0, currency='USD'),
+                                    Lot('SAP', 2, 1.0, 1.0, currency='EUR'),
+                                    Lot('VOD.L', 100, 1.0, 1.0, currency='GBp')])
+    analytics.set_rates({'USD': 1.0, 'EUR': 1.5}, 'USD')
+    day = lambda *dates: np.array(dates, dtype='datetime64[D]')
+    dates, values = analytics.value_history({
+        'AAPL': (day('2024-01-02', '2024-01-04'), np.array([100.0, 120.0])),
+        'SAP': (day('2024-01-03'), np.array([50.0])),
+        'VOD.L': (day('2024-01-02'), np.array([70.0])),  # no GBp rate: left out
+        'OTHER': (day('2024-01-01'), np.array([1.0])),
+    })
+    assert [str(d) for d in dates] == ['2024-01-02', '2024-01-03', '2024-01-04']
+    np.testing.assert_allclose(values, [1000.0, 1150.0, 1350.0])
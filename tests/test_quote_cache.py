@@ -0,0 +1,67 @@
+"""QuoteCache lookups coalescing on in-flight fetches."""
+import threading
+
+from utils.quote_cache import QuoteCache
+from utils.quote_provider import FakeQuoteProvider
+
+
+class Blocking(FakeQuoteProvider):
+    """Fake provider whose requests wait until release is set."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.requested = []
+
+    def get_prices(self, symbols):
+        self.requested.append(sorted(symbols))
+        self.started.set()
+        assert self.release.wait(5)
+        return super().get_prices(symbols)
+
+
+def in_thread(target, *args):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(target(*args)))
+    thread.start()
+    return thread, results
+
+
+def test_get_prices_waits_for_an_inflight_quote():
+    provider = Blocking(prices={'AAPL': 10.0})
+    cache = QuoteCache(provider=provider)
+    thread, quotes = in_thread(cache.get_quote, 'AAPL')
+    assert provider.started.wait(5)
+
+    threading.Timer(0.2, provider.release.set).start()
+    assert cache.get_prices(['aapl', 'MSFT'], max_age=0).keys() == {'AAPL', 'MSFT'}
+    thread.join()
+    assert quotes[0]['price'] == 10.0
+    assert provider.requested == [['AAPL'], ['MSFT']]
+
+
+def test_get_prices_waiting_on_a_not_found_quote_gets_no_price():
+    provider = Blocking(missing=['GONE'])
+    cache = QuoteCache(provider=provider)
+    thread, _ = in_thread(cache.get_quote, 'GONE')
+    assert provider.started.wait(5)
+
+    threading.Timer(0.2, provider.release.set).start()
+    assert cache.get_prices(['GONE']) == {}
+    thread.join()
+    assert provider.calls == 1
+
+
+def test_concurrent_quotes_share_one_request():
+    provider = Blocking(prices={'AAPL': 10.0})
+    cache = QuoteCache(provider=provider)
+    first, quotes = in_thread(cache.get_quote, 'AAPL')
+    assert provider.started.wait(5)
+    second, more = in_thread(cache.get_quote, 'AAPL')
+
+    threading.Timer(0.2, provider.release.set).start()
+    first.join()
+    second.join()
+    assert quotes[0]['price'] == more[0]['price'] == 10.0
+    assert provider.calls == 1
@@ -0,0 +1,33 @@
+"""RefreshEngine against a local fake provider."""
+from utils import quote_cache
+from utils.quote_cache import QuoteCache
+from utils.quote_provider import FakeQuoteProvider
+from utils.refresh_engine import RefreshEngine
+from utils.resilience import NOT_FOUND, PriceResult
+
+
+def test_an_empty_injected_cache_is_used(global_cache):
+    # An empty QuoteCache is falsy (it has __len__); it must not be swapped for the global one
+    global_provider = FakeQuoteProvider()
+    quote_cache.set_quote_cache(QuoteCache(provider=global_provider))
+    provider = FakeQuoteProvider(prices={'AAPL': 1.0})
+    cache = QuoteCache(provider=provider)
+    assert len(cache) == 0
+
+    RefreshEngine(cache=cache).refresh(['AAPL'])
+    assert provider.calls == 1
+    assert global_provider.calls == 0
+
+
+def test_refresh_returns_a_result_per_symbol():
+    provider = FakeQuoteProvider(prices={'AAPL': 1.0, 'MSFT': 2.0}, missing=['GONE'])
+    engine = RefreshEngine(cache=QuoteCache(provider=provider), batch_size=2,
+                           requests_per_second=None)
+    seen = []
+
+    results = engine.refresh(['aapl', 'MSFT', 'GONE', 'AAPL'], on_result=seen.append)
+    assert results['AAPL'] == PriceResult('AAPL', 1.0)
+    assert results['MSFT'] == PriceResult('MSFT', 2.0)
+    assert results['GONE'].status == NOT_FOUND
+    assert sorted(r.symbol for r in seen) == ['AAPL', 'GONE', 'MSFT']
+    assert provider.calls == 2
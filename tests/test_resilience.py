@@ -0,0 +1,320 @@
+"""Retry, circuit breaker and negative cache behaviour against local fake providers."""
+import random
+
+import pytest
+
+from utils import quote_cache, stock_utils
+from utils.quote_cache import QuoteCache
+from utils.quote_provider import FakeQuoteProvider, FaultyQuoteProvider, QuoteUnavailableError
+from utils.resilience import (CIRCUIT_OPEN, NOT_FOUND, UNAVAILABLE, CircuitBreaker,
+                              CircuitOpenError, PriceResult, ResilientProvider, RetryPolicy)
+
+
+class Clock:
+    """Manually advanced clock, for breaker and cache timing."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def resilient(provider, attempts=3, failure_threshold=5, reset_timeout=30.0, clock=None):
+    sleeps = []
+    wrapped = ResilientProvider(
+        provider,
+        retry=RetryPolicy(attempts=attempts, base_delay=0.5, max_delay=8.0, rng=random.Random(1)),
+        breaker=CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout,
+                               clock=clock or Clock()),
+        sleep=sleeps.append)
+    return wrapped, sleeps
+
+
+# Retries
+
+def test_transient_failure_is_retried_until_it_succeeds():
+    upstream = FaultyQuoteProvider(failures=2, prices={'AAPL': 100.0})
+    provider, sleeps = resilient(upstream)
+
+    assert provider.get_prices(['AAPL']) == {'AAPL': 100.0}
+    assert upstream.requests == 3
+    assert len(sleeps) == 2
+
+
+def test_retry_delays_use_full_jitter_within_the_cap():
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0, rng=random.Random(7))
+    for retry, cap in [(0, 0.5), (1, 1.0), (2, 2.0), (6, 2.0)]:
+        assert 0 <= policy.delay(retry) <= cap
+
+
+def test_retry_delays_are_reproducible_with_a_seeded_rng():
+    provider, first = resilient(FaultyQuoteProvider(failures=2))
+    provider.get_prices(['A'])
+    provider, second = resilient(FaultyQuoteProvider(failures=2))
+    provider.get_prices(['A'])
+    assert first == second
+
+
+def test_gives_up_after_the_last_attempt():
+    upstream = FaultyQuoteProvider(failures=10)
+    provider, sleeps = resilient(upstream, attempts=3)
+
+    with pytest.raises(ConnectionError):
+        provider.get_prices(['AAPL'])
+    assert upstream.requests == 3
+    assert len(sleeps) == 2
+
+
+def test_non_transient_errors_are_not_retried():
+    upstream = FaultyQuoteProvider(failures=1, error=ValueError)
+    provider, sleeps = resilient(upstream)
+
+    with pytest.raises(ValueError):
+        provider.get_prices(['AAPL'])
+    assert upstream.requests == 1
+    assert sleeps == []
+    assert provider.breaker.failures == 1
+
+
+def test_quote_unavailable_error_is_transient():
+    class Outage(FakeQuoteProvider):
+        def get_prices(self, symbols):
+            self.calls += 1
+            if self.calls == 1:
+                raise QuoteUnavailableError({s: 'Too Many Requests' for s in symbols})
+            return super().get_prices(symbols)
+
+    provider, sleeps = resilient(Outage(prices={'AAPL': 1.0}))
+    assert provider.get_prices(['AAPL']) == {'AAPL': 1.0}
+    assert len(sleeps) == 1
+
+
+# Circuit breaker
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, clock=Clock())
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_opens_after_the_timeout_and_closes_on_success():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one trial call at a time
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_call_reopens_the_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.advance(30)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_after() == 30
+    clock.advance(10)
+    assert not breaker.allow()
+
+
+def test_open_circuit_fails_fast_without_calling_the_upstream():
+    clock = Clock()
+    upstream = FaultyQuoteProvider(failures=2, prices={'AAPL': 5.0})
+    provider, _ = resilient(upstream, attempts=1, failure_threshold=2, clock=clock)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            provider.get_prices(['AAPL'])
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        provider.get_prices(['AAPL'])
+    assert excinfo.value.retry_after == 30
+    assert upstream.requests == 2
+
+    clock.advance(30)
+    assert provider.get_prices(['AAPL']) == {'AAPL': 5.0}
+    assert provider.breaker.state == CircuitBreaker.CLOSED
+
+
+# Negative cache
+
+def test_not_found_symbols_are_not_requested_again(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(quote_cache.time, 'time', clock)
+    provider = FakeQuoteProvider(missing=['GONE'])
+    cache = QuoteCache(provider=provider, negative_ttl=3600)
+
+    assert cache.get_prices(['GONE']) == {}
+    assert cache.is_missing('GONE')
+    assert cache.get_prices(['GONE'], max_age=0) == {}
+    assert provider.calls == 1
+
+
+def test_negative_entries_expire_after_their_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(quote_cache.time, 'time', clock)
+    provider = FakeQuoteProvider(missing=['GONE'])
+    cache = QuoteCache(provider=provider, negative_ttl=3600)
+    cache.get_prices(['GONE'])
+
+    clock.advance(3599)
+    assert cache.is_missing('GONE')
+    clock.advance(1)
+    assert not cache.is_missing('GONE')
+    cache.get_prices(['GONE'])
+    assert provider.calls == 2
+
+
+def test_invalidate_clears_negative_entries():
+    provider = FakeQuoteProvider(missing=['GONE', 'LOST'])
+    cache = QuoteCache(provider=provider)
+    cache.get_prices(['GONE', 'LOST'])
+
+    cache.invalidate('gone')
+    assert not cache.is_missing('GONE')
+    assert cache.is_missing('LOST')
+    cache.invalidate()
+    assert not cache.is_missing('LOST')
+
+
+def test_symbols_missing_from_a_batch_are_not_negative_cached():
+    # A plain dict gives no not-found information: an empty batch may be an outage
+    class Empty(FakeQuoteProvider):
+        def get_prices(self, symbols):
+            self.calls += 1
+            return {}
+
+    provider = Empty()
+    cache = QuoteCache(provider=provider)
+    assert cache.get_prices(['AAPL']) == {}
+    assert not cache.is_missing('AAPL')
+    cache.get_prices(['AAPL'], max_age=0)
+    assert provider.calls == 2
+
+
+def test_failed_fetch_is_not_negative_cached():
+    provider, _ = resilient(FaultyQuoteProvider(failures=3), attempts=3)
+    cache = QuoteCache(provider=provider)
+    with pytest.raises(ConnectionError):
+        cache.get_prices(['AAPL'])
+    assert not cache.is_missing('AAPL')
+    assert cache.get_prices(['AAPL'], max_age=0)
+
+
+def test_empty_quote_is_not_negative_cached():
+    # The first quote comes back without a price, but not as not found
+    class Flaky(FakeQuoteProvider):
+        def get_quote(self, symbol):
+            if not self.calls:
+                self.calls += 1
+                return {'symbol': symbol, 'price': None, 'currency': None,
+                        'market_state': 'Unknown', 'name': symbol, 'not_found': False}
+            return super().get_quote(symbol)
+
+    provider = Flaky(prices={'AAPL': 10.0})
+    cache = QuoteCache(provider=provider)
+    assert cache.get_quote('AAPL')['price'] is None
+    assert not cache.is_missing('AAPL')
+    assert cache.get_prices(['AAPL'], max_age=0) == {'AAPL': 10.0}
+
+
+def test_not_found_quote_is_negative_cached():
+    provider = FakeQuoteProvider(missing=['GONE'])
+    cache = QuoteCache(provider=provider)
+    assert cache.get_quote('GONE')['not_found']
+    assert cache.is_missing('GONE')
+    assert cache.get_prices(['GONE'], max_age=0) == {}
+    assert provider.calls == 1
+
+
+# PriceResult statuses
+
+def test_get_current_prices_maps_statuses(global_cache):
+    quote_cache.set_quote_cache(QuoteCache(provider=FakeQuoteProvider(
+        prices={'AAPL': 10.0}, missing=['GONE'])))
+
+    results = stock_utils.get_current_prices(['aapl', 'GONE'])
+    assert results['AAPL'] == PriceResult('AAPL', 10.0)
+    assert results['AAPL'].ok
+    assert results['GONE'].status == NOT_FOUND
+    assert results['GONE'].price is None
+
+
+def test_get_current_prices_reports_unavailable(global_cache):
+    provider, _ = resilient(FaultyQuoteProvider(failures=3), attempts=3)
+    quote_cache.set_quote_cache(QuoteCache(provider=provider))
+
+    results = stock_utils.get_current_prices(['AAPL', 'MSFT'])
+    assert {r.status for r in results.values()} == {UNAVAILABLE}
+    assert 'Injected failure' in results['AAPL'].error
+
+
+def test_get_current_prices_reports_open_circuit(global_cache):
+    provider, _ = resilient(FaultyQuoteProvider(failures=1), attempts=1, failure_threshold=1)
+    quote_cache.set_quote_cache(QuoteCache(provider=provider))
+    stock_utils.get_current_prices(['AAPL'])
+
+    results = stock_utils.get_current_prices(['AAPL'])
+    assert results['AAPL'].status == CIRCUIT_OPEN
+
+
+def test_get_current_price_rejects_an_empty_symbol():
+    result = stock_utils.get_current_price('  ')
+    assert result.status == NOT_FOUND
+    assert not result.ok
+
+
+# Yahoo errors
+
+def test_yahoo_outage_raises_and_delisted_symbols_are_not_found(monkeypatch):
+    yf = pytest.importorskip('yfinance')
+    import logging
+    from utils.quote_provider import YahooQuoteProvider
+
+    errors = {}
+
+    def download(symbols, **kwargs):
+        for symbol in symbols:
+            logging.getLogger('yfinance').error(f"{[symbol]}: {errors[symbol]}")
+        return None
+
+    monkeypatch.setattr(yf, 'download', download)
+    provider = YahooQuoteProvider()
+
+    errors.update(AAPL="YFRateLimitError('Too Many Requests. Rate limited. Try after a while.')")
+    with pytest.raises(QuoteUnavailableError):
+        provider.get_prices(['AAPL'])
+
+    errors.update(GONE='possibly delisted; no price data found  (period=5d)')
+    prices = provider.get_prices(['GONE'])
+    assert prices == {}
+    assert prices.not_found == {'GONE'}
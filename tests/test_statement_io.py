@@ -0,0 +1,53 @@
+"""Broker statement parsing."""
+import io
+import logging
+
+from utils.statement_io import read_statement_csv
+
+
+def parse(text):
+    return list(read_statement_csv(io.StringIO(text)))
+
+
+def test_header_is_found_after_a_preamble():
+    lots = parse("Account: 123\n"
+                 "As of 2024-01-31\n"
+                 "\n"
+                 "Ticker,Shares,Avg Cost,Last Price,Currency\n"
+                 "aapl,10,$150.00,$190.50,USD\n"
+                 "Total,,,,\n")
+    assert len(lots) == 1
+    lot = lots[0]
+    assert (lot.symbol, lot.quantity, lot.purchase_price, lot.current_price, lot.currency) == \
+        ('AAPL', 10, 150.0, 190.5, 'USD')
+
+
+def test_purchase_price_from_cost_basis_and_missing_current_price():
+    lot, = parse("Symbol,Quantity,Cost Basis\nMSFT,4,\"1,000.00\"\n")
+    assert lot.purchase_price == 250.0
+    assert lot.current_price == 250.0
+
+
+def test_fractional_quantities_are_kept():
+    whole, fractional = parse("Symbol,Quantity,Price Paid\nAAPL,3.0,10\nVTI,0.25,200\n")
+    assert whole.quantity == 3 and isinstance(whole.quantity, int)
+    assert fractional.quantity == 0.25
+
+
+def test_rows_that_are_not_holdings_are_skipped(caplog):
+    caplog.set_level(logging.INFO, logger='utils.statement_io')
+    lots = parse("Symbol,Quantity,Price Paid,Last Price\n"
+                 "AAPL,\"1,000\",(12.00),15\n"   # credit line
+                 "FEE,1,10,(2.50)\n"
+                 "CASH,0,1,1\n"
+                 "SHORT,-5,10,10\n"
+                 "NAN,nan,10,10\n"
+                 "INF,1,inf,10\n"
+                 "MSFT,2,300,310\n")
+    assert [lot.symbol for lot in lots] == ['MSFT']
+    assert "Skipped 6 rows" in caplog.text
+
+
+def test_semicolon_delimited_files_are_read():
+    lot, = parse("symbol;qty;unit cost\nSAP.DE;5;120.5\n")
+    assert (lot.symbol, lot.quantity, lot.purchase_price) == ('SAP.DE', 5, 120.5)
@@ -1,11 +1,21 @@
-from .stock_utils import get_current_price
-from .db_utils import init_db, save_stock, load_stocks, update_stock, remove_stock
+from .stock_utils import get_current_price, get_current_prices
+from .resilience import PriceResult
+from .portfolio import Lot, Portfolio
+from .db_utils import (init_db, save_stock, load_stocks, update_stock, remove_stock,
+                       save_stocks_many, update_prices_many, close_connections)
 
 __all__ = [
     'get_current_price',
+    'get_current_prices',
+    'PriceResult',
+    'Lot',
+    'Portfolio',
     'init_db',
     'save_stock',
     'load_stocks',
     'update_stock',
-    'remove_stock'
-] 
\ No newline at end of file
+    'remove_stock',
+    'save_stocks_many',
+    'update_prices_many',
+    'close_connections'
+]
@@ -0,0 +1,411 @@
+from operator import attrgetter
+
+import numpy as np
+
+# Per-lot input arrays and the Lot field each is read from
+_LOT_COLUMNS = (('quantities', 'quantity'), ('purchase_prices', 'purchase_price'),
+                ('current_prices', 'current_price'))
+
+# Per-lot arrays derived from them
+_DERIVED_COLUMNS = ('costs', 'values', 'pnl', 'change_pct')
+
+# Per-symbol arrays; the _local ones are in the symbol's own currency
+_SYMBOL_COLUMNS = ('_symbol_currency_codes', '_symbol_lot_counts', 'symbol_quantities',
+                   '_symbol_local_costs', '_symbol_local_values', 'symbol_costs', 'symbol_values')
+
+class PortfolioAnalytics:
+    """Vectorized valuation of a portfolio of lots.
+
+    Quantities and prices are held as NumPy arrays (one element per lot, in
+    portfolio order), and each lot has an integer symbol code so per-symbol
+    aggregates are a single np.bincount. update_prices changes only the lots
+    and symbols involved and adjusts the totals by the difference, so a
+    streaming refresh never revalues the whole portfolio. Replacing a lot
+    adjusts its symbol's aggregates by the difference in the same way.
+    Adding or removing one inserts or deletes an element of each per-lot
+    array, which NumPy does by copying the array (no Python-level pass),
+    and adjusts the aggregates by that lot's contribution. Only load() and
+    recompute() revalue every lot.
+
+    Per-lot arrays (costs, values, pnl, change_pct) are in each lot's own
+    currency. Per-symbol aggregates and the totals are in the base currency
+    given to set_rates: each symbol has an index into the distinct
+    currencies held, so converting is one gather of a small rate table and
+    a multiply per symbol. Symbol aggregates are also kept in their own
+    currency, so set_rates and set_currencies only reconvert the per-symbol
+    table. Symbols whose currency has no rate cannot be valued in the base
+    currency: their aggregates are NaN, they are left out of the totals, and
+    unconverted_totals() reports them separately.
+    """
+
+    def __init__(self, portfolio=()):
+        self.base_currency = None
+        self.rates = {}
+        self.load(portfolio)
+
+    def load(self, portfolio):
+        """Rebuild every array from a Portfolio (or any sequence of Lots)."""
+        self.symbols = []
+        self._codes_by_symbol = {}
+        self.currencies = []
+        currency_codes = {}
+        symbol_currencies = []
+        codes = []
+        for lot in portfolio:
+            symbol = lot.symbol.strip().upper()
+            code = self._codes_by_symbol.get(symbol)
+            if code is None:
+                code = self._codes_by_symbol[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+                # A symbol is quoted in one currency; its first lot says which
+                currency_code = currency_codes.get(lot.currency)
+                if currency_code is None:
+                    currency_code = currency_codes[lot.currency] = len(self.currencies)
+                    self.currencies.append(lot.currency)
+                symbol_currencies.append(currency_code)
+            codes.append(code)
+        self.codes = np.array(codes, dtype=np.intp)
+        self._symbol_currency_codes = np.array(symbol_currencies, dtype=np.intp)
+        for name, field in _LOT_COLUMNS:
+            setattr(self, name, self._column(portfolio, field))
+        self._order = self._bounds = None
+        self._apply_rates()
+        self.recompute()
+
+    def _rows_for(self, code):
+        """Return the lot indices of symbol code, in ascending order.
+
+        The index is built on first use: _order holds the rows grouped by
+        symbol, and symbol code's rows are _order[_bounds[code]:_bounds[code + 1]].
+        Adding and removing lots then patch it in place.
+        """
+        if self._order is None:
+            self._order = np.argsort(self.codes, kind='stable')
+            self._bounds = np.searchsorted(self.codes[self._order], np.arange(len(self.symbols) + 1))
+        return self._order[self._bounds[code]:self._bounds[code + 1]]
+
+    def _index_insert(self, row, code):
+        """Add row, just inserted with symbol code, to the row index."""
+        if self._order is None:
+            return
+        self._order[self._order >= row] += 1
+        position = self._bounds[code] + np.searchsorted(self._rows_for(code), row)
+        self._order = np.insert(self._order, position, row)
+        self._bounds[code + 1:] += 1
+
+    def _index_remove(self, row, code):
+        """Take row, about to be removed from symbol code, out of the row index."""
+        if self._order is None:
+            return
+        position = self._bounds[code] + np.searchsorted(self._rows_for(code), row)
+        self._order = np.delete(self._order, position)
+        self._order[self._order > row] -= 1
+        self._bounds[code + 1:] -= 1
+
+    def _currency_code(self, currency):
+        if currency in self.currencies:
+            return self.currencies.index(currency)
+        self.currencies.append(currency)
+        return len(self.currencies) - 1
+
+    def _symbol_code(self, symbol, currency):
+        """Return the code of symbol, adding it (quoted in currency) if it is new."""
+        code = self._codes_by_symbol.get(symbol)
+        if code is not None:
+            return code
+        code = self._codes_by_symbol[symbol] = len(self.symbols)
+        self.symbols.append(symbol)
+        self._symbol_currency_codes = np.append(self._symbol_currency_codes,
+                                                self._currency_code(currency))
+        for name in _SYMBOL_COLUMNS[1:]:
+            setattr(self, name, np.append(getattr(self, name), 0))
+        if self._order is not None:
+            self._bounds = np.append(self._bounds, self._bounds[-1])
+        self._apply_rates()
+        return code
+
+    def _drop_symbol(self, code):
+        """Forget symbol code, which no lot holds any more."""
+        self.codes[self.codes > code] -= 1
+        del self.symbols[code]
+        self._codes_by_symbol = {symbol: i for i, symbol in enumerate(self.symbols)}
+        for name in _SYMBOL_COLUMNS:
+            setattr(self, name, np.delete(getattr(self, name), code))
+        if self._order is not None:
+            # Its rows are gone, so its bounds are equal
+            self._bounds = np.delete(self._bounds, code + 1)
+        self._prune_currencies()
+        self._apply_rates()
+
+    def _prune_currencies(self):
+        """Drop currencies no symbol is quoted in any more."""
+        used = np.unique(self._symbol_currency_codes)
+        if len(used) == len(self.currencies):
+            return
+        remap = np.full(len(self.currencies), -1, dtype=np.intp)
+        remap[used] = np.arange(len(used))
+        self.currencies = [self.currencies[i] for i in used]
+        self._symbol_currency_codes = remap[self._symbol_currency_codes]
+
+    def _add_to_symbol(self, code, quantity, cost, value):
+        """Add one lot's quantity, cost and value (negative to remove it) to its symbol."""
+        fx = self.symbol_fx[code]
+        self.symbol_quantities[code] += quantity
+        self._symbol_local_costs[code] += cost
+        self._symbol_local_values[code] += value
+        self.symbol_costs[code] += cost * fx
+        self.symbol_values[code] += value * fx
+        if self._converted[code]:
+            self.total_cost += float(cost * fx)
+            self.total_value += float(value * fx)
+
+    def append_lot(self, lot):
+        """Add lot as the last row."""
+        self.insert_lot(len(self.codes), lot)
+
+    def insert_lot(self, row, lot):
+        """Insert lot at row; the rows after it move down by one."""
+        code = self._symbol_code(lot.symbol.strip().upper(), lot.currency)
+        self.codes = np.insert(self.codes, row, code)
+        for name, field in _LOT_COLUMNS:
+            setattr(self, name, np.insert(getattr(self, name), row, getattr(lot, field)))
+        for name, value in zip(_DERIVED_COLUMNS, self._derived(row)):
+            setattr(self, name, np.insert(getattr(self, name), row, value))
+        self._add_to_symbol(code, self.quantities[row], self.costs[row], self.values[row])
+        self._symbol_lot_counts[code] += 1
+        self._index_insert(row, code)
+
+    def remove_lot(self, row):
+        """Remove the lot at row; the rows after it move up by one."""
+        code = int(self.codes[row])
+        self._add_to_symbol(code, -self.quantities[row], -self.costs[row], -self.values[row])
+        self._symbol_lot_counts[code] -= 1
+        self._index_remove(row, code)
+        self.codes = np.delete(self.codes, row)
+        for name in [name for name, _ in _LOT_COLUMNS] + list(_DERIVED_COLUMNS):
+            setattr(self, name, np.delete(getattr(self, name), row))
+        if not self._symbol_lot_counts[code]:
+            self._drop_symbol(code)
+
+    def replace_lot(self, row, lot):
+        """Revalue row from lot, e.g. after it was edited.
+
+        A symbol whose currency was unknown takes lot's currency.
+        """
+        code = int(self.codes[row])
+        if self._codes_by_symbol.get(lot.symbol.strip().upper()) != code:
+            self.remove_lot(row)
+            self.insert_lot(row, lot)
+            return
+        self._add_to_symbol(code, -self.quantities[row], -self.costs[row], -self.values[row])
+        for name, field in _LOT_COLUMNS:
+            getattr(self, name)[row] = getattr(lot, field)
+        for name, value in zip(_DERIVED_COLUMNS, self._derived(row)):
+            getattr(self, name)[row] = value
+        self._add_to_symbol(code, self.quantities[row], self.costs[row], self.values[row])
+        if lot.currency is not None and self.currencies[self._symbol_currency_codes[code]] is None:
+            self.set_currencies({self.symbols[code]: lot.currency})
+
+    def _derived(self, row):
+        """Return (cost, value, pnl, change_pct) of row from its inputs."""
+        quantity, purchase, current = (getattr(self, name)[row] for name, _ in _LOT_COLUMNS)
+        cost, value = quantity * purchase, quantity * current
+        return cost, value, value - cost, self._change_pct(current, purchase)
+
+    def set_currencies(self, currencies):
+        """Set the currency of each symbol from a symbol -> currency dict and revalue.
+
+        No per-lot array changes; only the per-symbol table is reconverted.
+        """
+        changed = False
+        for symbol, currency in currencies.items():
+            code = self._codes_by_symbol.get(symbol.strip().upper())
+            if code is not None and self.currencies[self._symbol_currency_codes[code]] != currency:
+                self._symbol_currency_codes[code] = self._currency_code(currency)
+                changed = True
+        if changed:
+            self._prune_currencies()
+            self._apply_rates()
+            self._convert_symbols()
+
+    def symbols_in(self, currency):
+        """Return the symbols quoted in currency (None: not looked up yet)."""
+        if currency not in self.currencies:
+            return []
+        code = self.currencies.index(currency)
+        return [self.symbols[i] for i in np.flatnonzero(self._symbol_currency_codes == code)]
+
+    def set_rates(self, rates, base_currency=None):
+        """Value the portfolio in base_currency using rates.
+
+        rates maps currency to base units per unit, as from FxRates.get_rates.
+        Lots with no currency, or already in base_currency, count as base.
+        Currencies without a rate are listed in self.unconverted and their
+        lots are left out of the totals.
+        """
+        self.rates = dict(rates)
+        self.base_currency = base_currency
+        self._apply_rates()
+        self._convert_symbols()
+
+    def _apply_rates(self):
+        table = np.ones(len(self.currencies), dtype=np.float64)
+        self.unconverted = []
+        for i, currency in enumerate(self.currencies):
+            if currency is None or currency == self.base_currency:
+                continue
+            if currency in self.rates:
+                table[i] = self.rates[currency]
+            else:
+                table[i] = np.nan
+                self.unconverted.append(currency)
+        # Base units per unit of each symbol's currency; NaN where there is no rate
+        self.symbol_fx = table[self._symbol_currency_codes]
+        self._converted = ~np.isnan(self.symbol_fx)
+
+    @staticmethod
+    def _column(portfolio, field):
+        return np.fromiter(map(attrgetter(field), portfolio), dtype=np.float64, count=len(portfolio))
+
+    def recompute(self):
+        """Recalculate every derived array and total in full vectorized passes."""
+        n_symbols = len(self.symbols)
+        self.costs = self.quantities * self.purchase_prices
+        self.values = self.quantities * self.current_prices
+        self.pnl = self.values - self.costs
+        self.change_pct = self._change_pct(self.current_prices, self.purchase_prices)
+
+        self._symbol_lot_counts = np.bincount(self.codes, minlength=n_symbols)
+        self.symbol_quantities = np.bincount(self.codes, weights=self.quantities, minlength=n_symbols)
+        self._symbol_local_costs = np.bincount(self.codes, weights=self.costs, minlength=n_symbols)
+        self._symbol_local_values = np.bincount(self.codes, weights=self.values, minlength=n_symbols)
+        self._convert_symbols()
+
+    def _convert_symbols(self):
+        """Convert the per-symbol aggregates to the base currency and total them."""
+        # Unconverted symbols have NaN fx, so they come out NaN
+        self.symbol_costs = self._symbol_local_costs * self.symbol_fx
+        self.symbol_values = self._symbol_local_values * self.symbol_fx
+        self.total_cost = float(self.symbol_costs[self._converted].sum())
+        self.total_value = float(self.symbol_values[self._converted].sum())
+
+    @staticmethod
+    def _change_pct(current, purchase):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(purchase != 0, (current - purchase) / purchase * 100, 0.0)
+
+    def update_prices(self, prices):
+        """Apply symbol -> price changes, touching only the affected lots."""
+        for symbol, price in prices.items():
+            code = self._codes_by_symbol.get(symbol)
+            if code is None:
+                continue
+            rows = self._rows_for(code)
+            self.current_prices[rows] = price
+            new_values = self.quantities[rows] * price
+            local_delta = new_values.sum() - self.values[rows].sum()
+            delta = float(local_delta * self.symbol_fx[code])
+            self.values[rows] = new_values
+            self.pnl[rows] = new_values - self.costs[rows]
+            self.change_pct[rows] = self._change_pct(self.current_prices[rows], self.purchase_prices[rows])
+            self._symbol_local_values[code] += local_delta
+            if self._converted[code]:
+                self.symbol_values[code] += delta
+                self.total_value += delta
+
+    @property
+    def unrealized_pnl(self):
+        return self.total_value - self.total_cost
+
+    @property
+    def total_change_pct(self):
+        return (self.unrealized_pnl / self.total_cost * 100) if self.total_cost else 0.0
+
+    @property
+    def weights(self):
+        """Share of total (base currency) value held in each lot; 0 for unconverted lots."""
+        if not self.total_value:
+            return np.zeros_like(self.values)
+        lot_fx = np.where(self._converted, self.symbol_fx, 0.0)[self.codes]
+        return self.values * lot_fx / self.total_value
+
+    def unconverted_totals(self):
+        """Return {currency: {'total_value', 'total_cost'}} for currencies without a rate.
+
+        Those lots are not in totals(); the amounts are in their own currency.
+        Read from the per-symbol aggregates, so no lot is visited.
+        """
+        if not self.unconverted:
+            return {}
+        n_currencies = len(self.currencies)
+        values = np.bincount(self._symbol_currency_codes, weights=self._symbol_local_values,
+                             minlength=n_currencies)
+        costs = np.bincount(self._symbol_currency_codes, weights=self._symbol_local_costs,
+                            minlength=n_currencies)
+        totals = {}
+        for currency in self.unconverted:
+            code = self.currencies.index(currency)
+            totals[currency] = {'total_value': float(values[code]), 'total_cost': float(costs[code])}
+        return totals
+
+    def symbol_summary(self):
+        """Return per-symbol aggregates across all lots, largest position first.
+
+        value, cost and unrealized_pnl are in the base currency. They are
+        NaN, with weight 0, for symbols whose currency has no rate; those
+        come last.
+        """
+        symbol_pnl = self.symbol_values - self.symbol_costs
+        if self.total_value:
+            weights = np.where(self._converted, self.symbol_values, 0.0) / self.total_value
+        else:
+            weights = np.zeros_like(self.symbol_values)
+        # argsort puts NaN last
+        order = np.argsort(-self.symbol_values, kind='stable')
+        return [{
+            'symbol': self.symbols[code],
+            'currency': self.currencies[self._symbol_currency_codes[code]],
+            'quantity': float(self.symbol_quantities[code]),
+            'value': float(self.symbol_values[code]),
+            'cost': float(self.symbol_costs[code]),
+            'unrealized_pnl': float(symbol_pnl[code]),
+            'weight': float(weights[code]),
+        } for code in order]
+
+    def totals(self):
+        """Return portfolio-level totals, in the base currency, as a dict.
+
+        Lots in currencies without a rate are not included; 'unconverted'
+        holds their totals per currency (see unconverted_totals).
+        """
+        return {
+            'currency': self.base_currency,
+            'total_value': self.total_value,
+            'total_cost': self.total_cost,
+            'unrealized_pnl': self.unrealized_pnl,
+            'change_pct': self.total_change_pct,
+            'unconverted': self.unconverted_totals(),
+        }
+
+    def value_history(self, closes):
+        """Return (dates, values): the current holdings valued at each past close.
+
+        closes maps symbol to (dates, closes) arrays, such as the memory-mapped
+        views from ohlc_store.load_closes. Each symbol's last close on or
+        before a date is used, so markets with different holidays line up.
+        Values are in the base currency at today's rates; symbols whose
+        currency has no rate are left out.
+        """
+        series = [(self._codes_by_symbol[symbol], dates, prices)
+                  for symbol, (dates, prices) in closes.items()
+                  if symbol in self._codes_by_symbol and len(dates)
+                  and self._converted[self._codes_by_symbol[symbol]]]
+        if not series:
+            return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+        all_dates = np.unique(np.concatenate([dates for _, dates, _ in series]))
+        values = np.zeros(len(all_dates), dtype=np.float64)
+        for code, dates, prices in series:
+            index = np.searchsorted(dates, all_dates, side='right') - 1
+            held = index >= 0
+            values[held] += self.symbol_quantities[code] * self.symbol_fx[code] * prices[index[held]]
+        return all_dates, values
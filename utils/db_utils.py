@@ -1,18 +1,122 @@
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import starmap
 from pathlib import Path
 
+from utils.instrumentation import timed
+from utils.portfolio import LOT_FIELDS, Lot, Portfolio
+
+# Applied to every new connection. WAL lets readers run alongside the
+# writer, and synchronous=NORMAL only fsyncs at checkpoints in WAL mode.
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA temp_store=MEMORY',
+)
+
+_db_path = None
+
 def get_db_path():
-    """Get the path to the SQLite database file."""
-    return Path('portfolio.db')
+    """Get the path to the SQLite database file.
 
-def init_db():
-    """Initialize the database with the required table."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    # Create stocks table if it doesn't exist
-    cursor.execute('''
+    Defaults to $PORTFOLIO_DB, or portfolio.db in the working directory.
+    """
+    if _db_path is not None:
+        return _db_path
+    return Path(os.environ.get('PORTFOLIO_DB', 'portfolio.db'))
+
+def set_db_path(path):
+    """Use the database at path from now on (None restores the default)."""
+    global _db_path
+    _db_path = Path(path) if path is not None else None
+
+class ConnectionManager:
+    """Keeps one reusable SQLite connection per thread for a database file.
+
+    Connections are opened lazily with CONNECTION_PRAGMAS applied. Each
+    thread reuses its own connection, so refresh worker threads never share
+    a connection object.
+    """
+
+    def __init__(self, db_path, timeout=5.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._close_dead_threads()
+                self._connections[threading.get_ident()] = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor; commit on success and roll back on error."""
+        conn = self.connection()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _close_dead_threads(self):
+        alive = {thread.ident for thread in threading.enumerate()}
+        for ident in [i for i in self._connections if i not in alive]:
+            self._connections.pop(ident).close()
+
+    def close_all(self):
+        """Close every connection opened by this manager."""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_connection_manager():
+    """Return the connection manager for the current database path."""
+    global _manager
+    db_path = get_db_path()
+    with _manager_lock:
+        if _manager is None or Path(_manager.db_path) != Path(db_path):
+            if _manager is not None:
+                _manager.close_all()
+            _manager = ConnectionManager(db_path)
+        return _manager
+
+def close_connections():
+    """Close all pooled connections (e.g. on application exit)."""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close_all()
+            _manager = None
+
+# Each entry upgrades the schema by one version; PRAGMA user_version records
+# how many have been applied. Only ever append to this list.
+SCHEMA_MIGRATIONS = [
+    (
+        '''
         CREATE TABLE IF NOT EXISTS stocks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             symbol TEXT NOT NULL,
@@ -21,91 +125,279 @@ def init_db():
             current_price REAL NOT NULL,
             date_added TEXT NOT NULL
         )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-def save_stock(stock_data):
-    """Save a new stock to the database."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO stocks (symbol, quantity, purchase_price, current_price, date_added)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
-        stock_data['symbol'],
-        stock_data['quantity'],
-        stock_data['purchase_price'],
-        stock_data['current_price'],
-        stock_data.get('date_added', datetime.now().isoformat())
-    ))
-    
-    conn.commit()
-    conn.close()
+        ''',
+    ),
+    (
+        'CREATE INDEX IF NOT EXISTS idx_stocks_symbol ON stocks (symbol)',
+        'CREATE INDEX IF NOT EXISTS idx_stocks_date_added ON stocks (date_added)',
+    ),
+    (
+        # Raw quotes, one row per symbol per fetch time (unix seconds)
+        '''
+        CREATE TABLE IF NOT EXISTS price_history (
+            symbol TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            price REAL NOT NULL,
+            PRIMARY KEY (symbol, ts)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_price_history_ts ON price_history (ts)',
+        # Daily bars rolled up from ticks older than the retention window
+        '''
+        CREATE TABLE IF NOT EXISTS price_daily (
+            symbol TEXT NOT NULL,
+            day TEXT NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            ticks INTEGER NOT NULL,
+            PRIMARY KEY (symbol, day)
+        ) WITHOUT ROWID
+        ''',
+    ),
+    (
+        # Locally cached symbol lists (S&P 500, other indices, exchange listings)
+        '''
+        CREATE TABLE IF NOT EXISTS universes (
+            name TEXT PRIMARY KEY,
+            source TEXT,
+            refreshed_at REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS universe_symbols (
+            universe TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (universe, symbol)
+        ) WITHOUT ROWID
+        ''',
+    ),
+    (
+        # Company name, currency and exchange per symbol, with fetch time
+        '''
+        CREATE TABLE IF NOT EXISTS symbol_metadata (
+            symbol TEXT PRIMARY KEY,
+            name TEXT,
+            currency TEXT,
+            exchange TEXT,
+            fetched_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ),
+    (
+        # Transactions ledger; positions and open FIFO tax lots are kept
+        # current by utils.ledger as each transaction is recorded
+        '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('buy', 'sell', 'dividend', 'split')),
+            quantity REAL NOT NULL DEFAULT 0,
+            price REAL NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            ratio REAL NOT NULL DEFAULT 1,
+            fees REAL NOT NULL DEFAULT 0,
+            date TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_symbol ON transactions (symbol, id)',
+        '''
+        CREATE TABLE IF NOT EXISTS positions (
+            symbol TEXT PRIMARY KEY,
+            quantity REAL NOT NULL,
+            cost_basis REAL NOT NULL,
+            fifo_cost_basis REAL NOT NULL,
+            realized_pnl REAL NOT NULL,
+            fifo_realized_pnl REAL NOT NULL,
+            dividends REAL NOT NULL,
+            fees REAL NOT NULL,
+            last_transaction_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tax_lots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            transaction_id INTEGER NOT NULL,
+            quantity REAL NOT NULL,
+            cost_per_share REAL NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_tax_lots_symbol ON tax_lots (symbol, id)',
+    ),
+    (
+        # When current_price was fetched (unix seconds); NULL means unknown
+        'ALTER TABLE stocks ADD COLUMN price_updated_at REAL',
+    ),
+    (
+        # Currency the symbol is quoted in; NULL until looked up
+        'ALTER TABLE stocks ADD COLUMN currency TEXT',
+    ),
+]
+
+def get_schema_version(cursor):
+    """Return the schema version stored in the database."""
+    cursor.execute('PRAGMA user_version')
+    return cursor.fetchone()[0]
+
+@timed('db_seconds')
+def init_db():
+    """Create the database if needed and apply any pending schema migrations."""
+    with get_connection_manager().transaction() as cursor:
+        version = get_schema_version(cursor)
+        if version >= len(SCHEMA_MIGRATIONS):
+            return
+        # DDL does not open a transaction implicitly, so start one to make
+        # the whole upgrade atomic
+        cursor.execute('BEGIN')
+        for statements in SCHEMA_MIGRATIONS[version:]:
+            for statement in statements:
+                cursor.execute(statement)
+        cursor.execute(f'PRAGMA user_version = {len(SCHEMA_MIGRATIONS)}')
+
+# Columns in Lot() argument order, which takes the id last
+_LOT_QUERY = f'SELECT {", ".join(LOT_FIELDS[1:] + LOT_FIELDS[:1])} FROM stocks ORDER BY id'
 
+def _lot_row(lot, now):
+    return (lot.symbol, lot.quantity, lot.purchase_price, lot.current_price,
+            lot.date_added or now, lot.price_updated_at, lot.currency)
+
+@timed('db_seconds')
+def save_stock(lot):
+    """Save a new Lot to the database and return its row id.
+
+    The lot's id is set to the new row id, and its date_added to now if it
+    had none. price_updated_at may be None when the current price was not
+    fetched, and currency when it is not known yet.
+    """
+    if lot.date_added is None:
+        lot.date_added = datetime.now().isoformat()
+    with get_connection_manager().transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO stocks (symbol, quantity, purchase_price, current_price, date_added,
+                                price_updated_at, currency)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', _lot_row(lot, lot.date_added))
+        lot.id = cursor.lastrowid
+        return lot.id
+
+@timed('db_seconds')
+def save_stocks_many(lots):
+    """Insert many Lots with a single executemany in one transaction.
+
+    Accepts any iterable of lots, so rows can be streamed in. Lots without
+    a date_added get the current time. Returns the number of rows inserted.
+    """
+    now = datetime.now().isoformat()
+    with get_connection_manager().transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO stocks (symbol, quantity, purchase_price, current_price, date_added,
+                                price_updated_at, currency)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (_lot_row(lot, now) for lot in lots))
+        return cursor.rowcount
+
+@timed('db_seconds')
 def load_stocks():
-    """Load all stocks from the database."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT symbol, quantity, purchase_price, current_price, date_added FROM stocks')
-    rows = cursor.fetchall()
-    
-    stocks = []
-    for row in rows:
-        stocks.append({
-            'symbol': row[0],
-            'quantity': row[1],
-            'purchase_price': row[2],
-            'current_price': row[3],
-            'date_added': row[4]
-        })
-    
-    conn.close()
-    return stocks
-
-def update_stock(stock_data, index):
-    """Update a stock in the database by its index."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    # Get the ID of the stock at the given index
-    cursor.execute('SELECT id FROM stocks LIMIT 1 OFFSET ?', (index,))
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
-        return False
-    
-    stock_id = result[0]
-    
-    cursor.execute('''
-        UPDATE stocks 
-        SET current_price = ?
-        WHERE id = ?
-    ''', (stock_data['current_price'], stock_id))
-    
-    conn.commit()
-    conn.close()
-    return True
-
-def remove_stock(index):
-    """Remove a stock from the database by its index."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    # Get the ID of the stock at the given index
-    cursor.execute('SELECT id FROM stocks LIMIT 1 OFFSET ?', (index,))
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
-        return False
-    
-    stock_id = result[0]
-    
-    cursor.execute('DELETE FROM stocks WHERE id = ?', (stock_id,))
-    
-    conn.commit()
-    conn.close()
-    return True 
\ No newline at end of file
+    """Load all stocks from the database as a Portfolio of Lots, in id order.
+
+    The rows are fetched as plain tuples and each is passed straight to
+    Lot(), which is cheaper than building lots in a Python row factory.
+    """
+    cursor = get_connection_manager().connection().cursor()
+    cursor.execute(_LOT_QUERY)
+    portfolio = Portfolio(starmap(Lot, cursor.fetchall()))
+    cursor.close()
+    return portfolio
+
+def iter_stocks(batch_size=1000):
+    """Yield Lots one at a time, fetching batch_size rows per round-trip.
+
+    Unlike load_stocks, memory use does not grow with the portfolio size.
+    """
+    cursor = get_connection_manager().connection().cursor()
+    cursor.arraysize = batch_size
+    try:
+        cursor.execute(_LOT_QUERY)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            yield from starmap(Lot, rows)
+    finally:
+        cursor.close()
+
+@timed('db_seconds')
+def load_symbols():
+    """Return the distinct symbols held in the portfolio."""
+    cursor = get_connection_manager().connection().cursor()
+    cursor.execute('SELECT DISTINCT symbol FROM stocks ORDER BY symbol')
+    symbols = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return symbols
+
+@timed('db_seconds')
+def load_symbols_without_currency():
+    """Return the distinct symbols held whose currency has not been looked up."""
+    cursor = get_connection_manager().connection().cursor()
+    cursor.execute('SELECT DISTINCT symbol FROM stocks WHERE currency IS NULL ORDER BY symbol')
+    symbols = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return symbols
+
+@timed('db_seconds')
+def update_stock(lot):
+    """Update the current price of the stored lot with lot.id.
+
+    The price is stamped with lot.price_updated_at as it is, so a lot whose
+    price was never fetched stays unstamped. Only a changed price without a
+    timestamp is stamped now. lot.currency is stored too unless it is None.
+    """
+    with get_connection_manager().transaction() as cursor:
+        # The right-hand sides see the stored row, so current_price is the old price
+        cursor.execute('''
+            UPDATE stocks 
+            SET current_price = ?,
+                price_updated_at = CASE WHEN ? IS NULL AND current_price IS NOT ? THEN ? ELSE ? END,
+                currency = COALESCE(?, currency)
+            WHERE id = ?
+        ''', (lot.current_price, lot.price_updated_at, lot.current_price, time.time(),
+              lot.price_updated_at, lot.currency, lot.id))
+        return cursor.rowcount > 0
+
+@timed('db_seconds')
+def remove_stock(stock_id):
+    """Remove a stock from the database by its row id."""
+    with get_connection_manager().transaction() as cursor:
+        cursor.execute('DELETE FROM stocks WHERE id = ?', (stock_id,))
+        return cursor.rowcount > 0
+
+@timed('db_seconds')
+def update_prices_many(prices, fetched_at=None):
+    """Set the current price of every lot of each symbol in one transaction.
+
+    prices maps symbol to price, fetched at unix time fetched_at (default
+    now). Lots are matched through the symbol index, so all lots holding a
+    symbol are updated by a single statement. Returns the number of rows
+    updated.
+    """
+    fetched_at = time.time() if fetched_at is None else fetched_at
+    with get_connection_manager().transaction() as cursor:
+        cursor.executemany(
+            'UPDATE stocks SET current_price = ?, price_updated_at = ? WHERE symbol = ?',
+            ((price, fetched_at, symbol) for symbol, price in prices.items())
+        )
+        return cursor.rowcount
+
+@timed('db_seconds')
+def update_currencies_many(currencies):
+    """Set the currency of every lot of each symbol, from a symbol -> currency dict.
+
+    Returns the number of rows updated.
+    """
+    with get_connection_manager().transaction() as cursor:
+        cursor.executemany('UPDATE stocks SET currency = ? WHERE symbol = ?',
+                           ((currency, symbol) for symbol, currency in currencies.items()))
+        return cursor.rowcount
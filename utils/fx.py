@@ -0,0 +1,102 @@
+"""Currency conversion for valuing a portfolio in one base currency.
+
+FxRates fetches exchange rates as ordinary quotes of Yahoo currency pairs
+(EURUSD=X is the price of one euro in dollars). All the rates a refresh
+needs are requested in one batch, through a QuoteCache of their own with a
+longer TTL than stock quotes, so most refreshes make no FX request at all.
+"""
+import logging
+import os
+
+from utils.db_utils import update_currencies_many
+from utils.quote_cache import QuoteCache
+from utils.symbol_metadata import fetch_metadata
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_CURRENCY = 'USD'
+
+# Rates move slowly compared to quotes; refetching every 15 minutes is plenty
+FX_TTL = 15 * 60
+
+# Some exchanges quote in a minor unit: (major currency, major units per minor unit)
+MINOR_UNITS = {
+    'GBp': ('GBP', 0.01),
+    'GBX': ('GBP', 0.01),
+    'ZAc': ('ZAR', 0.01),
+    'ZAC': ('ZAR', 0.01),
+    'ILA': ('ILS', 0.01),
+}
+
+def get_base_currency():
+    """Return $PORTFOLIO_BASE_CURRENCY, or USD."""
+    return os.environ.get('PORTFOLIO_BASE_CURRENCY', DEFAULT_BASE_CURRENCY).upper()
+
+def pair_symbol(currency, base):
+    """Return the Yahoo symbol quoting currency in base, e.g. EURUSD=X."""
+    return f'{currency}{base}=X'
+
+class FxRates:
+    """Conversion rates to a base currency, cached for ttl seconds."""
+
+    def __init__(self, ttl=FX_TTL, cache=None):
+        self.cache = cache if cache is not None else QuoteCache(ttl=ttl)
+
+    def get_rates(self, currencies, base=None, max_age=None):
+        """Return {currency: base units per unit of currency} for currencies.
+
+        Every rate not already cached is fetched in a single batched request.
+        Currencies whose rate could not be fetched are left out, so callers
+        can tell what is unconverted. None (currency unknown) is skipped.
+        """
+        base = (base or get_base_currency()).upper()
+        majors = {}
+        for currency in currencies:
+            if currency is None:
+                continue
+            major, scale = MINOR_UNITS.get(currency, (currency.upper(), 1.0))
+            majors[currency] = (major, scale)
+
+        pairs = {pair_symbol(major, base) for major, _ in majors.values() if major != base}
+        prices = {}
+        if pairs:
+            try:
+                prices = self.cache.get_prices(sorted(pairs), max_age=max_age)
+            except Exception as e:
+                logger.warning("Error fetching %d exchange rates: %s", len(pairs), e)
+
+        rates = {}
+        for currency, (major, scale) in majors.items():
+            if major == base:
+                rates[currency] = scale
+            elif pair_symbol(major, base) in prices:
+                rates[currency] = prices[pair_symbol(major, base)] * scale
+        return rates
+
+_rates = None
+
+def get_fx_rates():
+    """Return the process-wide FxRates."""
+    global _rates
+    if _rates is None:
+        _rates = FxRates()
+    return _rates
+
+def set_fx_rates(rates):
+    """Replace the process-wide FxRates (e.g. to change the TTL or provider)."""
+    global _rates
+    _rates = rates
+
+def resolve_currencies(symbols):
+    """Look up the quote currency of symbols and store it on their lots.
+
+    Currencies come from the symbol metadata cache, which fetches only the
+    symbols it has not seen. Returns {symbol: currency} for the symbols
+    whose currency is known.
+    """
+    metadata = fetch_metadata(symbols)
+    currencies = {symbol: record['currency'] for symbol, record in metadata.items()
+                  if record.get('currency')}
+    if currencies:
+        update_currencies_many(currencies)
+    return currencies
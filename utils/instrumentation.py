@@ -0,0 +1,236 @@
+"""Lightweight timing spans, counters and metrics export.
+
+Instrumentation is off unless enable() is called or PORTFOLIO_METRICS is
+set. While it is off, span() hands back one shared no-op context manager
+and observe()/inc() return after a single flag check, so instrumented code
+costs next to nothing.
+
+Timings are kept in memory as histograms (count, sum, max and a bounded
+window of recent samples for p50/p95/p99) and can be written out on demand
+with export_metrics() as a Prometheus text file or as JSON.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+from pathlib import Path
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Recent samples kept per series for computing quantiles
+MAX_SAMPLES = 2048
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_enabled = os.environ.get('PORTFOLIO_METRICS', '') not in ('', '0')
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+class Histogram:
+    """Count, sum, maximum and recent samples of one timing series."""
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.samples.append(value)
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Return {q: value} over the recent samples (nearest-rank)."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: None for q in quantiles}
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(q * len(ordered)))] for q in quantiles}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _observe(key, value):
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+class _Span:
+    __slots__ = ('key', 'start')
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable(enabled=True):
+    """Turn collection on or off for the whole process."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Drop everything collected so far."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def span(name, **labels):
+    """Context manager that records its duration in seconds under name."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(_key(name, labels))
+
+
+def timed(name, **labels):
+    """Decorator form of span(); the op label defaults to the function name."""
+    def decorator(func):
+        key = _key(name, dict({'op': func.__name__}, **labels))
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _observe(key, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def observe(name, value, **labels):
+    """Record one value (usually seconds) in the histogram for name."""
+    if _enabled:
+        _observe(_key(name, labels), value)
+
+
+def inc(name, amount=1, **labels):
+    """Add amount to the counter for name."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def snapshot():
+    """Return everything collected as plain dicts, ready for JSON."""
+    with _lock:
+        counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = []
+        for (name, labels), histogram in sorted(_histograms.items()):
+            entry = {'name': name, 'labels': dict(labels), 'count': histogram.count,
+                     'sum': histogram.total, 'max': histogram.max}
+            for q, value in histogram.quantiles().items():
+                entry[f'p{round(q * 100)}'] = value
+            histograms.append(entry)
+    return {'timestamp': time.time(), 'counters': counters, 'histograms': histograms}
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = list(labels.items()) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + '}'
+
+
+def to_prometheus(data=None):
+    """Render a snapshot in the Prometheus text exposition format.
+
+    Histograms are written as summaries with 0.5, 0.95 and 0.99 quantiles.
+    """
+    data = snapshot() if data is None else data
+    lines = []
+    typed = set()
+    for counter in data['counters']:
+        if counter['name'] not in typed:
+            typed.add(counter['name'])
+            lines.append(f"# TYPE {counter['name']} counter")
+        lines.append(f"{counter['name']}{_labels(counter['labels'])} {counter['value']}")
+    for histogram in data['histograms']:
+        name, labels = histogram['name'], histogram['labels']
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} summary")
+        for q in QUANTILES:
+            value = histogram[f'p{round(q * 100)}']
+            if value is not None:
+                lines.append(f"{name}{_labels(labels, quantile=q)} {value:.6g}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']:.6g}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def export_metrics(path, format=None):
+    """Write the current metrics to path.
+
+    format is 'json' or 'prometheus'; by default it follows the file
+    extension (.json for JSON, anything else for Prometheus text).
+    """
+    path = Path(path)
+    if format is None:
+        format = 'json' if path.suffix.lower() == '.json' else 'prometheus'
+    if format == 'json':
+        text = json.dumps(snapshot(), indent=2) + '\n'
+    else:
+        text = to_prometheus()
+    # Write then rename so a scraper never reads a half-written file
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(text)
+    os.replace(tmp, path)
+    return path
+
+
+def configure_logging(level=None):
+    """Set up root logging for the app and CLI.
+
+    The level defaults to $PORTFOLIO_LOG_LEVEL, or WARNING.
+    """
+    level = level or os.environ.get('PORTFOLIO_LOG_LEVEL', 'WARNING')
+    logging.basicConfig(level=level.upper() if isinstance(level, str) else level,
+                        format=LOG_FORMAT)
@@ -0,0 +1,235 @@
+from datetime import datetime
+
+from utils.db_utils import get_connection_manager
+from utils.instrumentation import timed
+from utils.quote_provider import normalize_symbol
+
+TRANSACTION_KINDS = ('buy', 'sell', 'dividend', 'split')
+
+# Remaining lot quantities below this are treated as fully sold
+_EPSILON = 1e-9
+
+POSITION_FIELDS = ('symbol', 'quantity', 'cost_basis', 'fifo_cost_basis', 'realized_pnl',
+                   'fifo_realized_pnl', 'dividends', 'fees', 'last_transaction_id')
+
+def _position_dict(row):
+    position = dict(zip(POSITION_FIELDS, row))
+    quantity = position['quantity']
+    position['average_cost'] = position['cost_basis'] / quantity if quantity else 0.0
+    return position
+
+def _empty_position(symbol):
+    return dict.fromkeys(POSITION_FIELDS, 0.0) | {'symbol': symbol, 'last_transaction_id': 0}
+
+def _validate(txn):
+    kind = txn.get('kind')
+    if kind not in TRANSACTION_KINDS:
+        raise ValueError(f"Unknown transaction kind {kind!r}; expected one of {', '.join(TRANSACTION_KINDS)}")
+    if kind in ('buy', 'sell') and not txn.get('quantity', 0) > 0:
+        raise ValueError(f"A {kind} needs a positive quantity")
+    if kind == 'split' and not txn.get('ratio', 0) > 0:
+        raise ValueError("A split needs a positive ratio")
+
+def _apply(cursor, txn_id, txn):
+    """Fold one transaction into its position and FIFO lots.
+
+    Only the position row and, for sells, the oldest open lots of the
+    symbol are touched, so the cost does not grow with the history.
+    """
+    symbol = txn['symbol']
+    cursor.execute(f'SELECT {", ".join(POSITION_FIELDS)} FROM positions WHERE symbol = ?', (symbol,))
+    row = cursor.fetchone()
+    position = dict(zip(POSITION_FIELDS, row)) if row else _empty_position(symbol)
+
+    kind = txn['kind']
+    quantity = txn.get('quantity', 0.0)
+    price = txn.get('price', 0.0)
+    fees = txn.get('fees', 0.0)
+    position['fees'] += fees
+
+    if kind == 'buy':
+        cost = quantity * price + fees
+        position['quantity'] += quantity
+        position['cost_basis'] += cost
+        position['fifo_cost_basis'] += cost
+        cursor.execute('''
+            INSERT INTO tax_lots (symbol, transaction_id, quantity, cost_per_share)
+            VALUES (?, ?, ?, ?)
+        ''', (symbol, txn_id, quantity, cost / quantity))
+
+    elif kind == 'sell':
+        held = position['quantity']
+        if quantity > held + _EPSILON:
+            raise ValueError(f"Cannot sell {quantity:g} {symbol}: only {held:g} held")
+        proceeds = quantity * price - fees
+
+        # Average cost: the sold shares carry the current average cost
+        removed = position['cost_basis'] * quantity / held
+        position['cost_basis'] -= removed
+        position['realized_pnl'] += proceeds - removed
+
+        # FIFO: consume the oldest open lots first, reading only as many as needed
+        fifo_removed = 0.0
+        remaining = quantity
+        consumed, partial = [], None
+        cursor.execute('''
+            SELECT id, quantity, cost_per_share FROM tax_lots
+            WHERE symbol = ? ORDER BY id
+        ''', (symbol,))
+        while remaining > _EPSILON and partial is None:
+            lots = cursor.fetchmany(64)
+            if not lots:
+                break
+            for lot_id, lot_quantity, cost_per_share in lots:
+                take = min(lot_quantity, remaining)
+                fifo_removed += take * cost_per_share
+                remaining -= take
+                if lot_quantity - take > _EPSILON:
+                    partial = (lot_quantity - take, lot_id)
+                    break
+                consumed.append((lot_id,))
+                if remaining <= _EPSILON:
+                    break
+        cursor.executemany('DELETE FROM tax_lots WHERE id = ?', consumed)
+        if partial is not None:
+            cursor.execute('UPDATE tax_lots SET quantity = ? WHERE id = ?', partial)
+        position['fifo_cost_basis'] -= fifo_removed
+        position['fifo_realized_pnl'] += proceeds - fifo_removed
+
+        position['quantity'] = held - quantity
+        if position['quantity'] <= _EPSILON:
+            # Clear rounding residue once the position is closed
+            position['quantity'] = position['cost_basis'] = position['fifo_cost_basis'] = 0.0
+
+    elif kind == 'dividend':
+        position['dividends'] += txn.get('amount', 0.0)
+
+    elif kind == 'split':
+        # Shares multiply by ratio; the cost basis is unchanged
+        ratio = txn['ratio']
+        position['quantity'] *= ratio
+        cursor.execute('''
+            UPDATE tax_lots SET quantity = quantity * ?, cost_per_share = cost_per_share / ?
+            WHERE symbol = ?
+        ''', (ratio, ratio, symbol))
+
+    position['last_transaction_id'] = txn_id
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO positions ({", ".join(POSITION_FIELDS)})
+        VALUES ({", ".join("?" * len(POSITION_FIELDS))})
+    ''', tuple(position[field] for field in POSITION_FIELDS))
+    return position
+
+def _insert(cursor, txn):
+    cursor.execute('''
+        INSERT INTO transactions (symbol, kind, quantity, price, amount, ratio, fees, date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (txn['symbol'], txn['kind'], txn.get('quantity', 0.0), txn.get('price', 0.0),
+          txn.get('amount', 0.0), txn.get('ratio', 1.0), txn.get('fees', 0.0),
+          txn.get('date') or datetime.now().isoformat()))
+    return cursor.lastrowid
+
+def _normalized(txn):
+    txn = dict(txn, symbol=normalize_symbol(txn['symbol']), kind=txn.get('kind', '').lower())
+    _validate(txn)
+    return txn
+
+@timed('db_seconds')
+def record_transaction(txn):
+    """Record a buy, sell, dividend or split and update its position.
+
+    txn is a dict with symbol and kind, plus:
+
+    * buy/sell: quantity and price per share
+    * dividend: amount (total cash received)
+    * split: ratio (new shares per old share, e.g. 4 for a 4-for-1 split)
+
+    fees and date are optional for every kind. The transaction and the
+    position update are written in one database transaction. Returns the
+    updated position dict. Raises ValueError for invalid transactions,
+    including sells of more shares than are held.
+    """
+    txn = _normalized(txn)
+    with get_connection_manager().transaction() as cursor:
+        position = _apply(cursor, _insert(cursor, txn), txn)
+    return _position_dict(tuple(position[field] for field in POSITION_FIELDS))
+
+@timed('db_seconds')
+def record_transactions(txns):
+    """Record many transactions, in order, in a single database transaction.
+
+    Either all of them are recorded or, if one is invalid, none are.
+    Returns the number recorded.
+    """
+    count = 0
+    with get_connection_manager().transaction() as cursor:
+        for txn in txns:
+            txn = _normalized(txn)
+            _apply(cursor, _insert(cursor, txn), txn)
+            count += 1
+    return count
+
+@timed('db_seconds')
+def load_positions(include_closed=False):
+    """Return position dicts ordered by symbol, read straight from the positions table.
+
+    Each has quantity, average_cost, cost_basis and realized_pnl (average
+    cost method), fifo_cost_basis and fifo_realized_pnl, dividends and fees.
+    """
+    cursor = get_connection_manager().connection().cursor()
+    where = '' if include_closed else 'WHERE quantity > 0'
+    cursor.execute(f'SELECT {", ".join(POSITION_FIELDS)} FROM positions {where} ORDER BY symbol')
+    positions = [_position_dict(row) for row in cursor.fetchall()]
+    cursor.close()
+    return positions
+
+@timed('db_seconds')
+def get_position(symbol):
+    """Return the position dict for symbol, or None if it was never traded."""
+    cursor = get_connection_manager().connection().cursor()
+    cursor.execute(f'SELECT {", ".join(POSITION_FIELDS)} FROM positions WHERE symbol = ?',
+                   (normalize_symbol(symbol),))
+    row = cursor.fetchone()
+    cursor.close()
+    return _position_dict(row) if row else None
+
+@timed('db_seconds')
+def load_transactions(symbol=None):
+    """Return transaction dicts, oldest first, optionally for one symbol."""
+    cursor = get_connection_manager().connection().cursor()
+    query = 'SELECT id, symbol, kind, quantity, price, amount, ratio, fees, date FROM transactions'
+    if symbol is None:
+        cursor.execute(query + ' ORDER BY id')
+    else:
+        cursor.execute(query + ' WHERE symbol = ? ORDER BY id', (normalize_symbol(symbol),))
+    fields = ('id', 'symbol', 'kind', 'quantity', 'price', 'amount', 'ratio', 'fees', 'date')
+    transactions = [dict(zip(fields, row)) for row in cursor.fetchall()]
+    cursor.close()
+    return transactions
+
+@timed('db_seconds')
+def rebuild_positions():
+    """Recompute every position and tax lot by replaying the whole ledger.
+
+    Never needed in normal use, since positions are maintained as
+    transactions are recorded; it exists to repair a database edited by
+    hand. Returns the number of transactions replayed.
+    """
+    count = 0
+    with get_connection_manager().transaction() as cursor:
+        cursor.execute('DELETE FROM positions')
+        cursor.execute('DELETE FROM tax_lots')
+        replay = get_connection_manager().connection().cursor()
+        try:
+            replay.execute('''
+                SELECT id, symbol, kind, quantity, price, amount, ratio, fees FROM transactions
+                ORDER BY id
+            ''')
+            for txn_id, symbol, kind, quantity, price, amount, ratio, fees in replay:
+                _apply(cursor, txn_id, {'symbol': symbol, 'kind': kind, 'quantity': quantity,
+                                        'price': price, 'amount': amount, 'ratio': ratio,
+                                        'fees': fees})
+                count += 1
+        finally:
+            replay.close()
+    return count
@@ -0,0 +1,199 @@
+"""Columnar on-disk store of daily OHLC history.
+
+Each symbol has a directory holding one .npy file per column: date
+(datetime64[D], ascending) plus OHLC_COLUMNS, and coverage.npy with the
+first and last dates that have been requested, so days without bars
+(weekends, holidays) are not asked for again. load_ohlc() opens them with
+np.load(mmap_mode='r'), so readers get read-only views straight onto the
+files without parsing or copying. Updates are written to temporary files
+and renamed into place, so open memory maps keep seeing the old data.
+"""
+import logging
+import os
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+
+from utils.db_utils import get_db_path
+from utils.instrumentation import span
+from utils.price_history import daily_closes
+from utils.quote_provider import OHLC_COLUMNS, get_provider, normalize_symbol
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('date',) + OHLC_COLUMNS
+
+DEFAULT_HISTORY_DAYS = 5 * 365
+
+_store_dir = None
+
+def get_store_dir():
+    """Return the store directory.
+
+    Defaults to $PORTFOLIO_OHLC_DIR, or an ohlc directory next to the database.
+    """
+    if _store_dir is not None:
+        return _store_dir
+    if os.environ.get('PORTFOLIO_OHLC_DIR'):
+        return Path(os.environ['PORTFOLIO_OHLC_DIR'])
+    return Path(get_db_path()).parent / 'ohlc'
+
+def set_store_dir(path):
+    """Use the store at path from now on (None restores the default)."""
+    global _store_dir
+    _store_dir = Path(path) if path is not None else None
+
+def _symbol_dir(symbol):
+    # Percent-encode so symbols like ^GSPC or EURUSD=X are safe file names
+    return get_store_dir() / quote(normalize_symbol(symbol), safe='')
+
+def load_ohlc(symbol, start=None, end=None, columns=COLUMNS):
+    """Return {column: array} for symbol, or None if nothing is stored.
+
+    Arrays are read-only memory-mapped views; slicing to start/end (dates,
+    inclusive) uses a binary search on the date column and copies nothing.
+    Only the requested columns are opened; date always is.
+    """
+    directory = _symbol_dir(symbol)
+    if not (directory / 'date.npy').exists():
+        return None
+    bars = {column: np.load(directory / f'{column}.npy', mmap_mode='r')
+            for column in dict.fromkeys(('date',) + tuple(columns))}
+    dates = bars['date']
+    lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'D'), 'left')
+    hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'D'), 'right')
+    return {column: array[lo:hi] for column, array in bars.items()}
+
+def stored_range(symbol):
+    """Return the (first, last) dates covered for symbol as datetime.date, or None."""
+    path = _symbol_dir(symbol) / 'coverage.npy'
+    if not path.exists():
+        return None
+    first, last = np.load(path)
+    return first.item(), last.item()
+
+def _write(directory, name, array):
+    tmp = directory / f'{name}.npy.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, directory / f'{name}.npy')
+
+def load_closes(symbols, start=None, end=None, include_recent=False):
+    """Return {symbol: (dates, closes)} views for the symbols that have history.
+
+    With include_recent, the closes recorded locally by price refreshes
+    (price_history.daily_closes) after a symbol's last stored bar are
+    appended, so the series reaches the latest refresh. Those series are
+    copies rather than views.
+    """
+    closes = {}
+    for symbol in symbols:
+        symbol = normalize_symbol(symbol)
+        bars = load_ohlc(symbol, start, end, columns=('close',))
+        if bars is not None:
+            closes[symbol] = (bars['date'], bars['close'])
+        if include_recent:
+            after = start
+            if bars is not None and len(bars['date']):
+                after = bars['date'][-1] + 1
+            recent = daily_closes(symbol, None if after is None else str(np.datetime64(after, 'D')),
+                                  None if end is None else str(np.datetime64(end, 'D')))
+            if len(recent[0]):
+                if symbol in closes:
+                    recent = tuple(np.concatenate([stored, new])
+                                   for stored, new in zip(closes[symbol], recent))
+                closes[symbol] = recent
+    return closes
+
+def save_ohlc(symbol, bars, start=None, end=None):
+    """Merge bars (a dict of arrays as from get_history) into the stored history.
+
+    Rows for dates already stored are replaced by the new ones. start and
+    end are the dates that were requested, and extend the recorded
+    coverage; they default to the first and last bar. Returns the number of
+    rows now stored.
+    """
+    directory = _symbol_dir(symbol)
+    existing = load_ohlc(symbol)
+    new = {column: np.asarray(bars[column]) for column in COLUMNS}
+    new['date'] = new['date'].astype('datetime64[D]')
+    if existing is not None:
+        merged = {column: np.concatenate([existing[column], new[column]]) for column in COLUMNS}
+        order = np.argsort(merged['date'], kind='stable')
+        merged = {column: array[order] for column, array in merged.items()}
+        # After a stable sort the new row for a date comes last; keep it
+        keep = np.append(merged['date'][1:] != merged['date'][:-1], True)
+        merged = {column: array[keep] for column, array in merged.items()}
+    else:
+        order = np.argsort(new['date'], kind='stable')
+        merged = {column: array[order] for column, array in new.items()}
+
+    coverage = [np.datetime64(start or merged['date'][0], 'D'),
+                np.datetime64(end or merged['date'][-1], 'D')]
+    stored = stored_range(symbol)
+    if stored is not None:
+        coverage = [min(coverage[0], np.datetime64(stored[0], 'D')),
+                    max(coverage[1], np.datetime64(stored[1], 'D'))]
+
+    directory.mkdir(parents=True, exist_ok=True)
+    for column in COLUMNS:
+        dtype = 'datetime64[D]' if column == 'date' else 'float64'
+        _write(directory, column, np.ascontiguousarray(merged[column], dtype=dtype))
+    _write(directory, 'coverage', np.array(coverage, dtype='datetime64[D]'))
+    return len(merged['date'])
+
+def missing_ranges(symbol, start, end):
+    """Return the [(start, end), ...] date ranges that still need fetching for symbol.
+
+    Only the edges are considered: days before the covered range, and
+    everything from its last day on. The last day is fetched again, since
+    it may have been partial.
+    """
+    stored = stored_range(symbol)
+    if stored is None:
+        return [(start, end)]
+    first, last = stored
+    ranges = []
+    if start < first:
+        ranges.append((start, first - timedelta(days=1)))
+    if last < end:
+        ranges.append((last, end))
+    return ranges
+
+def backfill(symbols, start=None, end=None, provider=None, on_progress=None):
+    """Download and store daily history for symbols, fetching only what is missing.
+
+    start defaults to DEFAULT_HISTORY_DAYS ago and end to today. Symbols
+    that need the same date range are fetched together in one
+    provider.get_history call, which batches them into as few requests as
+    the provider allows. on_progress(done, total) counts those calls.
+    Returns {symbol: rows stored} for the symbols that were updated.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=DEFAULT_HISTORY_DAYS)
+    provider = provider if provider is not None else get_provider()
+
+    groups = {}
+    for symbol in dict.fromkeys(normalize_symbol(s) for s in symbols if s.strip()):
+        for needed in missing_ranges(symbol, start, end):
+            groups.setdefault(needed, []).append(symbol)
+
+    total = len(groups)
+    done = 0
+    stored = {}
+    for (range_start, range_end), group in groups.items():
+        try:
+            with span('ohlc_fetch_seconds'):
+                history = provider.get_history(group, range_start, range_end)
+        except Exception as e:
+            logger.warning("Error fetching history for %d symbols: %s", len(group), e)
+            history = {}
+        for symbol, bars in history.items():
+            if len(bars['date']):
+                stored[symbol] = save_ohlc(symbol, bars, range_start, range_end)
+        done += 1
+        if on_progress is not None:
+            on_progress(done, total)
+    return stored
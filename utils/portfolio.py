@@ -0,0 +1,153 @@
+"""Typed in-memory portfolio: Lot records in a Portfolio container.
+
+Lot uses __slots__, so a lot needs no per-instance dict and takes much
+less memory than a dict with the same fields. Portfolio keeps lots in row
+order and indexes them by id and by symbol; while indexing, the lots of a
+symbol are made to share one symbol string.
+"""
+from utils.quote_provider import normalize_symbol
+
+LOT_FIELDS = ('id', 'symbol', 'quantity', 'purchase_price', 'current_price', 'date_added',
+              'price_updated_at', 'currency')
+
+
+class Lot:
+    """One holding of a symbol: a row of the stocks table.
+
+    id is None until the lot is saved. date_added is an ISO timestamp and
+    price_updated_at the unix time current_price was fetched, or None if
+    that is unknown. currency is the code the symbol is quoted in (both
+    prices are in it), or None until it has been looked up.
+    """
+    __slots__ = LOT_FIELDS
+
+    def __init__(self, symbol, quantity, purchase_price, current_price, date_added=None,
+                 price_updated_at=None, currency=None, id=None):
+        self.id = id
+        self.symbol = symbol
+        self.quantity = quantity
+        self.purchase_price = purchase_price
+        self.current_price = current_price
+        self.date_added = date_added
+        self.price_updated_at = price_updated_at
+        self.currency = currency
+
+    def replace(self, **changes):
+        """Return a copy with the given fields changed."""
+        lot = Lot.__new__(Lot)
+        for field in LOT_FIELDS:
+            setattr(lot, field, changes.pop(field, getattr(self, field)))
+        if changes:
+            raise TypeError(f"Unknown lot fields: {', '.join(changes)}")
+        return lot
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in LOT_FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, Lot):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in LOT_FIELDS)
+
+    def __repr__(self):
+        return (f"Lot(id={self.id!r}, symbol={self.symbol!r}, quantity={self.quantity!r}, "
+                f"purchase_price={self.purchase_price!r}, current_price={self.current_price!r})")
+
+
+class Portfolio:
+    """Ordered collection of lots with O(1) lookup by id and by symbol.
+
+    Rows are positions in the collection, as shown in the table. Appending
+    and replacing keep the indexes current in O(1); pop() renumbers the
+    rows after the removed one and rebuilds them.
+    """
+
+    def __init__(self, lots=()):
+        self._lots = list(lots)
+        self._reindex()
+
+    def _reindex(self):
+        self._rows_by_id = rows_by_id = {}
+        self._rows_by_symbol = rows_by_symbol = {}
+        # Symbol string -> (first lot's string, rows list), so each symbol is
+        # normalized once and its lots share one string (rows read from
+        # SQLite each have their own copy)
+        seen = {}
+        for row, lot in enumerate(self._lots):
+            if lot.id is not None:
+                rows_by_id[lot.id] = row
+            entry = seen.get(lot.symbol)
+            if entry is None:
+                rows = rows_by_symbol.setdefault(normalize_symbol(lot.symbol), [])
+                seen[lot.symbol] = lot.symbol, rows
+            else:
+                lot.symbol, rows = entry
+            rows.append(row)
+
+    def _index(self, row, lot):
+        if lot.id is not None:
+            self._rows_by_id[lot.id] = row
+        self._rows_by_symbol.setdefault(normalize_symbol(lot.symbol), []).append(row)
+
+    def __len__(self):
+        return len(self._lots)
+
+    def __iter__(self):
+        return iter(self._lots)
+
+    def __getitem__(self, row):
+        return self._lots[row]
+
+    def __setitem__(self, row, lot):
+        """Replace the lot at row (e.g. with an updated copy)."""
+        old = self._lots[row]
+        self._lots[row] = lot
+        if old.id != lot.id:
+            self._rows_by_id.pop(old.id, None)
+            if lot.id is not None:
+                self._rows_by_id[lot.id] = row
+        old_symbol, symbol = normalize_symbol(old.symbol), normalize_symbol(lot.symbol)
+        if old_symbol != symbol:
+            rows = self._rows_by_symbol[old_symbol]
+            rows.remove(row)
+            if not rows:
+                del self._rows_by_symbol[old_symbol]
+            rows = self._rows_by_symbol.setdefault(symbol, [])
+            rows.append(row)
+            rows.sort()
+
+    def append(self, lot):
+        """Add lot as the last row and return its row."""
+        row = len(self._lots)
+        self._lots.append(lot)
+        self._index(row, lot)
+        return row
+
+    def pop(self, row):
+        """Remove and return the lot at row."""
+        lot = self._lots.pop(row)
+        self._reindex()
+        return lot
+
+    def get(self, lot_id):
+        """Return the lot with database id lot_id, or None."""
+        row = self._rows_by_id.get(lot_id)
+        return self._lots[row] if row is not None else None
+
+    def row_of(self, lot_id):
+        """Return the row of the lot with database id lot_id, or None."""
+        return self._rows_by_id.get(lot_id)
+
+    def rows_for(self, symbol):
+        """Return the rows of every lot of symbol, in order."""
+        return self._rows_by_symbol.get(normalize_symbol(symbol), [])
+
+    def lots_for(self, symbol):
+        return [self._lots[row] for row in self.rows_for(symbol)]
+
+    def symbols(self):
+        """Return the distinct symbols held, in order of first appearance."""
+        return list(self._rows_by_symbol)
+
+    def __repr__(self):
+        return f"Portfolio({len(self._lots)} lots, {len(self._rows_by_symbol)} symbols)"
@@ -0,0 +1,130 @@
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from utils.db_utils import get_connection_manager
+from utils.instrumentation import timed
+
+# Raw ticks newer than this are kept as-is; older ones are rolled up into
+# daily bars by compact_history.
+DEFAULT_TICK_RETENTION_DAYS = 30
+
+def _day(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).date().isoformat()
+
+@timed('db_seconds')
+def append_prices(prices, timestamp=None):
+    """Append one tick per symbol to the price history.
+
+    prices maps symbol to price and is shared by every lot of that symbol.
+    timestamp is in unix seconds and defaults to now. Returns the number of
+    ticks written.
+    """
+    ts = int(timestamp if timestamp is not None else time.time())
+    with get_connection_manager().transaction() as cursor:
+        cursor.executemany(
+            'INSERT OR REPLACE INTO price_history (symbol, ts, price) VALUES (?, ?, ?)',
+            ((symbol, ts, price) for symbol, price in prices.items())
+        )
+        return cursor.rowcount
+
+@timed('db_seconds')
+def get_history(symbol, start=None, end=None):
+    """Return [(ts, price), ...] for symbol with start <= ts < end, oldest first.
+
+    Served from the (symbol, ts) primary key without any network access.
+    """
+    start = 0 if start is None else int(start)
+    end = 2 ** 62 if end is None else int(end)
+    cursor = get_connection_manager().connection().cursor()
+    cursor.execute('''
+        SELECT ts, price FROM price_history
+        WHERE symbol = ? AND ts >= ? AND ts < ?
+        ORDER BY ts
+    ''', (symbol, start, end))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+@timed('db_seconds')
+def get_daily_bars(symbol, start_day=None, end_day=None):
+    """Return [(day, open, high, low, close), ...] for rolled-up days.
+
+    start_day and end_day are inclusive ISO dates (YYYY-MM-DD, UTC).
+    """
+    cursor = get_connection_manager().connection().cursor()
+    cursor.execute('''
+        SELECT day, open, high, low, close FROM price_daily
+        WHERE symbol = ? AND day >= ? AND day <= ?
+        ORDER BY day
+    ''', (symbol, start_day or '0000-00-00', end_day or '9999-99-99'))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+def _day_start(day):
+    """Return the unix time a UTC day (ISO date) starts."""
+    return int(datetime.combine(date.fromisoformat(day), datetime.min.time(), timezone.utc).timestamp())
+
+def daily_closes(symbol, start_day=None, end_day=None):
+    """Return (dates, closes) arrays of the closes recorded locally for symbol.
+
+    Days rolled up by compact_history close at their daily bar, and newer
+    days at their last tick (days are UTC). start_day and end_day are
+    inclusive ISO dates; dates are datetime64[D], ascending.
+    """
+    closes = {day: close for day, _, _, _, close in get_daily_bars(symbol, start_day, end_day)}
+    start = None if start_day is None else _day_start(start_day)
+    end = None if end_day is None else _day_start(end_day) + 86400
+    # Ticks come oldest first, so each day keeps its last one
+    for ts, price in get_history(symbol, start, end):
+        closes[_day(ts)] = price
+    days = sorted(closes)
+    return (np.array(days, dtype='datetime64[D]'),
+            np.array([closes[day] for day in days], dtype=np.float64))
+
+@timed('db_seconds')
+def compact_history(retention_days=DEFAULT_TICK_RETENTION_DAYS, bar_retention_days=None, now=None):
+    """Roll ticks older than retention_days into daily bars and drop them.
+
+    Bars for a day that already has one are merged, keeping the earlier
+    open. When bar_retention_days is set, older daily bars are deleted too.
+    Returns the number of ticks rolled up.
+    """
+    now = time.time() if now is None else now
+    cutoff = int(now - retention_days * 86400)
+    with get_connection_manager().transaction() as cursor:
+        cursor.execute('''
+            SELECT symbol, ts, price FROM price_history
+            WHERE ts < ? ORDER BY symbol, ts
+        ''', (cutoff,))
+        bars = {}
+        rolled = 0
+        for symbol, ts, price in cursor:
+            key = (symbol, _day(ts))
+            bar = bars.get(key)
+            if bar is None:
+                bars[key] = [price, price, price, price, 1]
+            else:
+                bar[1] = max(bar[1], price)
+                bar[2] = min(bar[2], price)
+                bar[3] = price
+                bar[4] += 1
+            rolled += 1
+
+        cursor.executemany('''
+            INSERT INTO price_daily (symbol, day, open, high, low, close, ticks)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (symbol, day) DO UPDATE SET
+                high = max(high, excluded.high),
+                low = min(low, excluded.low),
+                close = excluded.close,
+                ticks = ticks + excluded.ticks
+        ''', ((symbol, day, *bar) for (symbol, day), bar in bars.items()))
+        cursor.execute('DELETE FROM price_history WHERE ts < ?', (cutoff,))
+
+        if bar_retention_days is not None:
+            cursor.execute('DELETE FROM price_daily WHERE day < ?',
+                           (_day(now - bar_retention_days * 86400),))
+    return rolled
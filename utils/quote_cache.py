@@ -0,0 +1,304 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from utils import instrumentation
+from utils.quote_provider import get_provider, normalize_symbol
+
+logger = logging.getLogger(__name__)
+
+# Interactive lookups (dialogs) share one small pool instead of a thread each
+LOOKUP_WORKERS = 4
+_lookup_pool = None
+_lookup_pool_lock = threading.Lock()
+
+
+def get_lookup_pool():
+    """Return the shared executor used for asynchronous quote lookups."""
+    global _lookup_pool
+    with _lookup_pool_lock:
+        if _lookup_pool is None:
+            _lookup_pool = ThreadPoolExecutor(max_workers=LOOKUP_WORKERS,
+                                              thread_name_prefix='quote-lookup')
+        return _lookup_pool
+
+
+class QuoteCache:
+    """Process-wide TTL/LRU cache in front of the quote provider.
+
+    Entries expire after ttl seconds, and the least recently used symbols are
+    evicted once more than maxsize are held. Concurrent lookups for a symbol
+    that is already being fetched wait for that fetch instead of issuing
+    their own. A price lookup also waits for a quote being fetched, since
+    the quote carries the price.
+
+    Symbols the provider reports as not found (delisted or mistyped, see
+    PriceBatch.not_found) are remembered in a negative cache for
+    negative_ttl seconds, during which they are not requested again, even
+    with max_age=0. Symbols that are merely missing from a batch are not.
+    """
+
+    def __init__(self, ttl=60.0, maxsize=5000, provider=None, negative_ttl=6 * 3600.0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.provider = provider
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._missing = {}
+        self._inflight = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def _provider(self):
+        return self.provider if self.provider is not None else get_provider()
+
+    def add_fetch_listener(self, callback):
+        """Call callback(prices) with every batch of prices fetched from the provider.
+
+        Callbacks run on the fetching thread; exceptions are reported and ignored.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, prices):
+        for callback in list(self._listeners):
+            try:
+                callback(prices)
+            except Exception:
+                logger.exception("Quote fetch listener %r failed", callback)
+
+    def _fresh_entry(self, symbol, max_age):
+        entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        max_age = self.ttl if max_age is None else max_age
+        if time.time() - entry['fetched_at'] >= max_age:
+            return None
+        self._entries.move_to_end(symbol)
+        return entry
+
+    def _known_missing(self, symbol):
+        missing_at = self._missing.get(symbol)
+        if missing_at is None:
+            return False
+        if time.time() - missing_at >= self.negative_ttl:
+            del self._missing[symbol]
+            return False
+        return True
+
+    def _store(self, symbol, price, quote=None, fetched_at=None):
+        self._missing.pop(symbol, None)
+        entry = self._entries.get(symbol)
+        if quote is None and entry is not None and entry['quote'] is not None:
+            quote = dict(entry['quote'], price=price)
+        self._entries[symbol] = {
+            'price': price,
+            'quote': quote,
+            'fetched_at': fetched_at if fetched_at is not None else time.time(),
+        }
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_prices(self, symbols, max_age=None):
+        """Return a dict of symbol to price, fetching only what is not cached.
+
+        max_age overrides the TTL for this call; pass 0 to force a fetch.
+        Missing symbols are fetched from the provider in one batch. Symbols
+        in the negative cache are left out without a request, as are any the
+        provider returned no price for.
+        """
+        symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols if s.strip()))
+        results, waiting, owned = {}, {}, {}
+        negative = 0
+        with self._lock:
+            for symbol in symbols:
+                entry = self._fresh_entry(symbol, max_age)
+                if entry is not None:
+                    results[symbol] = entry['price']
+                elif self._known_missing(symbol):
+                    negative += 1
+                elif ('price', symbol) in self._inflight:
+                    waiting[symbol] = ('price', self._inflight[('price', symbol)])
+                elif ('quote', symbol) in self._inflight:
+                    waiting[symbol] = ('quote', self._inflight[('quote', symbol)])
+                else:
+                    owned[symbol] = self._inflight[('price', symbol)] = Future()
+        if instrumentation.is_enabled():
+            self._count(hit=len(results), coalesced=len(waiting), miss=len(owned),
+                        negative=negative)
+
+        if owned:
+            try:
+                with self._timed_fetch('prices', owned):
+                    prices = self._provider().get_prices(list(owned))
+            except Exception as e:
+                self._finish(owned, 'price', exception=e)
+                raise
+            # Only symbols the provider says it does not know are negative-cached;
+            # one that is merely absent from the batch may just have failed
+            not_found = [s for s in getattr(prices, 'not_found', ()) if s in owned]
+            prices = {s: p for s, p in prices.items() if s in owned}
+            with self._lock:
+                for symbol, price in prices.items():
+                    self._store(symbol, price)
+                now = time.time()
+                for symbol in not_found:
+                    if symbol not in prices:
+                        self._missing[symbol] = now
+            self._finish(owned, 'price', values=prices)
+            results.update(prices)
+            if prices:
+                self._notify(prices)
+
+        for symbol, (kind, future) in waiting.items():
+            try:
+                price = future.result()
+            except Exception:
+                price = None
+            if kind == 'quote' and price is not None:
+                price = price['price']
+            if price is not None:
+                results[symbol] = price
+        return results
+
+    def get_quote(self, symbol, max_age=None):
+        """Return a quote dict (see QuoteProvider.get_quote) for one symbol.
+
+        The quote also carries fetched_at, the unix time its price was
+        fetched. For a symbol in the negative cache the quote has price
+        None and not_found True, and no request is made. A quote without a
+        price is negative-cached only when the provider set not_found.
+        """
+        symbol = normalize_symbol(symbol)
+        key = ('quote', symbol)
+        with self._lock:
+            entry = self._fresh_entry(symbol, max_age)
+            if entry is not None and entry['quote'] is not None:
+                instrumentation.inc('quote_cache_requests_total', result='hit')
+                return dict(entry['quote'], fetched_at=entry['fetched_at'])
+            if entry is None and self._known_missing(symbol):
+                instrumentation.inc('quote_cache_requests_total', result='negative')
+                return {'symbol': symbol, 'price': None, 'currency': None,
+                        'market_state': 'Unknown', 'name': symbol, 'not_found': True,
+                        'fetched_at': None}
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            instrumentation.inc('quote_cache_requests_total', result='coalesced')
+            return dict(future.result())
+
+        instrumentation.inc('quote_cache_requests_total', result='miss')
+        try:
+            with self._timed_fetch('quote', [symbol]):
+                quote = self._provider().get_quote(symbol)
+        except Exception as e:
+            self._finish({symbol: future}, 'quote', exception=e)
+            raise
+        quote = dict(quote, fetched_at=time.time())
+        with self._lock:
+            if quote['price'] is not None:
+                self._store(symbol, quote['price'], quote=quote, fetched_at=quote['fetched_at'])
+            elif quote.get('not_found'):
+                # An empty quote may just have failed; only remember unknown symbols
+                self._missing[symbol] = quote['fetched_at']
+        self._finish({symbol: future}, 'quote', values={symbol: quote})
+        if quote['price'] is not None:
+            self._notify({symbol: quote['price']})
+        return dict(quote)
+
+    def get_quote_async(self, symbol, max_age=None):
+        """Return a Future for get_quote(symbol), run on the shared lookup pool.
+
+        The Future can be cancelled until a worker picks it up.
+        """
+        return get_lookup_pool().submit(self.get_quote, symbol, max_age)
+
+    def _count(self, **results):
+        for result, count in results.items():
+            if count:
+                instrumentation.inc('quote_cache_requests_total', count, result=result)
+
+    @contextmanager
+    def _timed_fetch(self, kind, symbols):
+        if not instrumentation.is_enabled():
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            instrumentation.observe('quote_fetch_seconds', elapsed, kind=kind)
+            # One sample per request, spread over its symbols, so the number of
+            # series does not grow with the number of symbols ever fetched
+            if symbols:
+                instrumentation.observe('quote_symbol_fetch_seconds', elapsed / len(symbols),
+                                        kind=kind)
+
+    def _finish(self, futures, kind, values=None, exception=None):
+        with self._lock:
+            for symbol in futures:
+                self._inflight.pop((kind, symbol), None)
+        for symbol, future in futures.items():
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(values.get(symbol))
+
+    def peek(self, symbol):
+        """Return the cached price for symbol regardless of age, or None."""
+        with self._lock:
+            entry = self._entries.get(normalize_symbol(symbol))
+            return entry['price'] if entry is not None else None
+
+    def fetched_at(self, symbol):
+        """Return the unix time the cached price for symbol was fetched, or None."""
+        with self._lock:
+            entry = self._entries.get(normalize_symbol(symbol))
+            return entry['fetched_at'] if entry is not None else None
+
+    def put(self, symbol, price, fetched_at=None):
+        """Store a price obtained elsewhere, fetched at unix time fetched_at (default now)."""
+        with self._lock:
+            self._store(normalize_symbol(symbol), price, fetched_at=fetched_at)
+
+    def is_missing(self, symbol):
+        """Return True if symbol is in the negative cache (known to have no price)."""
+        with self._lock:
+            return self._known_missing(normalize_symbol(symbol))
+
+    def invalidate(self, symbol=None):
+        """Drop one symbol, or everything when symbol is None, including negative entries."""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+                self._missing.clear()
+            else:
+                self._entries.pop(normalize_symbol(symbol), None)
+                self._missing.pop(normalize_symbol(symbol), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+
+
+def get_quote_cache():
+    """Return the process-wide quote cache."""
+    global _cache
+    if _cache is None:
+        _cache = QuoteCache()
+    return _cache
+
+
+def set_quote_cache(cache):
+    """Replace the process-wide quote cache (e.g. to change TTL or size)."""
+    global _cache
+    _cache = cache
@@ -0,0 +1,453 @@
+import ast
+import logging
+import random
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+# Columns of daily history, as returned by QuoteProvider.get_history
+OHLC_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+PRICE_KEYS = ['currentPrice', 'regularMarketPrice', 'price', 'previousClose']
+
+
+def normalize_symbol(symbol):
+    """Return the canonical (stripped, upper-case) form of a symbol."""
+    return symbol.strip().upper()
+
+
+def price_from_info(info):
+    """Pick the best available price out of a Yahoo Finance info payload."""
+    for price_key in PRICE_KEYS:
+        if price_key in info and info[price_key] is not None:
+            return info[price_key]
+    return None
+
+
+class QuoteUnavailableError(ConnectionError):
+    """Raised by a provider when the upstream failed instead of answering.
+
+    errors maps each affected symbol to the upstream's error message. It is
+    a ConnectionError, so ResilientProvider retries it.
+    """
+
+    def __init__(self, errors):
+        self.errors = dict(errors)
+        sample = '; '.join(f"{s}: {e}" for s, e in list(self.errors.items())[:3])
+        super().__init__(f"Quote request failed for {len(self.errors)} symbols ({sample})")
+
+
+class PriceBatch(dict):
+    """Result of QuoteProvider.get_prices: a dict of symbol to price.
+
+    not_found holds the requested symbols the upstream reported as unknown
+    or delisted. A symbol that is merely absent may have failed to download,
+    so only these are safe to remember as missing.
+    """
+
+    def __init__(self, prices=(), not_found=()):
+        super().__init__(prices)
+        self.not_found = set(not_found)
+
+
+class QuoteProvider:
+    """Interface for price sources.
+
+    Providers must implement get_prices, which fetches many symbols in one
+    request. get_quote returns a single quote with its metadata and is what
+    the dialogs use to show currency and market state. get_history is
+    optional and returns daily bars for many symbols at once.
+    """
+
+    def get_prices(self, symbols):
+        """Return a dict mapping each symbol that has a price to that price.
+
+        Symbols without price data are left out of the result. Returning a
+        PriceBatch lets callers tell symbols the upstream does not know from
+        ones that failed; a failed request should raise (QuoteUnavailableError)
+        rather than come back empty.
+        """
+        raise NotImplementedError
+
+    def get_quote(self, symbol):
+        """Return a quote dict (symbol, price, currency, market_state, name, not_found).
+
+        The price is None when the symbol has no price data. not_found is
+        True only when the provider reported the symbol as unknown or
+        delisted, as opposed to returning nothing for another reason.
+        """
+        symbol = normalize_symbol(symbol)
+        prices = self.get_prices([symbol])
+        return {
+            'symbol': symbol,
+            'price': prices.get(symbol),
+            'currency': 'USD',
+            'market_state': 'Unknown',
+            'name': symbol,
+            'not_found': symbol in getattr(prices, 'not_found', ()),
+        }
+
+    def get_metadata(self, symbol):
+        """Return descriptive data for symbol: a dict with name, currency and exchange."""
+        quote = self.get_quote(symbol)
+        return {
+            'symbol': quote['symbol'],
+            'name': quote['name'],
+            'currency': quote['currency'],
+            'exchange': None,
+        }
+
+    def get_history(self, symbols, start, end):
+        """Return daily bars for symbols from start to end (dates, inclusive).
+
+        The result maps each symbol that has data to a dict of NumPy arrays:
+        'date' (datetime64[D], ascending) plus one array per OHLC_COLUMNS.
+        """
+        raise NotImplementedError
+
+
+# yfinance's wording when it has no data for a symbol, as opposed to a failed request
+_NOT_FOUND_ERRORS = ('delisted', 'no price data found', 'no timezone found', 'not found', '404')
+
+# yf.download logs its per-symbol failures as "['SYM', ...]: message"
+_FAILED_SYMBOLS = re.compile(r"^(\[.*?\]): (.*)$", re.DOTALL)
+
+
+def _is_not_found(message):
+    message = message.lower()
+    return any(marker in message for marker in _NOT_FOUND_ERRORS)
+
+
+class _ErrorCollector(logging.Handler):
+    """Keeps the error messages logged on the thread that created it."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.thread = threading.get_ident()
+        self.messages = []
+
+    def emit(self, record):
+        if record.thread == self.thread:
+            self.messages.append(record.getMessage())
+
+
+@contextmanager
+def _yfinance_errors():
+    """Collect the errors yfinance logs instead of raising.
+
+    yf.download catches every ticker's exception (network errors and rate
+    limiting included) and returns an empty frame for it, and Ticker.info
+    logs HTTP errors and returns what it has; the log is the only place
+    the failure shows up.
+    """
+    collector = _ErrorCollector()
+    yf_logger = logging.getLogger('yfinance')
+    yf_logger.addHandler(collector)
+    try:
+        yield collector.messages
+    finally:
+        yf_logger.removeHandler(collector)
+
+
+def _symbol_errors(messages):
+    """Return {symbol: message} from yf.download's failure log lines."""
+    errors = {}
+    for message in messages:
+        match = _FAILED_SYMBOLS.match(message.strip())
+        if match is None:
+            continue
+        try:
+            symbols = ast.literal_eval(match.group(1))
+        except (ValueError, SyntaxError):
+            continue
+        for symbol in symbols:
+            errors[str(symbol).upper()] = match.group(2)
+    return errors
+
+
+def _split_failures(symbols, found, messages):
+    """Split the symbols without data into (not_found, {symbol: error}).
+
+    A symbol counts as not found only when yfinance says so; one without
+    any error message is treated as failed.
+    """
+    errors = _symbol_errors(messages)
+    not_found, failed = set(), {}
+    for symbol in symbols:
+        if symbol in found:
+            continue
+        error = errors.get(symbol)
+        if error is not None and _is_not_found(error):
+            not_found.add(symbol)
+        else:
+            failed[symbol] = error or 'no data returned'
+    return not_found, failed
+
+
+class YahooQuoteProvider(QuoteProvider):
+    """Quote provider backed by Yahoo Finance.
+
+    Prices for many symbols are fetched with one yf.download call per chunk
+    instead of one yf.Ticker(...).info request per symbol. yfinance (and with
+    it pandas and requests) is only imported on the first request.
+
+    yfinance reports most failures by logging them; a chunk for which
+    nothing came back because of such errors raises QuoteUnavailableError,
+    and only symbols Yahoo reports as delisted or unknown are returned in
+    PriceBatch.not_found.
+    """
+
+    def __init__(self, chunk_size=200):
+        self.chunk_size = chunk_size
+
+    def get_prices(self, symbols):
+        symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols if s.strip()))
+        prices = PriceBatch()
+        for start in range(0, len(symbols), self.chunk_size):
+            chunk = self._download_last_close(symbols[start:start + self.chunk_size])
+            prices.update(chunk)
+            prices.not_found |= chunk.not_found
+        return prices
+
+    def _download_last_close(self, symbols):
+        import yfinance as yf
+
+        with _yfinance_errors() as messages:
+            data = yf.download(symbols, period='5d', interval='1d', group_by='ticker',
+                               auto_adjust=False, progress=False, threads=False)
+        prices = {}
+        if data is not None and not data.empty:
+            for symbol in symbols:
+                try:
+                    if data.columns.nlevels > 1:
+                        closes = data[symbol]['Close']
+                    else:
+                        closes = data['Close']
+                except KeyError:
+                    continue
+                closes = closes.dropna()
+                if not closes.empty:
+                    prices[symbol] = float(closes.iloc[-1])
+
+        not_found, failed = _split_failures(symbols, prices, messages)
+        if failed and not prices:
+            raise QuoteUnavailableError(failed)
+        if failed:
+            logger.warning("No prices for %d of %d symbols: %s", len(failed), len(symbols),
+                           QuoteUnavailableError(failed))
+        return PriceBatch(prices, not_found)
+
+    def get_history(self, symbols, start, end):
+        symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols if s.strip()))
+        history = {}
+        for offset in range(0, len(symbols), self.chunk_size):
+            history.update(self._download_history(symbols[offset:offset + self.chunk_size], start, end))
+        return history
+
+    def _download_history(self, symbols, start, end):
+        import yfinance as yf
+
+        # yfinance treats end as exclusive
+        with _yfinance_errors() as messages:
+            data = yf.download(symbols, start=start.isoformat(),
+                               end=(end + timedelta(days=1)).isoformat(),
+                               interval='1d', group_by='ticker', auto_adjust=False,
+                               progress=False, threads=False)
+        history = {}
+        if data is not None and not data.empty:
+            for symbol in symbols:
+                try:
+                    frame = data[symbol] if data.columns.nlevels > 1 else data
+                except KeyError:
+                    continue
+                frame = frame.dropna(subset=['Close'])
+                if frame.empty:
+                    continue
+                bars = {'date': frame.index.values.astype('datetime64[D]')}
+                for column in OHLC_COLUMNS:
+                    bars[column] = frame[column.capitalize()].to_numpy(dtype='float64')
+                history[symbol] = bars
+
+        _, failed = _split_failures(symbols, history, messages)
+        if failed and not history:
+            raise QuoteUnavailableError(failed)
+        return history
+
+    def _info(self, symbol):
+        """Return (yf.Ticker(symbol).info, whether Yahoo reported symbol as not found).
+
+        Raises QuoteUnavailableError if Yahoo failed rather than not knowing symbol.
+        """
+        import yfinance as yf
+
+        with _yfinance_errors() as messages:
+            info = yf.Ticker(symbol).info
+        errors = [m for m in messages if not _is_not_found(m)]
+        if errors and price_from_info(info) is None:
+            raise QuoteUnavailableError({symbol: errors[-1]})
+        return info, len(errors) < len(messages)
+
+    def get_quote(self, symbol):
+        symbol = normalize_symbol(symbol)
+        info, not_found = self._info(symbol)
+        price = price_from_info(info)
+        return {
+            'symbol': symbol,
+            'price': price,
+            'currency': info.get('currency', 'USD'),
+            'market_state': info.get('marketState', 'Unknown'),
+            'name': info.get('longName', symbol),
+            'not_found': price is None and not_found,
+        }
+
+    def get_metadata(self, symbol):
+        symbol = normalize_symbol(symbol)
+        info, _ = self._info(symbol)
+        return {
+            'symbol': symbol,
+            'name': info.get('longName') or info.get('shortName') or symbol,
+            'currency': info.get('currency'),
+            'exchange': info.get('exchange'),
+        }
+
+
+class FakeQuoteProvider(QuoteProvider):
+    """Deterministic local provider for tests and benchmarks.
+
+    Prices come from the prices mapping when given, otherwise they are derived
+    from a checksum of the symbol so that every run sees the same values.
+    latency seconds are slept once per get_prices call to simulate a network
+    round-trip. Symbols listed in missing never return a price and are
+    reported in PriceBatch.not_found. Quotes are in currency, unless the
+    currencies mapping gives one for the symbol.
+    """
+
+    def __init__(self, prices=None, latency=0.0, missing=(), currency='USD',
+                 market_state='REGULAR', currencies=None):
+        self.prices = {normalize_symbol(s): p for s, p in (prices or {}).items()}
+        self.latency = latency
+        self.missing = {normalize_symbol(s) for s in missing}
+        self.currency = currency
+        self.currencies = {normalize_symbol(s): c for s, c in (currencies or {}).items()}
+        self.market_state = market_state
+        self.calls = 0
+
+    def price_for(self, symbol):
+        if symbol in self.missing:
+            return None
+        if symbol in self.prices:
+            return self.prices[symbol]
+        return round(10 + (zlib.crc32(symbol.encode()) % 99000) / 100, 2)
+
+    def get_prices(self, symbols):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prices = PriceBatch()
+        for symbol in symbols:
+            symbol = normalize_symbol(symbol)
+            price = self.price_for(symbol)
+            if price is not None:
+                prices[symbol] = price
+            else:
+                prices.not_found.add(symbol)
+        return prices
+
+    def get_history(self, symbols, start, end):
+        import numpy as np
+
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        days = days[np.is_busday(days)]
+        history = {}
+        for symbol in symbols:
+            symbol = normalize_symbol(symbol)
+            price = self.price_for(symbol)
+            if price is None or not len(days):
+                continue
+            # A deterministic wave around the symbol's price
+            phase = days.astype('int64') + zlib.crc32(symbol.encode()) % 97
+            close = price * (1 + 0.05 * np.sin(phase / 20.0))
+            history[symbol] = {
+                'date': days,
+                'open': close * 0.995,
+                'high': close * 1.01,
+                'low': close * 0.99,
+                'close': close,
+                'volume': np.full(len(days), 1e6),
+            }
+        return history
+
+    def get_quote(self, symbol):
+        quote = super().get_quote(symbol)
+        quote['currency'] = self.currencies.get(quote['symbol'], self.currency)
+        quote['market_state'] = self.market_state
+        return quote
+
+
+class FaultyQuoteProvider(FakeQuoteProvider):
+    """FakeQuoteProvider that injects upstream failures, for exercising retry paths.
+
+    The first failures requests raise error(); after that each request
+    fails with probability failure_rate, drawn from a Random seeded with
+    seed so runs are repeatable. get_quote and get_metadata go through
+    get_prices and fail the same way. requests counts every attempt,
+    failed or not.
+    """
+
+    def __init__(self, failures=0, failure_rate=0.0, error=ConnectionError, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.failure_rate = failure_rate
+        self.error = error
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _maybe_fail(self):
+        with self._lock:
+            self.requests += 1
+            if self.failures > 0:
+                self.failures -= 1
+                fail = True
+            else:
+                fail = self.rng.random() < self.failure_rate
+        if fail:
+            raise self.error(f"Injected failure on request {self.requests}")
+
+    def get_prices(self, symbols):
+        self._maybe_fail()
+        return super().get_prices(symbols)
+
+    def get_history(self, symbols, start, end):
+        self._maybe_fail()
+        return super().get_history(symbols, start, end)
+
+
+_provider = None
+
+
+def get_provider():
+    """Return the process-wide quote provider.
+
+    The default is Yahoo Finance behind a ResilientProvider, which retries
+    transient errors and stops calling Yahoo while it keeps failing.
+    """
+    global _provider
+    if _provider is None:
+        from utils.resilience import ResilientProvider
+        _provider = ResilientProvider(YahooQuoteProvider())
+    return _provider
+
+
+def set_provider(provider):
+    """Replace the process-wide quote provider (e.g. with a FakeQuoteProvider)."""
+    global _provider
+    _provider = provider
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.quote_cache import get_quote_cache
+from utils.quote_provider import normalize_symbol
+from utils.resilience import CircuitOpenError, batch_results, failed_results
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket that limits how many requests may start per second.
+
+    A rate of None or 0 disables limiting.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request is allowed to start."""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RefreshEngine:
+    """Fetch prices for many symbols on a bounded worker pool.
+
+    Each distinct symbol is fetched once, however many lots hold it. Symbols
+    are split into batches of batch_size, and each batch is one provider
+    request made through the quote cache. At most max_concurrent requests
+    are in flight at once, and no more than requests_per_second are started
+    per second. max_age is passed to the cache; the default of 0 always
+    fetches fresh prices, but it still joins fetches that are already in
+    flight.
+    """
+
+    def __init__(self, cache=None, max_concurrent=4, requests_per_second=4.0, batch_size=50,
+                 max_age=0):
+        self.cache = cache
+        self.max_age = max_age
+        self.max_concurrent = max_concurrent
+        self.rate_limiter = RateLimiter(requests_per_second, burst=max_concurrent)
+        self.batch_size = batch_size
+
+    def refresh(self, symbols, on_result=None, cancel_event=None):
+        """Fetch prices for symbols and return a dict of symbol to PriceResult.
+
+        Every symbol in a batch that ran gets a result; its status says why
+        a price is missing (see utils.resilience). on_result(result) is
+        called for each result as its batch completes. It runs on the thread
+        that called refresh, not on a worker. Setting cancel_event skips
+        batches that have not started; their symbols get no result.
+        """
+        cache = self.cache if self.cache is not None else get_quote_cache()
+        symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols if s.strip()))
+        batches = [symbols[i:i + self.batch_size] for i in range(0, len(symbols), self.batch_size)]
+        results = {}
+        if not batches:
+            return results
+
+        def fetch(batch):
+            if cancel_event is not None and cancel_event.is_set():
+                return {}, None
+            self.rate_limiter.acquire()
+            try:
+                prices = cache.get_prices(batch, max_age=self.max_age)
+            except Exception as e:
+                return failed_results(batch, e), e
+            return batch_results(batch, prices, cache.is_missing), None
+
+        circuit_open = False
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as pool:
+            futures = [pool.submit(fetch, batch) for batch in batches]
+            for future in as_completed(futures):
+                batch_result, error = future.result()
+                if isinstance(error, CircuitOpenError):
+                    # Every remaining batch fails the same way; say so once
+                    if not circuit_open:
+                        logger.warning("Skipping price batches: %s", error)
+                        circuit_open = True
+                elif error is not None:
+                    logger.warning("Error fetching price batch: %s", error)
+                for symbol, result in batch_result.items():
+                    results[symbol] = result
+                    if on_result is not None:
+                        on_result(result)
+        return results
@@ -0,0 +1,102 @@
+import time
+
+from utils.quote_provider import normalize_symbol
+
+# Yahoo Finance marketState values during which prices move
+OPEN_MARKET_STATES = {'REGULAR'}
+EXTENDED_MARKET_STATES = {'PRE', 'PREPRE', 'POST', 'POSTPOST'}
+
+class AdaptiveRefreshPolicy:
+    """Decides which symbols an automatic refresh should poll, and when.
+
+    Each symbol is polled every base_interval seconds while the market is
+    open, every extended_interval seconds in pre/post-market, and every
+    closed_interval seconds otherwise. Symbols that moved by at least
+    hot_threshold_pct on a recent poll are "hot" for hot_window seconds and
+    are polled every hot_interval seconds instead. The policy itself holds no
+    timers; the caller sleeps for next_delay() between cycles.
+    """
+
+    def __init__(self, base_interval=60, hot_interval=15, extended_interval=300,
+                 closed_interval=1800, hot_threshold_pct=0.25, hot_window=600):
+        self.base_interval = base_interval
+        self.hot_interval = hot_interval
+        self.extended_interval = extended_interval
+        self.closed_interval = closed_interval
+        self.hot_threshold_pct = hot_threshold_pct
+        self.hot_window = hot_window
+        self.market_state = 'REGULAR'
+        self._last_polled = {}
+        self._last_price = {}
+        self._hot_until = {}
+
+    def set_market_state(self, market_state):
+        self.market_state = (market_state or 'Unknown').upper()
+
+    def interval_for(self, symbol, now=None):
+        now = time.time() if now is None else now
+        if self.market_state in OPEN_MARKET_STATES:
+            if self._hot_until.get(symbol, 0) > now:
+                return self.hot_interval
+            return self.base_interval
+        if self.market_state in EXTENDED_MARKET_STATES:
+            return self.extended_interval
+        return self.closed_interval
+
+    def due_symbols(self, symbols, now=None):
+        """Return the symbols whose polling interval has elapsed, least recently polled first."""
+        now = time.time() if now is None else now
+        due = []
+        for symbol in dict.fromkeys(normalize_symbol(s) for s in symbols):
+            last = self._last_polled.get(symbol)
+            if last is None or now - last >= self.interval_for(symbol, now):
+                due.append(symbol)
+        due.sort(key=lambda symbol: self._last_polled.get(symbol, 0))
+        return due
+
+    def next_delay(self, symbols, now=None):
+        """Seconds until the next symbol becomes due (0 if one already is)."""
+        now = time.time() if now is None else now
+        delays = []
+        for symbol in dict.fromkeys(normalize_symbol(s) for s in symbols):
+            last = self._last_polled.get(symbol)
+            if last is None:
+                return 0
+            delays.append(last + self.interval_for(symbol, now) - now)
+        return max(0, min(delays)) if delays else self.base_interval
+
+    def seed(self, prices, now=None, fetched_at=None):
+        """Record known prices (e.g. loaded at startup).
+
+        fetched_at maps symbols to the unix time their price was fetched;
+        a symbol missing from it, or mapped to None, has never been polled
+        and is due at once. Without fetched_at every price counts as just
+        polled.
+        """
+        now = time.time() if now is None else now
+        for symbol, price in prices.items():
+            symbol = normalize_symbol(symbol)
+            self._last_price.setdefault(symbol, price)
+            polled = now if fetched_at is None else fetched_at.get(symbol)
+            if polled is not None:
+                self._last_polled.setdefault(symbol, polled)
+
+    def record(self, polled, prices, now=None):
+        """Record a completed poll and return {symbol: price} for prices that changed.
+
+        polled lists every symbol that was requested, including those that
+        returned no price, so failing symbols are not retried every cycle.
+        """
+        now = time.time() if now is None else now
+        changed = {}
+        for symbol in polled:
+            self._last_polled[normalize_symbol(symbol)] = now
+        for symbol, price in prices.items():
+            previous = self._last_price.get(symbol)
+            if previous == price:
+                continue
+            changed[symbol] = price
+            self._last_price[symbol] = price
+            if previous and abs(price - previous) / previous * 100 >= self.hot_threshold_pct:
+                self._hot_until[symbol] = now + self.hot_window
+        return changed
@@ -0,0 +1,223 @@
+"""Retries, circuit breaking and typed results for quote fetches.
+
+ResilientProvider wraps any QuoteProvider. Transient errors (network
+failures, timeouts, rate limiting) are retried with jittered exponential
+backoff, and a CircuitBreaker stops calling an upstream that keeps
+failing until it has had time to recover. PriceResult is what callers get
+back instead of a bare price or None.
+"""
+import logging
+import random
+import threading
+import time
+
+from utils import instrumentation
+from utils.quote_provider import QuoteProvider
+
+logger = logging.getLogger(__name__)
+
+# PriceResult.status values
+OK = 'ok'
+NOT_FOUND = 'not_found'        # the provider answered, but has no price for the symbol
+UNAVAILABLE = 'unavailable'    # the fetch failed (network, upstream error)
+CIRCUIT_OPEN = 'circuit_open'  # not attempted: the upstream is failing
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Quote provider unavailable; retrying in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class PriceResult:
+    """Outcome of a price lookup for one symbol.
+
+    price is set only when status is OK; error describes any failure.
+    """
+    __slots__ = ('symbol', 'price', 'status', 'error')
+
+    def __init__(self, symbol, price=None, status=OK, error=None):
+        self.symbol = symbol
+        self.price = price
+        self.status = status
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+    def __eq__(self, other):
+        if not isinstance(other, PriceResult):
+            return NotImplemented
+        return (self.symbol, self.price, self.status, self.error) == \
+            (other.symbol, other.price, other.status, other.error)
+
+    def __repr__(self):
+        if self.ok:
+            return f"PriceResult({self.symbol!r}, {self.price!r})"
+        return f"PriceResult({self.symbol!r}, status={self.status!r}, error={self.error!r})"
+
+
+def failed_results(symbols, error):
+    """Return {symbol: PriceResult} for symbols whose fetch raised error."""
+    status = CIRCUIT_OPEN if isinstance(error, CircuitOpenError) else UNAVAILABLE
+    return {symbol: PriceResult(symbol, status=status, error=str(error)) for symbol in symbols}
+
+
+def batch_results(symbols, prices, is_missing):
+    """Return {symbol: PriceResult} for a batch fetch that returned prices.
+
+    Symbols without a price are NOT_FOUND when is_missing(symbol) says the
+    provider reported them as unknown, and UNAVAILABLE otherwise.
+    """
+    results = {}
+    for symbol in symbols:
+        if symbol in prices:
+            results[symbol] = PriceResult(symbol, prices[symbol])
+        elif is_missing(symbol):
+            results[symbol] = PriceResult(
+                symbol, status=NOT_FOUND,
+                error=f"No price data available for symbol '{symbol}'. Please verify the symbol is correct.")
+        else:
+            results[symbol] = PriceResult(symbol, status=UNAVAILABLE, error="No price returned")
+    return results
+
+
+def ok_prices(results):
+    """Return {symbol: price} for the successful results of {symbol: PriceResult}."""
+    return {symbol: result.price for symbol, result in results.items() if result.ok}
+
+
+def failures_by_status(results):
+    """Return {status: [symbol, ...]} for the failed results, symbols sorted."""
+    failures = {}
+    for symbol, result in results.items():
+        if not result.ok:
+            failures.setdefault(result.status, []).append(symbol)
+    return {status: sorted(symbols) for status, symbols in failures.items()}
+
+
+def is_transient(error):
+    """Return True for errors worth retrying: network failures, timeouts and throttling."""
+    if isinstance(error, (ConnectionError, TimeoutError, OSError)):
+        return True
+    name = type(error).__name__.lower()
+    return 'ratelimit' in name or 'timeout' in name or 'temporar' in name
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter.
+
+    The delay before retry n (from 0) is uniform in
+    [0, min(max_delay, base_delay * 2 ** n)], which spreads out retries
+    from many clients instead of synchronising them.
+    """
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0, rng=None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng if rng is not None else random.Random()
+
+    def delay(self, retry):
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures.
+
+    While open, allow() refuses calls for reset_timeout seconds. After that
+    one trial call is let through (half-open): success closes the circuit
+    again, failure reopens it for another reset_timeout.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until an open circuit lets a trial call through."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            # Open, or half-open with the trial call still running
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Quote provider circuit opened after %d failures", self.failures)
+                    instrumentation.inc('quote_circuit_opened_total')
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class ResilientProvider(QuoteProvider):
+    """QuoteProvider wrapper adding retries with backoff and a circuit breaker.
+
+    Every provider method goes through the same policy. Calls made while
+    the circuit is open raise CircuitOpenError without touching the
+    upstream. Non-transient errors are not retried, but still count as
+    upstream failures.
+    """
+
+    def __init__(self, provider, retry=None, breaker=None, sleep=time.sleep):
+        self.provider = provider
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.sleep = sleep
+
+    def _call(self, method, *args):
+        for attempt in range(self.retry.attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.breaker.retry_after())
+            try:
+                result = getattr(self.provider, method)(*args)
+            except Exception as e:
+                self.breaker.record_failure()
+                if not is_transient(e) or attempt + 1 >= self.retry.attempts:
+                    raise
+                delay = self.retry.delay(attempt)
+                logger.info("Retrying %s in %.2fs after %s: %s", method, delay, type(e).__name__, e)
+                instrumentation.inc('quote_retries_total', method=method)
+                self.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    def get_prices(self, symbols):
+        return self._call('get_prices', symbols)
+
+    def get_quote(self, symbol):
+        return self._call('get_quote', symbol)
+
+    def get_metadata(self, symbol):
+        return self._call('get_metadata', symbol)
+
+    def get_history(self, symbols, start, end):
+        return self._call('get_history', symbols, start, end)
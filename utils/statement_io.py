@@ -0,0 +1,238 @@
+import csv
+import logging
+import math
+import re
+from pathlib import Path
+
+from utils.db_utils import iter_stocks, save_stocks_many
+from utils.instrumentation import timed
+from utils.portfolio import Lot
+
+logger = logging.getLogger(__name__)
+
+# Header names used by common broker position exports, after lower-casing
+# and collapsing spaces and underscores
+COLUMN_ALIASES = {
+    'symbol': ('symbol', 'ticker', 'ticker symbol', 'instrument', 'security symbol'),
+    'quantity': ('quantity', 'qty', 'shares', 'units', 'quantity held'),
+    'purchase_price': ('purchase price', 'cost/share', 'cost per share', 'average cost',
+                       'avg cost', 'average price', 'avg price', 'unit cost', 'price paid'),
+    'cost_basis': ('cost basis', 'cost basis total', 'total cost', 'book value'),
+    'current_price': ('current price', 'last price', 'last', 'market price', 'price'),
+    'date_added': ('date added', 'date', 'trade date', 'date acquired', 'acquired'),
+    'currency': ('currency', 'ccy', 'price currency', 'trading currency'),
+}
+
+# Broker files often start with a few lines of account information
+MAX_PREAMBLE_LINES = 20
+
+REPORT_FIELDS = ['id', 'symbol', 'quantity', 'purchase_price', 'current_price',
+                 'total_value', 'change_pct', 'date_added', 'currency']
+
+DEFAULT_CHUNK_SIZE = 10000
+
+_SPACE_RE = re.compile(r'[\s_]+')
+
+def _header_key(name):
+    return _SPACE_RE.sub(' ', (name or '').strip().lower())
+
+def _number(text):
+    """Parse a broker-formatted number such as '$1,234.50' or '(12.00)'."""
+    text = text.strip().replace('$', '').replace(',', '')
+    if text.startswith('(') and text.endswith(')'):
+        text = '-' + text[1:-1]
+    return float(text)
+
+def _positive(value):
+    return math.isfinite(value) and value > 0
+
+def _column_map(header):
+    """Return {field: column index} for a header row, or None if it is not one."""
+    keys = [_header_key(name) for name in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in keys:
+                columns[field] = keys.index(alias)
+                break
+    if 'symbol' not in columns or 'quantity' not in columns:
+        return None
+    if 'purchase_price' not in columns and 'cost_basis' not in columns:
+        return None
+    return columns
+
+def read_statement_csv(f):
+    """Yield Lots from a broker positions export (or a plain holdings CSV).
+
+    The header row is found among the first MAX_PREAMBLE_LINES lines and its
+    columns are matched through COLUMN_ALIASES. The purchase price comes from a
+    per-share column, or from a total cost basis divided by the quantity. A
+    missing current price is set to the purchase price until the next
+    refresh, and a missing currency is looked up then. Rows without a
+    symbol, with non-numeric values (totals, footers), or with a quantity
+    or price that is not a positive number (credits, fees, cash lines) are
+    skipped. Rows are parsed one at a time, so memory use does not depend
+    on the file size.
+    """
+    sample = f.read(4096)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(f, dialect)
+
+    columns = None
+    for line_number, header in enumerate(reader):
+        columns = _column_map(header)
+        if columns is not None:
+            break
+        if line_number >= MAX_PREAMBLE_LINES:
+            break
+    if columns is None:
+        raise ValueError("No header with symbol, quantity and purchase price or cost basis columns found")
+
+    symbol_col = columns['symbol']
+    quantity_col = columns['quantity']
+    price_col = columns.get('purchase_price')
+    basis_col = columns.get('cost_basis')
+    current_col = columns.get('current_price')
+    date_col = columns.get('date_added')
+    currency_col = columns.get('currency')
+    skipped = 0
+    for row in reader:
+        try:
+            symbol = row[symbol_col].strip().upper()
+            if not symbol:
+                continue
+            quantity = _number(row[quantity_col])
+            # Fractional shares are kept as they are; whole counts stay ints
+            if quantity.is_integer():
+                quantity = int(quantity)
+            if price_col is not None and row[price_col].strip():
+                purchase_price = _number(row[price_col])
+            else:
+                purchase_price = _number(row[basis_col]) / quantity
+            current = row[current_col].strip() if current_col is not None else ''
+            current_price = _number(current) if current else purchase_price
+            # Credits, fees and cash lines show up as negative or zero amounts
+            if not all(_positive(value) for value in (quantity, purchase_price, current_price)):
+                raise ValueError("not a holding")
+            lot = Lot(symbol, quantity, purchase_price, current_price)
+        except (IndexError, ValueError, TypeError, ZeroDivisionError):
+            skipped += 1
+            continue
+        if date_col is not None and date_col < len(row) and row[date_col].strip():
+            lot.date_added = row[date_col].strip()
+        if currency_col is not None and currency_col < len(row) and row[currency_col].strip():
+            lot.currency = row[currency_col].strip()
+        yield lot
+    if skipped:
+        logger.info("Skipped %d rows that are not holdings", skipped)
+
+@timed('db_seconds')
+def import_statement(path, chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None):
+    """Stream a broker CSV into the stocks table in one transaction.
+
+    Rows go straight from the file into a single executemany, so nothing
+    is held in memory beyond the current row. chunk_size does not batch the
+    writes; it only sets how often on_progress(rows) is called. No prices
+    are fetched here; refresh the returned distinct symbols afterwards in
+    one batch.
+
+    Returns (rows imported, sorted list of distinct symbols).
+    """
+    symbols = set()
+
+    def rows(lots):
+        for count, lot in enumerate(lots, 1):
+            symbols.add(lot.symbol)
+            yield lot
+            if on_progress is not None and count % chunk_size == 0:
+                on_progress(count)
+
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        count = save_stocks_many(rows(read_statement_csv(f)))
+    return count, sorted(symbols)
+
+def report_rows():
+    """Yield one report row per lot (REPORT_FIELDS), streamed from the database."""
+    for lot in iter_stocks():
+        purchase_price = lot.purchase_price
+        change_pct = ((lot.current_price - purchase_price) / purchase_price * 100
+                      if purchase_price else 0.0)
+        yield {
+            'id': lot.id,
+            'symbol': lot.symbol,
+            'quantity': lot.quantity,
+            'purchase_price': purchase_price,
+            'current_price': lot.current_price,
+            'total_value': round(lot.quantity * lot.current_price, 2),
+            'change_pct': round(change_pct, 2),
+            'date_added': lot.date_added,
+            'currency': lot.currency,
+        }
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def write_csv(out, rows=None):
+    """Write report rows to the open text file out. Returns the row count."""
+    writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in report_rows() if rows is None else rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def write_parquet(path, rows=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write report rows to a Parquet file, one row group per chunk_size rows.
+
+    Needs the optional pyarrow package. Returns the row count.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('symbol', pa.string()),
+        ('quantity', pa.float64()),
+        ('purchase_price', pa.float64()),
+        ('current_price', pa.float64()),
+        ('total_value', pa.float64()),
+        ('change_pct', pa.float64()),
+        ('date_added', pa.string()),
+        ('currency', pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(report_rows() if rows is None else rows, chunk_size):
+            columns = {field: [row[field] for row in chunk] for field in REPORT_FIELDS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            count += len(chunk)
+    return count
+
+def export_holdings(path, format=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Export every lot to CSV or Parquet, streamed in chunks from the database.
+
+    format defaults to the file extension (.parquet or .pq for Parquet).
+    Returns the number of rows written.
+    """
+    path = Path(path)
+    if format is None:
+        format = 'parquet' if path.suffix.lower() in ('.parquet', '.pq') else 'csv'
+    if format == 'parquet':
+        return write_parquet(path, chunk_size=chunk_size)
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        return write_csv(out)
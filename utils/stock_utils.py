@@ -1,28 +1,38 @@
-import yfinance as yf
+import logging
+
+from utils.quote_cache import get_quote_cache
+from utils.quote_provider import normalize_symbol
+from utils.resilience import NOT_FOUND, PriceResult, batch_results, failed_results
+
+logger = logging.getLogger(__name__)
 
 def get_current_price(symbol):
-    """Get the current price for a stock symbol."""
+    """Get the current price for a stock symbol.
+
+    Returns a PriceResult; check result.ok before using result.price.
+    """
+    symbol = normalize_symbol(symbol)
+    if not symbol:
+        return PriceResult(symbol, status=NOT_FOUND, error="Empty stock symbol")
+    return get_current_prices([symbol])[symbol]
+
+def get_current_prices(symbols):
+    """Get current prices for many symbols in one batched request.
+
+    Symbols already in the quote cache are not fetched again.
+
+    Returns a dict mapping every requested symbol to a PriceResult. Its
+    status says why a price is missing: NOT_FOUND for symbols the provider
+    has no data for, UNAVAILABLE when the fetch failed, CIRCUIT_OPEN when
+    the provider is not being called after repeated failures.
+    """
+    symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols if s.strip()))
+    if not symbols:
+        return {}
+    cache = get_quote_cache()
     try:
-        # Validate symbol format
-        symbol = symbol.strip().upper()
-        if not symbol:
-            raise ValueError("Empty stock symbol")
-        
-        stock = yf.Ticker(symbol)
-        info = stock.info
-        
-        # Try different possible price keys
-        price = None
-        for price_key in ['currentPrice', 'regularMarketPrice', 'price', 'previousClose']:
-            if price_key in info and info[price_key] is not None:
-                price = info[price_key]
-                break
-        
-        if price is None:
-            raise ValueError(f"No price data available for symbol '{symbol}'. Please verify the symbol is correct.")
-        
-        return price
+        prices = cache.get_prices(symbols)
     except Exception as e:
-        error_msg = str(e)
-        print(f"Error fetching price for {symbol}: {error_msg}")
-        return None 
\ No newline at end of file
+        logger.warning("Error fetching prices for %d symbols: %s", len(symbols), e)
+        return failed_results(symbols, e)
+    return batch_results(symbols, prices, cache.is_missing)
@@ -0,0 +1,76 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.db_utils import get_connection_manager
+from utils.instrumentation import timed
+from utils.quote_provider import get_provider, normalize_symbol
+
+logger = logging.getLogger(__name__)
+
+# Names, currencies and exchanges rarely change, so cached entries live long
+DEFAULT_METADATA_TTL = 30 * 24 * 3600
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_CHUNK = 500
+
+@timed('db_seconds')
+def get_metadata(symbols, max_age=DEFAULT_METADATA_TTL):
+    """Return {symbol: metadata dict} for the symbols cached within max_age seconds."""
+    symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+    cutoff = time.time() - max_age
+    cursor = get_connection_manager().connection().cursor()
+    metadata = {}
+    for start in range(0, len(symbols), _QUERY_CHUNK):
+        chunk = symbols[start:start + _QUERY_CHUNK]
+        cursor.execute(f'''
+            SELECT symbol, name, currency, exchange FROM symbol_metadata
+            WHERE fetched_at >= ? AND symbol IN ({','.join('?' * len(chunk))})
+        ''', (cutoff, *chunk))
+        for symbol, name, currency, exchange in cursor:
+            metadata[symbol] = {'symbol': symbol, 'name': name,
+                                'currency': currency, 'exchange': exchange}
+    cursor.close()
+    return metadata
+
+@timed('db_seconds')
+def save_metadata(records):
+    """Upsert metadata dicts (symbol, name, currency, exchange) in one transaction."""
+    now = time.time()
+    with get_connection_manager().transaction() as cursor:
+        cursor.executemany('''
+            INSERT OR REPLACE INTO symbol_metadata (symbol, name, currency, exchange, fetched_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', ((r['symbol'], r.get('name'), r.get('currency'), r.get('exchange'), now)
+              for r in records))
+
+def fetch_metadata(symbols, max_workers=8, max_age=DEFAULT_METADATA_TTL, on_progress=None,
+                   progress_every=25, provider=None):
+    """Return metadata for symbols, fetching only those missing from the cache.
+
+    Lookups run on a pool of max_workers threads. Every successful result is
+    saved to the cache in one transaction at the end. on_progress(done,
+    total) is called after each progress_every completed lookups and once at
+    the end, not once per symbol.
+    """
+    metadata = get_metadata(symbols, max_age=max_age)
+    missing = [s for s in dict.fromkeys(normalize_symbol(s) for s in symbols) if s not in metadata]
+    if not missing:
+        return metadata
+
+    provider = provider if provider is not None else get_provider()
+    fetched = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(provider.get_metadata, symbol): symbol for symbol in missing}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                fetched.append(future.result())
+            except Exception as e:
+                logger.warning("Error fetching info for %s: %s", futures[future], e)
+            if on_progress is not None and (done % progress_every == 0 or done == len(missing)):
+                on_progress(done, len(missing))
+
+    if fetched:
+        save_metadata(fetched)
+    metadata.update((r['symbol'], r) for r in fetched)
+    return metadata
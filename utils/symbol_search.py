@@ -0,0 +1,94 @@
+from bisect import bisect_left
+import re
+
+# Queries at least this long are matched as substrings through the n-gram
+# index; shorter ones only match symbol and name-word prefixes.
+NGRAM = 3
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def _prefix_range(sorted_keys, prefix):
+    start = bisect_left(sorted_keys, prefix)
+    end = bisect_left(sorted_keys, prefix + '\uffff')
+    return start, end
+
+class SymbolSearchIndex:
+    """Prebuilt, ranked search over (symbol, name) pairs.
+
+    Three indexes are built once: a sorted symbol list for prefix lookups, a
+    sorted list of company-name words, and a trigram index over symbols and
+    names for substring matches. Results are ranked: exact symbol first, then
+    symbol prefix, then name-word prefix, then any other substring. When a
+    query extends the previous one, the previous matches are narrowed instead
+    of searching the indexes again.
+    """
+
+    def __init__(self, stocks):
+        self.stocks = list(stocks)
+        self._symbols = [symbol.lower() for symbol, _ in self.stocks]
+        self._names = [name.lower() for _, name in self.stocks]
+        self._tokens = [tuple(_TOKEN_RE.findall(name)) for name in self._names]
+
+        self._symbol_keys = sorted((s, i) for i, s in enumerate(self._symbols))
+        self._sorted_symbols = [s for s, _ in self._symbol_keys]
+
+        self._token_keys = sorted({(token, i) for i, tokens in enumerate(self._tokens)
+                                   for token in tokens})
+        self._sorted_tokens = [t for t, _ in self._token_keys]
+
+        self._ngrams = {}
+        for i in range(len(self.stocks)):
+            for text in (self._symbols[i], self._names[i]):
+                for j in range(len(text) - NGRAM + 1):
+                    self._ngrams.setdefault(text[j:j + NGRAM], set()).add(i)
+
+        self._last_query = None
+        self._last_matches = None
+
+    def __len__(self):
+        return len(self.stocks)
+
+    def _symbol_prefix(self, query):
+        start, end = _prefix_range(self._sorted_symbols, query)
+        return {i for _, i in self._symbol_keys[start:end]}
+
+    def _token_prefix(self, query):
+        start, end = _prefix_range(self._sorted_tokens, query)
+        return {i for _, i in self._token_keys[start:end]}
+
+    def _substring(self, query):
+        grams = [query[j:j + NGRAM] for j in range(len(query) - NGRAM + 1)]
+        candidates = min((self._ngrams.get(g, set()) for g in grams), key=len)
+        return {i for i in candidates
+                if query in self._symbols[i] or query in self._names[i]}
+
+    def _matches(self, query):
+        last = self._last_query
+        if (last is not None and len(last) >= NGRAM and query.startswith(last)):
+            # Every match of the longer query also matched the shorter one
+            return {i for i in self._last_matches
+                    if query in self._symbols[i] or query in self._names[i]}
+        if len(query) >= NGRAM:
+            return self._substring(query)
+        return self._symbol_prefix(query) | self._token_prefix(query)
+
+    def _rank(self, i, query):
+        symbol = self._symbols[i]
+        if symbol == query:
+            return 0
+        if symbol.startswith(query):
+            return 1
+        if any(token.startswith(query) for token in self._tokens[i]):
+            return 2
+        return 3
+
+    def search(self, query, limit=None):
+        """Return ranked indices into stocks matching query (case-insensitive)."""
+        query = query.strip().lower()
+        if not query:
+            self._last_query = self._last_matches = None
+            return list(range(len(self.stocks)))
+        matches = self._matches(query)
+        self._last_query, self._last_matches = query, matches
+        ranked = sorted(matches, key=lambda i: (self._rank(i, query), self._symbols[i]))
+        return ranked if limit is None else ranked[:limit]
@@ -0,0 +1,114 @@
+import csv
+import time
+
+from utils.db_utils import get_connection_manager
+from utils.instrumentation import timed
+
+SP500_UNIVERSE = 'sp500'
+SP500_URL = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+
+# Cached universes older than this are refreshed in the background
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+# Header names used for the company name column by common listing files
+NAME_COLUMNS = ('Security', 'Name', 'Company Name', 'Security Name', 'Description')
+
+@timed('db_seconds')
+def load_universe(universe=None):
+    """Return [(symbol, name), ...] sorted by symbol from the local cache.
+
+    With universe=None, all cached universes are merged, one entry per symbol.
+    """
+    cursor = get_connection_manager().connection().cursor()
+    if universe is None:
+        cursor.execute('''
+            SELECT symbol, MIN(name) FROM universe_symbols
+            GROUP BY symbol ORDER BY symbol
+        ''')
+    else:
+        cursor.execute('''
+            SELECT symbol, name FROM universe_symbols
+            WHERE universe = ? ORDER BY symbol
+        ''', (universe,))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+@timed('db_seconds')
+def save_universe(universe, stocks, source=None):
+    """Replace the cached symbols of universe with stocks and stamp it as fresh.
+
+    stocks is any iterable of (symbol, name) pairs. Returns the number saved.
+    """
+    with get_connection_manager().transaction() as cursor:
+        cursor.execute('DELETE FROM universe_symbols WHERE universe = ?', (universe,))
+        cursor.executemany(
+            'INSERT OR REPLACE INTO universe_symbols (universe, symbol, name) VALUES (?, ?, ?)',
+            ((universe, symbol.strip().upper(), (name or symbol).strip()) for symbol, name in stocks)
+        )
+        count = cursor.rowcount
+        cursor.execute(
+            'INSERT OR REPLACE INTO universes (name, source, refreshed_at) VALUES (?, ?, ?)',
+            (universe, source, time.time())
+        )
+    return count
+
+def list_universes():
+    """Return [(name, source, refreshed_at, symbol_count), ...]."""
+    cursor = get_connection_manager().connection().cursor()
+    cursor.execute('''
+        SELECT u.name, u.source, u.refreshed_at, COUNT(s.symbol)
+        FROM universes u LEFT JOIN universe_symbols s ON s.universe = u.name
+        GROUP BY u.name ORDER BY u.name
+    ''')
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+def universe_age(universe):
+    """Return seconds since universe was refreshed, or None if it is not cached."""
+    cursor = get_connection_manager().connection().cursor()
+    cursor.execute('SELECT refreshed_at FROM universes WHERE name = ?', (universe,))
+    row = cursor.fetchone()
+    cursor.close()
+    return None if row is None else time.time() - row[0]
+
+def is_stale(universe, max_age=DEFAULT_MAX_AGE):
+    """True if universe has never been cached or is older than max_age seconds."""
+    age = universe_age(universe)
+    return age is None or age > max_age
+
+def download_sp500():
+    """Download the S&P 500 constituents from Wikipedia as [(symbol, name), ...]."""
+    import pandas as pd
+
+    tables = pd.read_html(SP500_URL)
+    df = tables[0]
+
+    # Clean up symbols and get the list
+    df['Symbol'] = df['Symbol'].str.replace('.', '-')
+    return [(symbol.strip(), security.strip())
+            for symbol, security in zip(df['Symbol'], df['Security'])]
+
+def import_universe_csv(universe, path, symbol_column='Symbol', name_column=None):
+    """Import a listing file (CSV, or pipe/tab separated) as a named universe.
+
+    Rows are streamed straight into the database, so exchange-wide listings
+    with many thousands of symbols are fine. The name column is detected
+    from NAME_COLUMNS unless given. Returns the number of symbols imported.
+    Raises ValueError if the file has no symbol_column.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        try:
+            dialect = csv.Sniffer().sniff(f.readline(), delimiters=',|\t;')
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        reader = csv.DictReader(f, dialect=dialect)
+        if symbol_column not in (reader.fieldnames or ()):
+            raise ValueError(f"No '{symbol_column}' column in {path}")
+        if name_column is None:
+            name_column = next((c for c in NAME_COLUMNS if c in (reader.fieldnames or ())), symbol_column)
+        stocks = ((row[symbol_column], row.get(name_column) or row[symbol_column])
+                  for row in reader if row.get(symbol_column, '').strip())
+        return save_universe(universe, stocks, source=str(path))